@@ -5,7 +5,9 @@ Môn: Lập trình Mạng - Elearning-3
 """
 
 import asyncio
+import os
 import random
+import sys
 import time
 from datetime import datetime
 from dataclasses import dataclass
@@ -13,6 +15,15 @@ from enum import Enum
 from typing import List, Dict
 import itertools
 
+try:
+    from latency_histogram import LatencyHistogram
+except ImportError:
+    # latency_histogram.py chỉ có một bản, ở python/ của repo cha;
+    # có thể chỉ đường bằng PYTHONPATH=../python, nếu không thì tự thêm thư mục đó
+    REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.append(os.path.join(REPO_ROOT, 'python'))
+    from latency_histogram import LatencyHistogram
+
 class OrderStatus(Enum):
     PLACED = "Đã đặt hàng"
     BREWING = "Đang pha chế"
@@ -346,22 +357,22 @@ class AsyncCoffeeShop:
         
         if total_orders > 0:
             success_rate = (served_orders / total_orders) * 100
-            serve_times = []
+            serve_times = LatencyHistogram(unit='ms')
             coffee_stats = {}
             
             for order in self.completed_orders:
                 if order.completed_at and order.status == OrderStatus.SERVED:
                     serve_time = (order.completed_at - order.placed_at).total_seconds()
-                    serve_times.append(serve_time)
+                    serve_times.record(serve_time * 1000)
                     coffee_stats[order.coffee_type] = coffee_stats.get(order.coffee_type, 0) + 1
             
-            avg_serve_time = sum(serve_times) / len(serve_times) if serve_times else 0
-            
             print(f"TỔNG SỐ ĐƠN HÀNG: {total_orders}")
             print(f"ĐƠN THÀNH CÔNG: {served_orders}")
             print(f"ĐƠN THẤT BẠI: {failed_orders}")
             print(f"TỶ LỆ THÀNH CÔNG: {success_rate:.1f}%")
-            print(f"Thời gian phục vụ trung bình: {avg_serve_time:.1f}s")
+            print("Thời gian phục vụ:")
+            for line in serve_times.format_report(scale=1000, unit='s'):
+                print(line)
             
             print("\nTOP ĐỒ UỐNG PHỔ BIẾN:")
             popular_drinks = sorted(coffee_stats.items(), key=lambda x: x[1], reverse=True)[:3]
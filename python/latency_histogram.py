@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact log-bucketed latency histogram (HDR-style).
+
+Values are recorded as non-negative integers in whatever unit the caller
+picks (the TCP tools use microseconds). Buckets are log-linear: each power
+of two is split into 64 linear sub-buckets, so any recorded value is known
+to within ~1.6% while the whole histogram is a fixed array of counters,
+no matter how many samples are recorded.
+
+Histograms with the same layout can be merged, which is how per-connection
+and per-process results are combined, and can be exported to JSON or CSV.
+"""
+
+import csv
+import json
+from array import array
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS        # 128 exact values below 128
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT // 2         # 64 sub-buckets per power of two
+DEFAULT_HIGHEST_VALUE = 3_600_000_000           # 1 hour in microseconds
+
+REPORT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+def bucket_index(value):
+    """Index of the bucket holding `value`"""
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value >> shift) - SUB_BUCKET_HALF)
+
+def bucket_bounds(index):
+    """Inclusive (lowest, highest) values mapped to bucket `index`"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    sub = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return sub << shift, ((sub + 1) << shift) - 1
+
+class LatencyHistogram:
+    def __init__(self, highest_value=DEFAULT_HIGHEST_VALUE, unit="us"):
+        self.highest_value = int(highest_value)
+        self.unit = unit
+        self.counts = array('Q', bytes(8 * (bucket_index(self.highest_value) + 1)))
+        self.total_count = 0
+        self.total_sum = 0
+        self.min_value = None
+        self.max_value = None
+
+    def __len__(self):
+        return self.total_count
+
+    def record(self, value, count=1):
+        """Record `value` (rounded to an integer, clamped to highest_value)"""
+        value = min(max(int(round(value)), 0), self.highest_value)
+        self.counts[bucket_index(value)] += count
+        self.total_count += count
+        self.total_sum += value * count
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+
+    def merge(self, other):
+        """Add all samples of another histogram with the same layout"""
+        if len(other.counts) != len(self.counts) or other.unit != self.unit:
+            raise ValueError("Cannot merge histograms with different layouts")
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total_count += other.total_count
+        self.total_sum += other.total_sum
+        if other.min_value is not None:
+            if self.min_value is None or other.min_value < self.min_value:
+                self.min_value = other.min_value
+            if self.max_value is None or other.max_value > self.max_value:
+                self.max_value = other.max_value
+        return self
+
+    def mean(self):
+        return self.total_sum / self.total_count if self.total_count else 0.0
+
+    def percentile(self, pct):
+        """Value at or below which `pct` percent of the samples fall"""
+        if not self.total_count:
+            return 0
+        target = max(1, -(-self.total_count * pct // 100))  # ceil
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                highest = bucket_bounds(index)[1]
+                return max(self.min_value, min(highest, self.max_value))
+        return self.max_value
+
+    def summary(self):
+        """Count, mean, min, report percentiles and max as a dict"""
+        result = {
+            'unit': self.unit,
+            'count': self.total_count,
+            'mean': self.mean(),
+            'min': self.min_value or 0,
+        }
+        for pct in REPORT_PERCENTILES:
+            result[f"p{pct:g}"] = self.percentile(pct)
+        result['max'] = self.max_value or 0
+        return result
+
+    def to_dict(self):
+        """Serializable form; buckets are stored sparsely as [index, count]"""
+        return {
+            'highest_value': self.highest_value,
+            'unit': self.unit,
+            'summary': self.summary(),
+            'buckets': [[index, count] for index, count in enumerate(self.counts) if count],
+            'sum': self.total_sum,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(highest_value=data['highest_value'], unit=data['unit'])
+        for index, count in data['buckets']:
+            histogram.counts[index] = count
+        summary = data['summary']
+        histogram.total_count = summary['count']
+        histogram.total_sum = data['sum']
+        if histogram.total_count:
+            histogram.min_value = summary['min']
+            histogram.max_value = summary['max']
+        return histogram
+
+    def to_json(self, path=None):
+        """Return the histogram as JSON, also writing it to `path` if given"""
+        text = json.dumps(self.to_dict(), indent=2)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        return text
+
+    def to_csv(self, path):
+        """Write one row per non-empty bucket with its cumulative percentile"""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([f"low_{self.unit}", f"high_{self.unit}", "count", "cumulative_pct"])
+            running = 0
+            for index, count in enumerate(self.counts):
+                if not count:
+                    continue
+                running += count
+                low, high = bucket_bounds(index)
+                writer.writerow([low, high, count, f"{running * 100 / self.total_count:.4f}"])
+
+    def format_report(self, scale=1.0, unit=None):
+        """Human readable lines; `scale` converts recorded units for display"""
+        unit = unit or self.unit
+        summary = self.summary()
+        lines = [f"  {'Average:':<17}{summary['mean'] / scale:.3f} {unit}",
+                 f"  {'Min:':<17}{summary['min'] / scale:.3f} {unit}"]
+        for pct in REPORT_PERCENTILES:
+            label = f"p{pct:g}:"
+            lines.append(f"  {label:<17}{summary[f'p{pct:g}'] / scale:.3f} {unit}")
+        lines.append(f"  {'Max:':<17}{summary['max'] / scale:.3f} {unit}")
+        return lines
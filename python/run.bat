@@ -15,8 +15,9 @@ if %ERRORLEVEL% neq 0 (
 echo Python is installed.
 echo.
 echo Usage:
-echo   Server: python tcp_server.py
-echo   Client: python tcp_client.py
+echo   Server: python tcp_server.py [--mode thread^|selector^|asyncio] [--workers N] [--framed]
+echo   Client: python tcp_client.py [--messages N] [--framed] [--window 1,4,16,64]
+echo   Load:   python tcp_load.py --connections 200 [--rate QPS] [--duration S] [--processes N]
 echo.
 echo Ready to run!
 echo.
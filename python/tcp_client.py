@@ -1,19 +1,63 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import csv
+import json
 import socket
 import time
 import sys
-import statistics
+import threading
+
+from latency_histogram import LatencyHistogram
+from tcp_framing import FrameDecoder, encode_frame
 
 SERVER_IP = "127.0.0.1"
 SERVER_PORT = 8888
 BUFFER_SIZE = 8192
 NUM_MESSAGES = 1000
+DEFAULT_WINDOWS = (1, 4, 16, 64)
+
+def export_histogram(histogram, json_path=None, csv_path=None):
+    """Write a latency histogram to the requested JSON/CSV files"""
+    if json_path:
+        histogram.to_json(json_path)
+        print(f"[INFO] Latency histogram written to {json_path}")
+    if csv_path:
+        histogram.to_csv(csv_path)
+        print(f"[INFO] Latency histogram written to {csv_path}")
+
+SWEEP_COLUMNS = ('window', 'messages', 'duration_s', 'msgs_per_sec', 'throughput_mbps',
+                 'p50_us', 'p90_us', 'p99_us', 'p99.9_us', 'max_us')
+
+def export_sweep(results, json_path=None, csv_path=None):
+    """Write one row per window of a pipeline sweep to the requested JSON/CSV files"""
+    if json_path:
+        rows = [{**{column: r[column] for column in SWEEP_COLUMNS},
+                 'histogram': r['histogram'].to_dict()} for r in results]
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        print(f"[INFO] Window sweep written to {json_path}")
+    if csv_path:
+        with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(SWEEP_COLUMNS)
+            for r in results:
+                writer.writerow([r[column] for column in SWEEP_COLUMNS])
+        print(f"[INFO] Window sweep written to {csv_path}")
 
 class TcpClient:
-    def __init__(self):
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, num_messages=NUM_MESSAGES, framed=False):
         self.client_socket = None
+        self.host = host
+        self.port = port
+        self.num_messages = num_messages
+        self.framed = framed
+        self.decoder = FrameDecoder() if framed else None
+        self.histogram = LatencyHistogram(unit="us")
+        # Message ids keep increasing across pipelined runs on the same connection,
+        # so a late reply from an earlier run can never match a request of this one
+        self.next_msg_id = 1
 
     def setup_socket(self, sock):
         """Apply TCP optimizations to the socket"""
@@ -43,14 +87,29 @@ class TcpClient:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.setup_socket(self.client_socket)
             
-            print(f"Connecting to {SERVER_IP}:{SERVER_PORT}...")
-            self.client_socket.connect((SERVER_IP, SERVER_PORT))
+            print(f"Connecting to {self.host}:{self.port}...")
+            self.client_socket.connect((self.host, self.port))
             print("[CONNECTED] Successfully connected to server\n")
             
         except Exception as e:
             print(f"[ERROR] Connection failed: {e}")
             sys.exit(1)
 
+    def receive_reply(self, msg_id=None):
+        """Receive one reply; in framed mode, read until the frame echoing `msg_id` arrives"""
+        if not self.framed:
+            return self.client_socket.recv(BUFFER_SIZE)
+        
+        while True:
+            data = self.client_socket.recv(BUFFER_SIZE)
+            if not data:
+                return b""
+            for frame in self.decoder.feed(data):
+                # Stop-and-wait: only the current request is outstanding, anything
+                # else is a late reply from an earlier run on this connection
+                if frame.msg_id == msg_id:
+                    return frame.payload
+
     def run_benchmark(self):
         """Run benchmark test"""
         if not self.client_socket:
@@ -59,15 +118,21 @@ class TcpClient:
         print("=" * 40)
         print("TCP Client Benchmark (Python)")
         print("=" * 40)
-        print(f"Sending {NUM_MESSAGES} messages...\n")
+        print(f"Framing: {'length-prefixed' if self.framed else 'none (raw stream)'}")
+        print(f"Sending {self.num_messages} messages...\n")
         
-        latencies = []
+        latencies = LatencyHistogram(unit="us")
         benchmark_start = time.time()
         total_bytes = 0
         
-        for i in range(1, NUM_MESSAGES + 1):
+        for i in range(1, self.num_messages + 1):
             message = f"Message #{i} from Python client"
             message_bytes = message.encode('utf-8')
+            msg_id = None
+            if self.framed:
+                msg_id = self.next_msg_id & 0xFFFFFFFF
+                self.next_msg_id += 1
+                message_bytes = encode_frame(message_bytes, msg_id)
             
             # Measure round-trip time
             send_time = time.perf_counter()
@@ -77,7 +142,7 @@ class TcpClient:
                 self.client_socket.sendall(message_bytes)
                 
                 # Receive response
-                response = self.client_socket.recv(BUFFER_SIZE)
+                response = self.receive_reply(msg_id)
                 
                 receive_time = time.perf_counter()
                 
@@ -89,11 +154,11 @@ class TcpClient:
                 
                 # Calculate latency in microseconds
                 latency_us = (receive_time - send_time) * 1_000_000
-                latencies.append(latency_us)
+                latencies.record(latency_us)
                 
                 # Print progress every 100 messages
                 if i % 100 == 0:
-                    print(f"[PROGRESS] Sent/Received {i}/{NUM_MESSAGES} messages")
+                    print(f"[PROGRESS] Sent/Received {i}/{self.num_messages} messages")
                     
             except socket.timeout:
                 print(f"[ERROR] Timeout at message {i}")
@@ -106,10 +171,8 @@ class TcpClient:
         total_duration_ms = (benchmark_end - benchmark_start) * 1000
         
         # Calculate statistics
+        self.histogram = latencies
         if latencies:
-            avg_latency = statistics.mean(latencies)
-            min_latency = min(latencies)
-            max_latency = max(latencies)
             throughput_mbps = (total_bytes / 1024 / 1024) / ((benchmark_end - benchmark_start))
             
             print("\n" + "=" * 40)
@@ -120,30 +183,185 @@ class TcpClient:
             print(f"Total Data:        {total_bytes / 1024:.2f} KB")
             print("-" * 40)
             print("Latency (RTT):")
-            print(f"  Average:         {avg_latency / 1000:.3f} ms")
-            print(f"  Min:             {min_latency / 1000:.3f} ms")
-            print(f"  Max:             {max_latency / 1000:.3f} ms")
+            for line in latencies.format_report(scale=1000, unit="ms"):
+                print(line)
             print("-" * 40)
             print(f"Throughput:        {throughput_mbps:.2f} MB/s")
             print(f"Messages/sec:      {len(latencies) * 1000 / total_duration_ms:.2f}")
             print("=" * 40)
 
+    def run_pipelined_benchmark(self, window):
+        """Run a pipelined benchmark with up to `window` requests in flight
+
+        A sender thread keeps the window full while the calling thread reads
+        replies, matching each one to its request by message id. Requires
+        the framed protocol. A run that ends early (timeout, server gone)
+        leaves replies in flight, so the connection is closed afterwards.
+        """
+        if not self.client_socket:
+            raise RuntimeError("Not connected to server")
+        if not self.framed:
+            raise RuntimeError("Pipelined mode requires the framed protocol")
+        
+        print(f"\n[PIPELINE] window={window}, messages={self.num_messages}")
+        
+        slots = threading.Semaphore(window)
+        # Set when the reader gives up, so a sender blocked on `slots` exits
+        stop = threading.Event()
+        in_flight = {}
+        in_flight_lock = threading.Lock()
+        sender_error = []
+        latencies = LatencyHistogram(unit="us")
+        # Each counter is written by one thread only: bytes_sent[0] by the sender,
+        # bytes_received by this thread; they are summed after the sender is joined
+        bytes_sent = [0]
+        bytes_received = 0
+        first_id = self.next_msg_id
+        self.next_msg_id += self.num_messages
+        
+        def sender():
+            try:
+                for i in range(1, self.num_messages + 1):
+                    slots.acquire()
+                    if stop.is_set():
+                        return
+                    msg_id = (first_id + i - 1) & 0xFFFFFFFF
+                    payload = f"Message #{i} from Python client".encode('utf-8')
+                    frame = encode_frame(payload, msg_id)
+                    with in_flight_lock:
+                        in_flight[msg_id] = time.perf_counter_ns()
+                    self.client_socket.sendall(frame)
+                    bytes_sent[0] += len(frame)
+            except Exception as e:
+                sender_error.append(e)
+        
+        benchmark_start = time.perf_counter()
+        sender_thread = threading.Thread(target=sender, daemon=True)
+        sender_thread.start()
+        
+        received = 0
+        try:
+            while received < self.num_messages and not sender_error:
+                data = self.client_socket.recv(BUFFER_SIZE)
+                if not data:
+                    print("[ERROR] Server closed connection")
+                    break
+                bytes_received += len(data)
+                now = time.perf_counter_ns()
+                
+                for frame in self.decoder.feed(data):
+                    with in_flight_lock:
+                        sent_at = in_flight.pop(frame.msg_id, None)
+                    if sent_at is None:
+                        print(f"[WARNING] Unexpected reply id {frame.msg_id}")
+                        continue
+                    latencies.record((now - sent_at) / 1000)
+                    received += 1
+                    slots.release()
+        except socket.timeout:
+            print(f"[ERROR] Timeout with {len(in_flight)} requests in flight")
+        finally:
+            stop.set()
+            slots.release()
+            sender_thread.join()
+        
+        duration = time.perf_counter() - benchmark_start
+        if sender_error:
+            print(f"[ERROR] Sender failed: {sender_error[0]}")
+        if received < self.num_messages:
+            self.disconnect()
+        
+        total_bytes = bytes_sent[0] + bytes_received
+        self.histogram = latencies
+        summary = latencies.summary()
+        result = {
+            'window': window,
+            'messages': len(latencies),
+            'duration_s': duration,
+            'msgs_per_sec': len(latencies) / duration if duration > 0 else 0,
+            'throughput_mbps': (total_bytes / 1024 / 1024) / duration if duration > 0 else 0,
+            'p50_us': summary['p50'],
+            'p90_us': summary['p90'],
+            'p99_us': summary['p99'],
+            'p99.9_us': summary['p99.9'],
+            'max_us': summary['max'],
+            'histogram': latencies,
+        }
+        print(f"[PIPELINE] {result['msgs_per_sec']:.0f} msg/sec, "
+              f"p50 {result['p50_us'] / 1000:.3f} ms, p99 {result['p99_us'] / 1000:.3f} ms")
+        return result
+
+    def run_window_sweep(self, windows):
+        """Run the pipelined benchmark for each window size and print a table"""
+        results = []
+        for window in windows:
+            if not self.client_socket:
+                # The previous run failed and dropped its connection
+                self.connect()
+            results.append(self.run_pipelined_benchmark(window))
+        
+        print("\n" + "=" * 72)
+        print("PIPELINE WINDOW SWEEP")
+        print("=" * 72)
+        print(f"{'Window':>7} {'Msgs/sec':>10} {'MB/s':>7} {'p50 ms':>8} {'p90 ms':>8} "
+              f"{'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8}")
+        print("-" * 72)
+        for r in results:
+            print(f"{r['window']:>7} {r['msgs_per_sec']:>10.0f} {r['throughput_mbps']:>7.2f} "
+                  f"{r['p50_us'] / 1000:>8.3f} {r['p90_us'] / 1000:>8.3f} "
+                  f"{r['p99_us'] / 1000:>8.3f} {r['p99.9_us'] / 1000:>9.3f} {r['max_us'] / 1000:>8.3f}")
+        print("=" * 72)
+        
+        # Saturation point: the smallest window reaching 95% of peak rate
+        peak = max(r['msgs_per_sec'] for r in results)
+        if peak > 0:
+            saturation = next(r for r in results if r['msgs_per_sec'] >= 0.95 * peak)
+            print(f"Saturation reached at window={saturation['window']} "
+                  f"(~{saturation['msgs_per_sec']:.0f} msg/sec)")
+        return results
+
     def disconnect(self):
         """Disconnect from the server"""
         if self.client_socket:
             self.client_socket.close()
             self.client_socket = None
+            if self.decoder:
+                self.decoder = FrameDecoder()
             print("\n[DISCONNECTED] Connection closed")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCP Optimized Benchmark Client")
+    parser.add_argument("--host", default=SERVER_IP, help="Server address")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Server port")
+    parser.add_argument("--messages", type=int, default=NUM_MESSAGES,
+                        help="Number of messages to send")
+    parser.add_argument("--framed", action="store_true",
+                        help="Use the length-prefixed frame protocol (tcp_framing.py)")
+    parser.add_argument("--window", nargs="?", const=",".join(map(str, DEFAULT_WINDOWS)),
+                        help="Pipelined mode: comma-separated in-flight window sizes to sweep "
+                             f"(default {','.join(map(str, DEFAULT_WINDOWS))}); implies --framed")
+    parser.add_argument("--json", help="Export the latency histogram (one row per window "
+                                       "in pipelined mode) to this JSON file")
+    parser.add_argument("--csv", help="Export the latency histogram (one row per window "
+                                      "in pipelined mode) to this CSV file")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        client = TcpClient()
+        client = TcpClient(host=args.host, port=args.port, num_messages=args.messages,
+                           framed=args.framed or args.window is not None)
         client.connect()
         
         # Wait to ensure stable connection
         time.sleep(0.5)
         
-        client.run_benchmark()
+        if args.window is not None:
+            results = client.run_window_sweep([int(w) for w in args.window.split(",")])
+            export_sweep(results, args.json, args.csv)
+        else:
+            client.run_benchmark()
+            export_histogram(client.histogram, args.json, args.csv)
         
         # Wait before disconnecting
         time.sleep(1)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Length-prefixed framing for the TCP echo protocol.
+
+Every frame starts with a fixed 16-byte big-endian header:
+
+    +----------------+----------------+--------------------------------+
+    | length (u32)   | message id(u32)| timestamp (u64, ns)            |
+    +----------------+----------------+--------------------------------+
+
+followed by `length` bytes of payload. The server echoes the message id and
+timestamp back unchanged, so a client can match replies to requests and
+compute latency even when many requests are in flight.
+"""
+
+import struct
+import time
+from collections import namedtuple
+
+HEADER = struct.Struct("!IIQ")
+HEADER_SIZE = HEADER.size
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # 16 MB
+
+Frame = namedtuple("Frame", ["msg_id", "timestamp", "payload"])
+
+def encode_frame(payload, msg_id, timestamp=None):
+    """Build one frame; timestamp defaults to the current perf_counter_ns()"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Payload of {len(payload)} bytes exceeds MAX_FRAME_SIZE")
+    if timestamp is None:
+        timestamp = time.perf_counter_ns()
+    return HEADER.pack(len(payload), msg_id & 0xFFFFFFFF, timestamp) + payload
+
+class FrameDecoder:
+    """Incremental decoder: feed arbitrary stream chunks, get whole frames"""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        """Append received bytes and return every frame completed by them"""
+        self.buffer += data
+        frames = []
+        offset = 0
+        available = len(self.buffer)
+
+        while available - offset >= HEADER_SIZE:
+            length, msg_id, timestamp = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+
+            end = offset + HEADER_SIZE + length
+            if end > available:
+                break
+
+            frames.append(Frame(msg_id, timestamp, bytes(self.buffer[offset + HEADER_SIZE:end])))
+            offset = end
+
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete frame"""
+        return len(self.buffer)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Multi-connection load generator for the framed TCP echo server.
+
+Drives N concurrent connections from asyncio, optionally spread over
+several processes to use more than one core. Two load models:
+
+  - closed-loop (default): every connection keeps one request in flight
+  - open-loop (--rate QPS): requests are sent on a fixed schedule whatever
+    the server does; latency is measured from the scheduled send time so a
+    stalled server cannot hide its queueing delay (coordinated omission)
+
+Start the server with --framed, e.g.:
+    python tcp_server.py --mode selector --framed
+    python tcp_load.py --connections 200 --rate 20000 --duration 10
+"""
+
+import argparse
+import asyncio
+import socket
+import sys
+import time
+from multiprocessing import Pool
+
+from latency_histogram import LatencyHistogram
+from tcp_client import SERVER_IP, SERVER_PORT, BUFFER_SIZE, export_histogram
+from tcp_framing import FrameDecoder, encode_frame
+
+DEFAULT_CONNECTIONS = 50
+DEFAULT_MESSAGE_SIZE = 64
+DEFAULT_DURATION = 10.0
+DEFAULT_WARMUP = 2.0
+DRAIN_TIMEOUT = 2.0
+
+class LoadGenerator:
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, connections=DEFAULT_CONNECTIONS,
+                 message_size=DEFAULT_MESSAGE_SIZE, rate=0.0, duration=DEFAULT_DURATION,
+                 warmup=DEFAULT_WARMUP, processes=1):
+        self.host = host
+        self.port = port
+        self.connections = connections
+        self.message_size = message_size
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.processes = max(1, min(processes, connections))
+
+    def new_stats(self):
+        return {
+            'connections': 0,
+            'errors': 0,
+            'sent': 0,
+            'received': 0,
+            'bytes': 0,
+            'latency': LatencyHistogram(unit="us"),
+        }
+
+    async def run_connection(self, rate, measure_from, stop_at, stats):
+        """Drive one connection until stop_at (perf_counter_ns deadline)"""
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            print(f"[ERROR] Connection failed: {e}")
+            stats['errors'] += 1
+            return
+
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stats['connections'] += 1
+
+        payload = b"x" * self.message_size
+        decoder = FrameDecoder()
+        latency = LatencyHistogram(unit="us")
+        outstanding = 0
+        all_sent = asyncio.Event()
+
+        def record(frames):
+            nonlocal outstanding
+            now = time.perf_counter_ns()
+            for frame in frames:
+                outstanding -= 1
+                stats['received'] += 1
+                # The server echoes the timestamp we stamped on the request
+                if frame.timestamp >= measure_from:
+                    latency.record((now - frame.timestamp) / 1000)
+
+        async def open_loop_sender():
+            nonlocal outstanding
+            interval = int(1e9 / rate)
+            next_send = time.perf_counter_ns()
+            msg_id = 0
+            try:
+                while next_send < stop_at:
+                    delay = (next_send - time.perf_counter_ns()) / 1e9
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    msg_id += 1
+                    frame = encode_frame(payload, msg_id, next_send)
+                    writer.write(frame)
+                    outstanding += 1
+                    stats['sent'] += 1
+                    stats['bytes'] += len(frame)
+                    await writer.drain()
+                    next_send += interval
+            finally:
+                # Also when drain() raised, so the reader never waits for requests that will not come
+                all_sent.set()
+
+        sender = None
+        try:
+            if rate > 0:
+                sender = asyncio.create_task(open_loop_sender())
+                drain_deadline = None
+                while not (all_sent.is_set() and outstanding <= 0):
+                    if sender.done():
+                        # Re-raises the sender's exception, if any
+                        sender.result()
+                    try:
+                        data = await asyncio.wait_for(reader.read(BUFFER_SIZE), 0.1)
+                    except asyncio.TimeoutError:
+                        if not all_sent.is_set():
+                            continue
+                        drain_deadline = drain_deadline or time.monotonic() + DRAIN_TIMEOUT
+                        if time.monotonic() < drain_deadline:
+                            continue
+                        raise
+                    if not data:
+                        break
+                    stats['bytes'] += len(data)
+                    record(decoder.feed(data))
+                await sender
+            else:
+                msg_id = 0
+                while time.perf_counter_ns() < stop_at:
+                    msg_id += 1
+                    frame = encode_frame(payload, msg_id)
+                    writer.write(frame)
+                    outstanding += 1
+                    stats['sent'] += 1
+                    stats['bytes'] += len(frame)
+
+                    while outstanding > 0:
+                        data = await asyncio.wait_for(reader.read(BUFFER_SIZE), DRAIN_TIMEOUT)
+                        if not data:
+                            raise ConnectionError("Server closed connection")
+                        stats['bytes'] += len(data)
+                        record(decoder.feed(data))
+        except asyncio.TimeoutError:
+            print(f"[WARNING] Timed out with {outstanding} requests in flight")
+            stats['errors'] += 1
+        except Exception as e:
+            print(f"[ERROR] Connection error: {e}")
+            stats['errors'] += 1
+        finally:
+            if sender:
+                sender.cancel()
+            writer.close()
+            # Per-connection histograms are merged into the process total
+            stats['latency'].merge(latency)
+
+    async def run_async(self, connections, rate):
+        """Run `connections` connections sharing `rate` QPS in this process"""
+        stats = self.new_stats()
+        start = time.perf_counter_ns()
+        measure_from = start + int(self.warmup * 1e9)
+        stop_at = measure_from + int(self.duration * 1e9)
+        per_connection_rate = rate / connections if rate > 0 else 0.0
+
+        await asyncio.gather(*(
+            self.run_connection(per_connection_rate, measure_from, stop_at, stats)
+            for _ in range(connections)
+        ))
+        return stats
+
+    def run_worker(self, share):
+        """Process entry point: run one share of the connections"""
+        connections, rate = share
+        return asyncio.run(self.run_async(connections, rate))
+
+    def run(self):
+        """Run the load test and return the aggregated statistics"""
+        print("=" * 50)
+        print("TCP Load Generator (Python)")
+        print("=" * 50)
+        print(f"Target:        {self.host}:{self.port}")
+        print(f"Connections:   {self.connections} over {self.processes} process(es)")
+        print(f"Message size:  {self.message_size} bytes")
+        if self.rate > 0:
+            print(f"Load model:    open-loop at {self.rate:.0f} msg/sec")
+        else:
+            print("Load model:    closed-loop (1 request in flight per connection)")
+        print(f"Warm-up:       {self.warmup:.1f} s, measuring {self.duration:.1f} s\n")
+
+        # Split connections and rate evenly across processes
+        base, extra = divmod(self.connections, self.processes)
+        shares = []
+        for i in range(self.processes):
+            count = base + (1 if i < extra else 0)
+            shares.append((count, self.rate * count / self.connections))
+
+        if self.processes == 1:
+            results = [self.run_worker(shares[0])]
+        else:
+            with Pool(self.processes) as pool:
+                results = pool.map(self.run_worker, shares)
+
+        total = self.new_stats()
+        for stats in results:
+            for key in ('connections', 'errors', 'sent', 'received', 'bytes'):
+                total[key] += stats[key]
+            total['latency'].merge(stats['latency'])
+
+        self.print_report(total)
+        return total
+
+    def print_report(self, total):
+        latencies = total['latency']
+        measured = len(latencies)
+
+        print("\n" + "=" * 50)
+        print("LOAD TEST RESULTS")
+        print("=" * 50)
+        print(f"Connections OK:    {total['connections']}/{self.connections}")
+        print(f"Errors:            {total['errors']}")
+        print(f"Requests Sent:     {total['sent']}")
+        print(f"Replies Received:  {total['received']}")
+        print(f"Measured Replies:  {measured}")
+        print(f"Messages/sec:      {measured / self.duration:.2f}")
+        print(f"Total Data:        {total['bytes'] / 1024 / 1024:.2f} MB")
+        if latencies:
+            print("-" * 50)
+            print("Latency (RTT):")
+            for line in latencies.format_report(scale=1000, unit="ms"):
+                print(line)
+        print("=" * 50)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCP multi-connection load generator")
+    parser.add_argument("--host", default=SERVER_IP, help="Server address")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Server port")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                        help="Number of concurrent connections")
+    parser.add_argument("--size", type=int, default=DEFAULT_MESSAGE_SIZE,
+                        help="Payload size in bytes")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Total open-loop rate in msg/sec (0 = closed-loop)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                        help="Measurement duration in seconds")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP,
+                        help="Warm-up seconds excluded from the results")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes to spread connections over")
+    parser.add_argument("--json", help="Export the merged latency histogram to this JSON file")
+    parser.add_argument("--csv", help="Export the merged latency histogram to this CSV file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    generator = LoadGenerator(host=args.host, port=args.port, connections=args.connections,
+                              message_size=args.size, rate=args.rate, duration=args.duration,
+                              warmup=args.warmup, processes=args.processes)
+    try:
+        total = generator.run()
+        export_histogram(total['latency'], args.json, args.csv)
+    except KeyboardInterrupt:
+        print("\n[INFO] Interrupted by user")
+        sys.exit(1)
@@ -1,21 +1,48 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import asyncio
+import selectors
 import socket
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from tcp_framing import FrameDecoder, encode_frame
+
 PORT = 8888
 BUFFER_SIZE = 8192
-BACKLOG = 10
+BACKLOG = 128
+MAX_WORKERS = 256
+
+MODES = ("thread", "selector", "asyncio")
+
+class ConnectionState:
+    """Per-connection bookkeeping for the event-driven engines"""
+
+    def __init__(self, sock, address, framed=False):
+        self.sock = sock
+        self.address = address
+        self.message_count = 0
+        self.start_time = time.time()
+        self.outbox = bytearray()
+        self.decoder = FrameDecoder() if framed else None
 
 class TcpServer:
-    def __init__(self):
+    def __init__(self, mode="thread", workers=MAX_WORKERS, port=PORT, framed=False):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.workers = workers
+        self.port = port
+        self.framed = framed
         self.server_socket = None
         self.running = False
+        self.client_sockets = set()
 
-    def setup_socket(self, sock):
+    def setup_socket(self, sock, log=True):
         """Apply TCP optimizations to the socket"""
         try:
             # TCP Optimization 1: SO_REUSEADDR
@@ -39,6 +66,9 @@ class TcpServer:
             if hasattr(socket, 'TCP_KEEPCNT'):
                 sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 5)  # 5 probes
             
+            if not log:
+                return
+            
             print("[INFO] Socket optimizations applied:")
             print("  - SO_REUSEADDR: Enabled")
             print("  - TCP_NODELAY: Enabled (Nagle disabled)")
@@ -49,13 +79,56 @@ class TcpServer:
         except Exception as e:
             print(f"[WARNING] Some optimizations failed: {e}")
 
+    def build_response(self, data, message_count):
+        """Create the echo response for one received message"""
+        received_message = data.decode('utf-8')
+        
+        # Create echo response with timestamp
+        timestamp = int(time.time() * 1000)
+        response = f"{received_message} [Server Echo - Msg#{message_count} - Time:{timestamp}]"
+        return response.encode('utf-8')
+
+    def handle_data(self, state, data):
+        """Turn received bytes into the bytes to send back for this connection
+
+        Unframed mode treats each recv() chunk as one message. Framed mode
+        decodes complete frames and echoes each one with its id and timestamp.
+        """
+        if state.decoder is None:
+            state.message_count += 1
+            self.log_progress(state.message_count, state.start_time)
+            return self.build_response(data, state.message_count)
+        
+        output = bytearray()
+        for frame in state.decoder.feed(data):
+            state.message_count += 1
+            response = self.build_response(frame.payload, state.message_count)
+            output += encode_frame(response, frame.msg_id, frame.timestamp)
+            self.log_progress(state.message_count, state.start_time)
+        return output
+
+    def log_progress(self, message_count, start_time):
+        """Log every 100 messages"""
+        if message_count % 100 == 0:
+            elapsed = time.time() - start_time
+            messages_per_sec = message_count / elapsed if elapsed > 0 else 0
+            print(f"[STATS] Messages: {message_count}, Rate: {messages_per_sec:.2f} msg/sec")
+
+    def print_session_stats(self, message_count, start_time):
+        """Print statistics for a finished client session"""
+        total_duration = time.time() - start_time
+        print("\n[SESSION STATS]")
+        print(f"  Total Messages: {message_count}")
+        print(f"  Total Duration: {total_duration * 1000:.0f} ms")
+        if total_duration > 0:
+            print(f"  Average Rate: {message_count / total_duration:.2f} msg/sec")
+
     def handle_client(self, client_socket, client_address):
-        """Handle a single client connection"""
+        """Handle a single client connection (thread engine)"""
         try:
             print(f"\n[CONNECTED] Client from {client_address[0]}:{client_address[1]}")
             
-            message_count = 0
-            start_time = time.time()
+            state = ConnectionState(client_socket, client_address, self.framed)
             
             while self.running:
                 try:
@@ -66,21 +139,10 @@ class TcpServer:
                         print("[DISCONNECTED] Client closed connection")
                         break
                     
-                    message_count += 1
-                    received_message = data.decode('utf-8')
-                    
-                    # Create echo response with timestamp
-                    timestamp = int(time.time() * 1000)
-                    response = f"{received_message} [Server Echo - Msg#{message_count} - Time:{timestamp}]"
-                    
                     # Send response
-                    client_socket.sendall(response.encode('utf-8'))
-                    
-                    # Log every 100 messages
-                    if message_count % 100 == 0:
-                        elapsed = time.time() - start_time
-                        messages_per_sec = message_count / elapsed if elapsed > 0 else 0
-                        print(f"[STATS] Messages: {message_count}, Rate: {messages_per_sec:.2f} msg/sec")
+                    response = self.handle_data(state, data)
+                    if response:
+                        client_socket.sendall(response)
                         
                 except socket.timeout:
                     continue
@@ -88,19 +150,161 @@ class TcpServer:
                     print(f"[ERROR] Error handling message: {e}")
                     break
             
-            # Session statistics
-            total_duration = time.time() - start_time
-            print("\n[SESSION STATS]")
-            print(f"  Total Messages: {message_count}")
-            print(f"  Total Duration: {total_duration * 1000:.0f} ms")
-            if total_duration > 0:
-                print(f"  Average Rate: {message_count / total_duration:.2f} msg/sec")
+            self.print_session_stats(state.message_count, state.start_time)
                 
         except Exception as e:
             print(f"[ERROR] Client handler error: {e}")
         finally:
+            self.client_sockets.discard(client_socket)
             client_socket.close()
 
+    def serve_threaded(self):
+        """Thread-per-connection engine backed by a bounded worker pool"""
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while self.running:
+                try:
+                    client_socket, client_address = self.server_socket.accept()
+                    self.setup_socket(client_socket, log=False)
+                    self.client_sockets.add(client_socket)
+                    pool.submit(self.handle_client, client_socket, client_address)
+                except KeyboardInterrupt:
+                    print("\n[INFO] Keyboard interrupt received")
+                    break
+                except Exception as e:
+                    if self.running:
+                        print(f"[ERROR] Accept error: {e}")
+        finally:
+            self.running = False
+            # Wake up workers blocked in recv() so the pool can drain
+            for client_socket in list(self.client_sockets):
+                try:
+                    client_socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            pool.shutdown(wait=True)
+
+    def serve_selector(self):
+        """Single-threaded event loop engine (epoll/kqueue/select via selectors)"""
+        selector = selectors.DefaultSelector()
+        self.server_socket.setblocking(False)
+        selector.register(self.server_socket, selectors.EVENT_READ, None)
+        
+        try:
+            while self.running:
+                for key, events in selector.select(timeout=1.0):
+                    if key.data is None:
+                        self.accept_nonblocking(selector)
+                        continue
+                    
+                    state = key.data
+                    if events & selectors.EVENT_READ:
+                        self.read_nonblocking(selector, state)
+                    if events & selectors.EVENT_WRITE and state.sock.fileno() != -1:
+                        self.flush_nonblocking(selector, state)
+        except KeyboardInterrupt:
+            print("\n[INFO] Keyboard interrupt received")
+        finally:
+            for key in list(selector.get_map().values()):
+                if key.data is not None:
+                    key.data.sock.close()
+            selector.close()
+
+    def accept_nonblocking(self, selector):
+        """Accept all pending connections on the listening socket"""
+        while True:
+            try:
+                client_socket, client_address = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except Exception as e:
+                print(f"[ERROR] Accept error: {e}")
+                return
+            
+            self.setup_socket(client_socket, log=False)
+            client_socket.setblocking(False)
+            print(f"\n[CONNECTED] Client from {client_address[0]}:{client_address[1]}")
+            state = ConnectionState(client_socket, client_address, self.framed)
+            selector.register(client_socket, selectors.EVENT_READ, state)
+
+    def read_nonblocking(self, selector, state):
+        """Read one chunk from a ready connection and queue its echo"""
+        try:
+            data = state.sock.recv(BUFFER_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception as e:
+            print(f"[ERROR] Error handling message: {e}")
+            data = b""
+        
+        if not data:
+            print("[DISCONNECTED] Client closed connection")
+            self.close_nonblocking(selector, state)
+            return
+        
+        try:
+            state.outbox += self.handle_data(state, data)
+        except ValueError as e:
+            print(f"[ERROR] Invalid frame: {e}")
+            self.close_nonblocking(selector, state)
+            return
+        self.flush_nonblocking(selector, state)
+
+    def flush_nonblocking(self, selector, state):
+        """Write as much of the pending output as the socket accepts"""
+        try:
+            sent = state.sock.send(state.outbox)
+            del state.outbox[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception as e:
+            print(f"[ERROR] Error sending response: {e}")
+            self.close_nonblocking(selector, state)
+            return
+        
+        events = selectors.EVENT_READ
+        if state.outbox:
+            events |= selectors.EVENT_WRITE
+        selector.modify(state.sock, events, state)
+
+    def close_nonblocking(self, selector, state):
+        """Unregister and close a connection handled by the selector engine"""
+        selector.unregister(state.sock)
+        state.sock.close()
+        self.print_session_stats(state.message_count, state.start_time)
+
+    async def handle_client_async(self, reader, writer):
+        """Handle a single client connection (asyncio engine)"""
+        client_address = writer.get_extra_info('peername')
+        self.setup_socket(writer.get_extra_info('socket'), log=False)
+        print(f"\n[CONNECTED] Client from {client_address[0]}:{client_address[1]}")
+        
+        state = ConnectionState(None, client_address, self.framed)
+        
+        try:
+            while self.running:
+                data = await reader.read(BUFFER_SIZE)
+                
+                if not data:
+                    print("[DISCONNECTED] Client closed connection")
+                    break
+                
+                writer.write(self.handle_data(state, data))
+                await writer.drain()
+        except Exception as e:
+            print(f"[ERROR] Error handling message: {e}")
+        finally:
+            self.print_session_stats(state.message_count, state.start_time)
+            writer.close()
+
+    async def serve_asyncio(self):
+        """asyncio engine built on asyncio.start_server"""
+        server = await asyncio.start_server(
+            self.handle_client_async, sock=self.server_socket, backlog=BACKLOG
+        )
+        async with server:
+            await server.serve_forever()
+
     def start(self):
         """Start the TCP server"""
         try:
@@ -109,7 +313,7 @@ class TcpServer:
             self.setup_socket(self.server_socket)
             
             # Bind to address
-            self.server_socket.bind(('0.0.0.0', PORT))
+            self.server_socket.bind(('0.0.0.0', self.port))
             
             # Listen for connections
             self.server_socket.listen(BACKLOG)
@@ -119,22 +323,24 @@ class TcpServer:
             print("\n" + "=" * 40)
             print("TCP Optimized Server Started (Python)")
             print("=" * 40)
-            print(f"Listening on port {PORT}")
+            print(f"Listening on port {self.port}")
+            print(f"Concurrency engine: {self.mode}")
+            print(f"Framing: {'length-prefixed' if self.framed else 'none (raw stream)'}")
+            if self.mode == "thread":
+                print(f"Worker pool size: {self.workers}")
             print("Waiting for connections...")
             print("Press Ctrl+C to stop\n")
             
             # Accept connections
-            while self.running:
+            if self.mode == "thread":
+                self.serve_threaded()
+            elif self.mode == "selector":
+                self.serve_selector()
+            else:
                 try:
-                    client_socket, client_address = self.server_socket.accept()
-                    self.setup_socket(client_socket)
-                    self.handle_client(client_socket, client_address)
+                    asyncio.run(self.serve_asyncio())
                 except KeyboardInterrupt:
                     print("\n[INFO] Keyboard interrupt received")
-                    break
-                except Exception as e:
-                    if self.running:
-                        print(f"[ERROR] Accept error: {e}")
                         
         except Exception as e:
             print(f"[ERROR] Server error: {e}")
@@ -147,10 +353,24 @@ class TcpServer:
         self.running = False
         if self.server_socket:
             self.server_socket.close()
+            self.server_socket = None
             print("\n[STOPPED] Server stopped")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCP Optimized Echo Server")
+    parser.add_argument("--mode", choices=MODES, default="thread",
+                        help="Concurrency engine (default: thread)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS,
+                        help="Worker pool size for the thread engine")
+    parser.add_argument("--port", type=int, default=PORT, help="Listening port")
+    parser.add_argument("--framed", action="store_true",
+                        help="Use the length-prefixed frame protocol (tcp_framing.py)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    server = TcpServer()
+    args = parse_args()
+    server = TcpServer(mode=args.mode, workers=args.workers, port=args.port,
+                       framed=args.framed)
     try:
         server.start()
     except KeyboardInterrupt:
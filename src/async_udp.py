@@ -0,0 +1,392 @@
+"""
+Phiên bản asyncio của server và client UDP tối ưu hóa.
+
+Dùng asyncio.DatagramProtocol thay cho vòng recvfrom blocking, thread
+nghe ACK, timer wheel và threading.Lock: mỗi endpoint chạy hoàn toàn trên
+một event loop. Transport datagram của asyncio chỉ đọc một gói mỗi vòng
+lặp, nên server mặc định đăng ký loop.add_reader và rút cả lô bằng
+BatchReceiver, gom ACK gửi một lượt sau mỗi lô. Logic bundling / ACK tích lũy + SACK / RTO / gửi lại được
+kế thừa nguyên vẹn từ OptimizedUDPServer và OptimizedUDPClient, chỉ thay
+phần I/O và lập lịch timer. Nhờ vậy một process có thể chạy hàng nghìn
+phiên UDP logic và nhúng được vào các service async khác.
+
+Chạy demo: python src/async_udp.py --clients 1000 --messages 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import multiprocessing
+import time
+from typing import List, Optional
+
+from batched_io import BatchReceiver
+from impairment import ImpairmentConfig, add_impairment_arguments, impairment_from_args
+from message_dispatcher import MODE_THREAD, MODES as HANDLER_MODES
+from optimized_udp_client import OptimizedUDPClient
+from optimized_udp_server import OptimizedUDPServer
+from socket_buffers import DEFAULT_BANDWIDTH_BPS, DEFAULT_RTT, add_buffer_arguments, format_buffers
+from udp_workers import UDPServerCluster
+from udp_codec import CodecError, DEFAULT_STREAM, FORMAT_BINARY, FORMATS, decode_packet
+
+class LoopTimers:
+    """Cùng interface với TimerWheel nhưng dùng loop.call_later (heap của event loop)"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def schedule(self, delay: float, callback, *args) -> asyncio.TimerHandle:
+        return self.loop.call_later(delay, callback, *args)
+
+    def stop(self):
+        pass
+
+class AsyncOptimizedUDPServer(OptimizedUDPServer, asyncio.DatagramProtocol):
+    def __init__(self, host='localhost', port=8888, loss_rate=0.0, verbose=True, **options):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        super().__init__(host, port, loss_rate=loss_rate, verbose=verbose, **options)
+
+    def link_scheduler(self):
+        try:
+            return asyncio.get_running_loop().call_later
+        except RuntimeError:
+            return super().link_scheduler()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address):
+        self.handle_datagram(data, address)
+
+    def error_received(self, exc):
+        self.log(f"Lỗi socket: {exc}")
+
+    def transmit(self, data: bytes, address):
+        if self.transport:
+            self.transport.sendto(data, address)
+        else:
+            super().transmit(data, address)
+
+    def send_datagrams(self, datagrams):
+        if not self.transport or self.link:
+            super().send_datagrams(datagrams)
+            return
+        for data, address in datagrams:
+            self.transport.sendto(data, address)
+
+    def call_in_loop(self, callback):
+        # Thread handler giao việc cho event loop đang chạy server
+        if self.loop:
+            try:
+                self.loop.call_soon_threadsafe(callback)
+            except RuntimeError:
+                # Loop đã đóng: không còn vòng nhận nào để cập nhật
+                pass
+        else:
+            super().call_in_loop(callback)
+
+    def schedule_ack_flush(self):
+        # Chế độ transport: ACK được gom theo từng vòng lặp của event loop
+        if self.transport:
+            asyncio.get_running_loop().call_soon(self.flush_acks)
+
+    async def serve(self, stats_interval: float = 10.0, batched: bool = True):
+        """Chạy server trên event loop hiện tại cho đến khi bị hủy"""
+        loop = self.loop = asyncio.get_running_loop()
+        if self.loop_calls:
+            # Callback đã hẹn trước khi loop chạy
+            loop.call_soon(self.run_loop_calls)
+        if batched:
+            self.socket.setblocking(False)
+            self.receiver = BatchReceiver(self.socket, self.batch_size)
+            loop.add_reader(self.socket.fileno(), self.process_batch)
+        else:
+            await loop.create_datagram_endpoint(lambda: self, sock=self.socket)
+
+        try:
+            while True:
+                await asyncio.sleep(stats_interval)
+                self.print_stats()
+        finally:
+            if batched:
+                loop.remove_reader(self.socket.fileno())
+                self.socket.close()
+            else:
+                self.transport.close()
+
+class AsyncOptimizedUDPClient(OptimizedUDPClient, asyncio.DatagramProtocol):
+    """Client asyncio; phải được tạo bên trong một event loop đang chạy"""
+
+    def __init__(self, server_host='localhost', server_port=8888, wire_format=FORMAT_BINARY,
+                 verbose=True, **bundling):
+        super().__init__(server_host, server_port, wire_format=wire_format, verbose=verbose,
+                         **bundling)
+        # Mọi thứ chạy trên một loop nên không cần lock
+        self.lock = contextlib.nullcontext()
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        # Được set khi không còn message nào chờ ACK
+        self.all_acked = asyncio.Event()
+        # Được set mỗi khi ACK về hoặc cửa sổ thay đổi
+        self.window_changed = asyncio.Event()
+
+    def create_timers(self):
+        return LoopTimers(asyncio.get_running_loop())
+
+    def create_event(self):
+        return asyncio.Event()
+
+    def link_scheduler(self):
+        return self.timers.schedule
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, sock=self.socket)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, address):
+        try:
+            ack_data, _ = decode_packet(data)
+        except CodecError as e:
+            self.log(f"Lỗi decode ACK: {e}")
+            return
+
+        self.stats['ack_bytes_received'] += len(data)
+        if ack_data['type'] != 'ack':
+            self.on_control_packet(ack_data)
+        else:
+            acked = self.process_ack(ack_data)
+            if acked and self.verbose:
+                self.log(f"ACK cum={ack_data['cum']} sack={ack_data['sack']} "
+                         f"-> xác nhận {len(acked)} messages {acked}")
+
+    def error_received(self, exc):
+        self.log(f"Lỗi socket: {exc}")
+
+    def transmit(self, data: bytes):
+        self.transport.sendto(data, self.server_addr)
+
+    def send_bundle(self, messages):
+        self.all_acked.clear()
+        super().send_bundle(messages)
+
+    def process_ack(self, ack_data: dict):
+        acked = super().process_ack(ack_data)
+        self.window_changed.set()
+        if not self.unacked_messages:
+            self.all_acked.set()
+        return acked
+
+    def requeue_sacked(self):
+        super().requeue_sacked()
+        if self.unacked_messages:
+            self.all_acked.clear()
+
+    async def wait_for_handshake(self):
+        await self.handshake_done.wait()
+
+    async def wait_for_window(self, count: int):
+        if not self.window_available(count):
+            self.stats['window_stalls'] += 1
+        while not self.window_available(count) and self.listening_active:
+            self.window_changed.clear()
+            await self.window_changed.wait()
+
+    def retransmit(self, message):
+        super().retransmit(message)
+        self.window_changed.set()
+        # Message có thể vừa bị drop vì hết số lần gửi lại
+        if not self.unacked_messages:
+            self.all_acked.set()
+
+    async def wait_for_acks(self, timeout: float) -> bool:
+        """Chờ đến khi mọi message được ACK (hoặc bị drop), tối đa `timeout` giây"""
+        if self.unacked_messages:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.all_acked.wait(), timeout)
+        return not self.unacked_messages
+
+    def close(self):
+        self.listening_active = False
+        self.cancel_bundle_deadline()
+        for message in self.unacked_messages.values():
+            if message.timer:
+                message.timer.cancel()
+        if self.handshake_timer:
+            self.handshake_timer.cancel()
+        if self.link:
+            self.link.close()
+        if self.transport:
+            self.transport.close()
+
+async def run_session(client: AsyncOptimizedUDPClient, messages: List[str], timeout: float,
+                      streams: int = 1, unordered: bool = False):
+    await client.connect()
+    try:
+        if streams > 1:
+            # Chia message xoay vòng cho stream mặc định và streams - 1 stream mới, gửi đồng thời
+            stream_ids = [DEFAULT_STREAM] + [client.open_stream(unordered) for _ in range(streams - 1)]
+            await asyncio.gather(*(client.send_messages(messages[i::streams], stream_id)
+                                   for i, stream_id in enumerate(stream_ids)))
+        else:
+            await client.send_messages(messages)
+        await client.wait_for_acks(timeout)
+    finally:
+        client.close()
+
+def simulated_work(seconds: float, client_key, stream_id: int, seq: int, payload: bytes):
+    """Handler mẫu: bận CPU `seconds` giây cho mỗi message"""
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+def run_server_process(port: int, loss_rate: float, stop_event, work_ms: float = 0.0,
+                       handler_mode: str = MODE_THREAD, seed: Optional[int] = None,
+                       ack_impairment: Optional[ImpairmentConfig] = None,
+                       bandwidth_bps: float = DEFAULT_BANDWIDTH_BPS, rtt: float = DEFAULT_RTT):
+    """Server asyncio chạy trên event loop riêng trong process riêng"""
+    async def serve():
+        server = AsyncOptimizedUDPServer(port=port, loss_rate=loss_rate, verbose=False,
+                                         seed=seed, impairment=ack_impairment,
+                                         bandwidth_bps=bandwidth_bps, rtt=rtt)
+        if work_ms > 0:
+            server.register_handler(functools.partial(simulated_work, work_ms / 1000), mode=handler_mode)
+        serve_task = asyncio.create_task(server.serve(stats_interval=3600))
+        await asyncio.get_running_loop().run_in_executor(None, stop_event.wait)
+        serve_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await serve_task
+        server.close_handlers()
+        server.print_stats()
+
+    asyncio.run(serve())
+
+async def run_demo(num_clients: int, num_messages: int, port: int, loss_rate: float,
+                   wire_format: str, timeout: float, workers: int = 1, work_ms: float = 0.0,
+                   handler_mode: str = MODE_THREAD, impairment: Optional[ImpairmentConfig] = None,
+                   ack_impairment: Optional[ImpairmentConfig] = None, seed: Optional[int] = None,
+                   fec_group: int = 0, streams: int = 1, unordered: bool = False, message_size: int = 0,
+                   pacing: bool = True, max_rate_bps: float = 0.0,
+                   bandwidth_bps: float = DEFAULT_BANDWIDTH_BPS, rtt: float = DEFAULT_RTT):
+    # Mỗi endpoint một event loop: server ở process riêng, mọi client chung một loop
+    cluster = None
+    if workers > 1:
+        # Nhiều worker SO_REUSEPORT, kernel chia các client giữa các worker
+        cluster = UDPServerCluster(port=port, workers=workers, loss_rate=loss_rate,
+                                   seed=seed, impairment=ack_impairment, bandwidth_bps=bandwidth_bps, rtt=rtt)
+        cluster.start()
+    else:
+        stop_event = multiprocessing.Event()
+        # Không daemon: handler chế độ process cần tạo process con
+        server_process = multiprocessing.Process(
+            target=run_server_process,
+            args=(port, loss_rate, stop_event, work_ms, handler_mode, seed, ack_impairment,
+                  bandwidth_bps, rtt))
+        server_process.start()
+        await asyncio.sleep(0.5)
+
+    print(f"Chạy {num_clients} phiên UDP trên một event loop, mỗi phiên {num_messages} messages")
+    print(f"Loss mô phỏng: {loss_rate * 100:.0f}%, định dạng: {wire_format}")
+    if message_size:
+        print(f"Mỗi message {message_size} bytes (lớn hơn một datagram thì gửi thành nhiều mảnh)")
+    if streams > 1:
+        print(f"Mỗi phiên {streams} stream{' (stream phụ không thứ tự)' if unordered else ''}")
+    if not pacing or max_rate_bps:
+        print(f"Pacing: {'bật' if pacing else 'tắt'}"
+              + (f", trần {max_rate_bps / 1e6:g} Mbit/s mỗi phiên" if max_rate_bps else ""))
+    if impairment:
+        print(f"Suy hao chiều dữ liệu: {impairment}")
+
+    start = time.perf_counter()
+    # Mỗi client một seed riêng (seed + i) để các phiên không mất gói giống hệt nhau
+    clients = [AsyncOptimizedUDPClient(
+                   server_port=port, wire_format=wire_format, verbose=False, fec_group=fec_group,
+                   pacing=pacing, max_rate_bps=max_rate_bps, bandwidth_bps=bandwidth_bps, rtt=rtt,
+                   impairment=impairment and dataclasses.replace(
+                       impairment, seed=None if impairment.seed is None else impairment.seed + i))
+               for i in range(num_clients)]
+    await asyncio.gather(*(
+        run_session(client, [f"Client {i} message {j}".ljust(message_size, '.') for j in range(num_messages)],
+                    timeout, streams, unordered)
+        for i, client in enumerate(clients)
+    ))
+    elapsed = time.perf_counter() - start
+
+    sent = sum(c.stats['messages_sent'] for c in clients)
+    acked = sum(c.delivered() for c in clients)
+    retransmissions = sum(c.stats['retransmissions'] for c in clients)
+    complete = sum(1 for c in clients if not c.unacked_messages)
+
+    print("\n" + "=" * 50)
+    print("ASYNC UDP DEMO")
+    print("=" * 50)
+    print(f"Sessions Completed: {complete}/{num_clients}")
+    print(f"Messages Sent: {sent}")
+    print(f"Messages ACKed: {acked}")
+    print(f"Retransmissions: {retransmissions}")
+    if fec_group:
+        print(f"FEC Parity Sent: {sum(c.stats['parity_sent'] for c in clients)}")
+    print(f"Elapsed: {elapsed:.2f}s")
+    paced = sum(c.pacer.stats['paced_sends'] for c in clients)
+    if paced:
+        print(f"Paced Sends: {paced} (chờ trung bình "
+              f"{sum(c.pacer.stats['pacing_delay'] for c in clients) / paced * 1e6:.0f} us)")
+    if impairment:
+        dropped = sum(c.link.stats['lost'] + c.link.stats['queue_drops'] for c in clients if c.link)
+        print(f"Datagrams Dropped by Impairment: {dropped}")
+    if clients and clients[0].kernel_drops.available:
+        print(f"ACKs Dropped by Kernel: {sum(c.kernel_drops.read() for c in clients)} "
+              f"({format_buffers(clients[0].buffers)} mỗi client)")
+
+    if cluster:
+        cluster.stop()
+        cluster.print_stats()
+    else:
+        stop_event.set()
+        server_process.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Asyncio UDP optimization demo")
+    parser.add_argument('--clients', type=int, default=100, help="Số phiên UDP đồng thời")
+    parser.add_argument('--messages', type=int, default=20, help="Số message mỗi phiên")
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--loss', type=float, default=0.1, help="Tỉ lệ mất gói mô phỏng")
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_BINARY)
+    parser.add_argument('--timeout', type=float, default=30.0, help="Thời gian chờ ACK tối đa")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Số worker server SO_REUSEPORT (>1 dùng udp_workers)")
+    parser.add_argument('--work-ms', type=float, default=0.0,
+                        help="Đăng ký handler bận CPU bấy nhiêu ms mỗi message (server một worker)")
+    parser.add_argument('--handler-mode', choices=HANDLER_MODES, default=MODE_THREAD)
+    parser.add_argument('--fec', type=int, default=0,
+                        help="Gửi một gói XOR parity mỗi N bundle (0 = tắt FEC, chỉ định dạng binary)")
+    parser.add_argument('--streams', type=int, default=1,
+                        help="Số stream mỗi phiên, message chia xoay vòng giữa các stream")
+    parser.add_argument('--unordered', action='store_true',
+                        help="Các stream phụ giao không theo thứ tự")
+    parser.add_argument('--message-size', type=int, default=0,
+                        help="Độn mỗi message đến bấy nhiêu bytes (lớn hơn MTU để thử phân mảnh)")
+    parser.add_argument('--no-pacing', action='store_true',
+                        help="Tắt pacing theo cwnd/SRTT (gửi cả cửa sổ một lượt)")
+    parser.add_argument('--max-rate-mbps', type=float, default=0.0,
+                        help="Trần cứng tốc độ gửi của mỗi phiên (0 = không giới hạn)")
+    add_impairment_arguments(parser)
+    add_buffer_arguments(parser)
+    args = parser.parse_args()
+
+    impairment, ack_impairment = impairment_from_args(args)
+    loss_rate = args.loss
+    if impairment and dataclasses.replace(impairment, loss=0.0).is_active():
+        # Có suy hao khác ngoài loss: mô phỏng cả chiều dữ liệu ở phía client, server không bỏ gói nữa
+        loss_rate = 0.0
+    else:
+        # Chỉ có loss: server bỏ gói chiều vào như trước (vẫn theo --seed)
+        impairment = None
+    asyncio.run(run_demo(args.clients, args.messages, args.port, loss_rate, args.format, args.timeout,
+                         args.workers, args.work_ms, args.handler_mode, impairment, ack_impairment, args.seed,
+                         args.fec, args.streams, args.unordered, args.message_size, not args.no_pacing,
+                         args.max_rate_mbps * 1_000_000, args.bandwidth_mbps * 1_000_000, args.rtt_ms / 1000))
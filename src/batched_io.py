@@ -0,0 +1,271 @@
+"""
+I/O datagram theo lô (batch) cho server UDP.
+
+Thay vì mỗi datagram một lần recvfrom(65535) (một syscall + một bytes mới),
+BatchReceiver rút nhiều datagram mỗi lần thức dậy vào một vòng buffer
+bytearray cấp phát sẵn, trả về memoryview trỏ thẳng vào buffer:
+
+  - Linux : recvmmsg(2) qua ctypes, một syscall cho cả lô (MSG_WAITFORONE:
+            chờ gói đầu tiên rồi lấy hết những gì đã có sẵn)
+  - Khác  : recvfrom_into vào từng slot của vòng buffer, chờ gói đầu tiên
+            rồi rút tiếp không chặn cho đến khi hàng đợi socket rỗng
+
+BatchSender gửi nhiều datagram (ví dụ các ACK gom lại sau mỗi lô) bằng một
+lần sendmmsg(2) trên Linux, hoặc lần lượt sendto ở nền tảng khác. sendmmsg
+có thể chỉ gửi được một phần lô (lỗi ở một datagram giữa chừng, bị ngắt):
+phần còn lại được gửi tiếp bằng lần gọi sau, datagram gặp EAGAIN bị bỏ qua
+giống nhánh sendto.
+
+Memoryview trả về chỉ hợp lệ đến lần receive() kế tiếp.
+"""
+
+import ctypes
+import select
+import socket
+import sys
+from typing import Dict, List, Optional, Tuple
+
+BATCH_SIZE = 32
+DATAGRAM_BUFFER = 65535
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+MSG_WAITFORONE = 0x10000
+EINTR = 4
+EAGAIN = 11
+SOCKADDR_SIZE = 128
+# Giới hạn cache địa chỉ đã chuyển đổi, tránh lớn dần theo số client
+MAX_CACHED_ADDRESSES = 65536
+
+class IOVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(IOVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+def _load_libc():
+    """libc có recvmmsg/sendmmsg hay không (chỉ Linux)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.recvmmsg, libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+LIBC = _load_libc()
+HAVE_MMSG = LIBC is not None
+
+def decode_sockaddr(raw: bytes):
+    """sockaddr_in / sockaddr_in6 -> tuple địa chỉ giống socket.recvfrom"""
+    family = int.from_bytes(raw[0:2], sys.byteorder)
+    port = int.from_bytes(raw[2:4], 'big')
+    if family == socket.AF_INET:
+        return socket.inet_ntop(socket.AF_INET, raw[4:8]), port
+    if family == socket.AF_INET6:
+        flowinfo = int.from_bytes(raw[4:8], 'big')
+        scope_id = int.from_bytes(raw[24:28], sys.byteorder)
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port, flowinfo, scope_id
+    raise OSError(f"Không hỗ trợ address family {family}")
+
+def encode_sockaddr(address) -> bytes:
+    """Tuple địa chỉ -> sockaddr_in / sockaddr_in6 cho sendmmsg"""
+    host, port = address[0], address[1]
+    if ':' not in host:
+        return (socket.AF_INET.to_bytes(2, sys.byteorder) + port.to_bytes(2, 'big')
+                + socket.inet_pton(socket.AF_INET, host) + bytes(8))
+    flowinfo = address[2] if len(address) > 2 else 0
+    scope_id = address[3] if len(address) > 3 else 0
+    return (socket.AF_INET6.to_bytes(2, sys.byteorder) + port.to_bytes(2, 'big')
+            + flowinfo.to_bytes(4, 'big') + socket.inet_pton(socket.AF_INET6, host)
+            + scope_id.to_bytes(4, sys.byteorder))
+
+class BatchReceiver:
+    def __init__(self, sock: socket.socket, batch_size: int = BATCH_SIZE,
+                 buffer_size: int = DATAGRAM_BUFFER, use_mmsg: Optional[bool] = None):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.use_mmsg = HAVE_MMSG if use_mmsg is None else (use_mmsg and HAVE_MMSG)
+        self.backend = 'recvmmsg' if self.use_mmsg else 'recvfrom_into'
+
+        # Vòng buffer cấp phát một lần, mỗi slot chứa một datagram
+        self.ring = bytearray(batch_size * buffer_size)
+        self.view = memoryview(self.ring)
+        self.slots = [self.view[i * buffer_size:(i + 1) * buffer_size] for i in range(batch_size)]
+
+        self.stats = {'wakeups': 0, 'datagrams': 0}
+        # sockaddr thô -> tuple địa chỉ, tránh inet_ntop cho mỗi datagram
+        self.addresses: Dict[bytes, tuple] = {}
+        self.last_count = batch_size
+        if self.use_mmsg:
+            self._setup_mmsg()
+
+    def _setup_mmsg(self):
+        ring = (ctypes.c_char * len(self.ring)).from_buffer(self.ring)
+        base = ctypes.addressof(ring)
+        self._ring_ref = ring
+        self.names = (ctypes.c_char * (SOCKADDR_SIZE * self.batch_size))()
+        self.names_view = memoryview(self.names).cast('B')
+        self.iovecs = (IOVec * self.batch_size)()
+        self.headers = (MMsgHdr * self.batch_size)()
+        names_base = ctypes.addressof(self.names)
+
+        for i in range(self.batch_size):
+            self.iovecs[i].iov_base = base + i * self.buffer_size
+            self.iovecs[i].iov_len = self.buffer_size
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_name = names_base + i * SOCKADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def receive(self) -> List[Tuple[memoryview, tuple]]:
+        """Chờ ít nhất một datagram rồi trả về cả lô [(payload view, address)]
+
+        Với socket non-blocking (dùng cùng event loop) trả về [] nếu chưa có gì.
+        """
+        try:
+            batch = self._receive_mmsg() if self.use_mmsg else self._receive_fallback()
+        except (BlockingIOError, InterruptedError):
+            return []
+        self.stats['wakeups'] += 1
+        self.stats['datagrams'] += len(batch)
+        return batch
+
+    def _receive_mmsg(self) -> List[Tuple[memoryview, tuple]]:
+        fd = self.sock.fileno()
+        headers = self.headers
+        while True:
+            # Kernel ghi đè msg_namelen, chỉ cần đặt lại cho các slot đã dùng lần trước
+            for i in range(self.last_count):
+                headers[i].msg_hdr.msg_namelen = SOCKADDR_SIZE
+            count = LIBC.recvmmsg(fd, headers, self.batch_size, MSG_WAITFORONE, None)
+            if count >= 0:
+                break
+            self.last_count = 0
+            errno = ctypes.get_errno()
+            if errno == EAGAIN:
+                raise BlockingIOError(errno, "recvmmsg: chưa có datagram")
+            if errno != EINTR:
+                raise OSError(errno, f"recvmmsg thất bại (errno {errno})")
+        self.last_count = count
+
+        names = self.names_view
+        batch = []
+        for i in range(count):
+            header = headers[i]
+            offset = i * SOCKADDR_SIZE
+            raw = bytes(names[offset:offset + header.msg_hdr.msg_namelen])
+            address = self.addresses.get(raw)
+            if address is None:
+                if len(self.addresses) >= MAX_CACHED_ADDRESSES:
+                    self.addresses.clear()
+                address = self.addresses[raw] = decode_sockaddr(raw)
+            batch.append((self.slots[i][:header.msg_len], address))
+        return batch
+
+    def _receive_fallback(self) -> List[Tuple[memoryview, tuple]]:
+        nbytes, address = self.sock.recvfrom_into(self.slots[0])
+        batch = [(self.slots[0][:nbytes], address)]
+
+        for slot in self.slots[1:]:
+            try:
+                if sys.platform == 'win32':
+                    # Windows không có MSG_DONTWAIT: hỏi trước xem còn dữ liệu không
+                    if not select.select([self.sock], [], [], 0)[0]:
+                        break
+                    nbytes, address = self.sock.recvfrom_into(slot)
+                else:
+                    nbytes, address = self.sock.recvfrom_into(slot, 0, MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((slot[:nbytes], address))
+        return batch
+
+    def average_batch(self) -> float:
+        return self.stats['datagrams'] / self.stats['wakeups'] if self.stats['wakeups'] else 0.0
+
+class BatchSender:
+    def __init__(self, sock: socket.socket, batch_size: int = BATCH_SIZE,
+                 use_mmsg: Optional[bool] = None):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.use_mmsg = HAVE_MMSG if use_mmsg is None else (use_mmsg and HAVE_MMSG)
+        self.backend = 'sendmmsg' if self.use_mmsg else 'sendto'
+        self.sockaddrs: Dict[tuple, bytes] = {}
+        # Số lần sendmmsg chỉ gửi được một phần lô và số datagram bỏ vì buffer gửi đầy
+        self.stats = {'partial_sends': 0, 'blocked': 0}
+        if self.use_mmsg:
+            self.names = (ctypes.c_char * (SOCKADDR_SIZE * batch_size))()
+            self.iovecs = (IOVec * batch_size)()
+            self.headers = (MMsgHdr * batch_size)()
+            for i in range(batch_size):
+                self.headers[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                self.headers[i].msg_hdr.msg_iovlen = 1
+
+    def sockaddr(self, address) -> bytes:
+        raw = self.sockaddrs.get(address)
+        if raw is None:
+            if len(self.sockaddrs) >= MAX_CACHED_ADDRESSES:
+                self.sockaddrs.clear()
+            raw = self.sockaddrs[address] = encode_sockaddr(address)
+        return raw
+
+    def send(self, datagrams: List[Tuple[bytes, tuple]]) -> int:
+        """Gửi các cặp (data, address), trả về số datagram đã gửi"""
+        if not self.use_mmsg:
+            sent = 0
+            for data, address in datagrams:
+                try:
+                    self.sock.sendto(data, address)
+                    sent += 1
+                except BlockingIOError:
+                    self.stats['blocked'] += 1
+            return sent
+
+        sent = 0
+        for start in range(0, len(datagrams), self.batch_size):
+            sent += self._send_mmsg(datagrams[start:start + self.batch_size])
+        return sent
+
+    def _send_mmsg(self, chunk: List[Tuple[bytes, tuple]]) -> int:
+        names_base = ctypes.addressof(self.names)
+        # Giữ tham chiếu đến buffer cho đến khi syscall trả về
+        buffers = []
+        for i, (data, address) in enumerate(chunk):
+            raw = self.sockaddr(address)
+            ctypes.memmove(names_base + i * SOCKADDR_SIZE, raw, len(raw))
+            buffer = ctypes.create_string_buffer(data, len(data))
+            buffers.append(buffer)
+            self.iovecs[i].iov_base = ctypes.addressof(buffer)
+            self.iovecs[i].iov_len = len(data)
+            hdr = self.headers[i].msg_hdr
+            hdr.msg_name = names_base + i * SOCKADDR_SIZE
+            hdr.msg_namelen = len(raw)
+
+        fd = self.sock.fileno()
+        offset = sent = 0
+        while offset < len(chunk):
+            count = LIBC.sendmmsg(fd, ctypes.byref(self.headers, offset * ctypes.sizeof(MMsgHdr)),
+                                  len(chunk) - offset, 0)
+            if count < 0:
+                errno = ctypes.get_errno()
+                if errno == EINTR:
+                    continue
+                if errno != EAGAIN:
+                    raise OSError(errno, f"sendmmsg thất bại (errno {errno})")
+                # Buffer gửi đầy (socket non-blocking): bỏ datagram này như nhánh sendto
+                self.stats['blocked'] += 1
+                offset += 1
+                continue
+            if offset + count < len(chunk):
+                self.stats['partial_sends'] += 1
+            offset += count
+            sent += count
+        return sent
@@ -0,0 +1,121 @@
+"""
+Benchmark I/O datagram theo lô cho server UDP.
+
+Nhiều process gửi dồn dập datagram nhỏ đến một receiver; receiver trả một
+ACK cho mỗi lần nhận và đo CPU time của chính nó, quy ra số datagram xử lý
+được trên mỗi core (datagram / CPU giây). So sánh ba engine:
+
+  - recvfrom      : cách cũ, mỗi datagram một recvfrom(65535) + một sendto ACK
+  - recvfrom_into : vòng buffer memoryview, ACK gom theo client mỗi lô
+  - recvmmsg      : một syscall recvmmsg/sendmmsg cho cả lô (chỉ Linux)
+
+Chạy: python src/bench_batched_io.py --datagrams 200000 --senders 4
+"""
+
+import argparse
+import multiprocessing
+import socket
+import struct
+import sys
+import time
+
+from batched_io import HAVE_MMSG, BatchReceiver, BatchSender
+
+PAYLOAD = b'x' * 64
+ACK = b'ack'
+RECEIVE_BUFFER = 8 * 1024 * 1024
+IDLE_TIMEOUT = 0.5
+
+def set_receive_timeout(sock: socket.socket, seconds: float):
+    """SO_RCVTIMEO trên socket blocking: mọi engine cùng dừng khi im lặng quá `seconds`"""
+    if sys.platform == 'win32':
+        value = struct.pack('I', int(seconds * 1000))
+    else:
+        value = struct.pack('ll', int(seconds), int((seconds % 1) * 1_000_000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+
+def sender(port: int, count: int, start_event):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_event.wait()
+    for _ in range(count):
+        sock.sendto(PAYLOAD, ('127.0.0.1', port))
+    sock.close()
+
+def receive_legacy(sock: socket.socket, _batch_size: int) -> int:
+    received = 0
+    while True:
+        try:
+            _, address = sock.recvfrom(65535)
+        except BlockingIOError:
+            return received
+        received += 1
+        sock.sendto(ACK, address)
+
+def receive_batched(sock: socket.socket, batch_size: int, use_mmsg: bool) -> int:
+    receiver = BatchReceiver(sock, batch_size, use_mmsg=use_mmsg)
+    sender = BatchSender(sock, batch_size, use_mmsg=use_mmsg)
+    received = 0
+    while True:
+        batch = receiver.receive()
+        if not batch:
+            return received
+        received += len(batch)
+        # Một ACK cho mỗi client trong lô
+        pending = dict.fromkeys(address for _, address in batch)
+        sender.send([(ACK, address) for address in pending])
+
+ENGINES = {
+    'recvfrom': receive_legacy,
+    'recvfrom_into': lambda sock, batch_size: receive_batched(sock, batch_size, False),
+    'recvmmsg': lambda sock, batch_size: receive_batched(sock, batch_size, True),
+}
+
+def run_engine(name: str, total: int, senders: int, batch_size: int):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.bind(('127.0.0.1', 0))
+    set_receive_timeout(sock, IDLE_TIMEOUT)
+    port = sock.getsockname()[1]
+
+    start_event = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=sender, args=(port, total // senders, start_event))
+                 for _ in range(senders)]
+    for process in processes:
+        process.start()
+
+    cpu_start = time.process_time()
+    start_event.set()
+    received = ENGINES[name](sock, batch_size)
+    cpu = time.process_time() - cpu_start
+
+    for process in processes:
+        process.join()
+    sock.close()
+    return received, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched UDP I/O benchmark")
+    parser.add_argument('--datagrams', type=int, default=200_000)
+    parser.add_argument('--senders', type=int, default=4, help="Số process gửi")
+    parser.add_argument('--batch', type=int, default=32, help="Số datagram tối đa mỗi lô")
+    args = parser.parse_args()
+
+    engines = ['recvfrom', 'recvfrom_into'] + (['recvmmsg'] if HAVE_MMSG else [])
+
+    print("BATCHED DATAGRAM I/O BENCHMARK")
+    print("=" * 66)
+    print(f"{'Engine':<14} | {'Received':>10} | {'CPU s':>7} | {'us/datagram':>11} | {'pps/core':>10}")
+    print("-" * 66)
+
+    baseline = None
+    for name in engines:
+        received, cpu = run_engine(name, args.datagrams, args.senders, args.batch)
+        pps = received / cpu if cpu else 0.0
+        baseline = baseline or pps
+        print(f"{name:<14} | {received:>10} | {cpu:>7.2f} | {cpu / max(received, 1) * 1e6:>11.2f} | "
+              f"{pps:>10.0f}  (x{pps / baseline:.1f})")
+
+    print("=" * 66)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark: so sánh chi phí encode/decode và kích thước gói tin
+giữa định dạng JSON và định dạng nhị phân của udp_codec, cùng với đường
+nhận zero-copy parse_datagram (payload là memoryview, không tạo dict/str).
+
+Chạy: python src/bench_codec.py
+"""
+
+import timeit
+
+from udp_codec import (FORMAT_BINARY, FORMAT_JSON, decode_packet, encode_ack, encode_bundle,
+                       parse_datagram)
+
+CASES = [
+    # (số message trong bundle, kích thước mỗi message)
+    (1, 16),
+    (3, 32),
+    (10, 64),
+    (32, 256),
+]
+
+def bench_case(count: int, size: int, number: int):
+    messages = [(seq, 'x' * size) for seq in range(1000, 1000 + count)]
+    row = {}
+    
+    for fmt in (FORMAT_JSON, FORMAT_BINARY):
+        data = encode_bundle(messages, fmt)
+        encode_s = timeit.timeit(lambda: encode_bundle(messages, fmt), number=number)
+        decode_s = timeit.timeit(lambda: decode_packet(data), number=number)
+        row[fmt] = {
+            'bytes': len(data),
+            'encode_us': encode_s / number * 1e6,
+            'decode_us': decode_s / number * 1e6,
+        }
+    return row
+
+def bench_zero_copy(count: int, size: int, number: int):
+    """So sánh decode_packet (bytes -> dict/str) với parse_datagram trên memoryview của buffer nhận"""
+    data = encode_bundle([(seq, 'x' * size) for seq in range(1000, 1000 + count)], FORMAT_BINARY)
+    buffer = bytearray(65535)
+    buffer[:len(data)] = data
+    view = memoryview(buffer)[:len(data)]
+
+    decode_s = timeit.timeit(lambda: decode_packet(bytes(view)), number=number)
+    parse_s = timeit.timeit(lambda: parse_datagram(view), number=number)
+    return decode_s / number * 1e6, parse_s / number * 1e6
+
+def main():
+    number = 20000
+    print("UDP CODEC MICRO-BENCHMARK (JSON vs BINARY)")
+    print("=" * 78)
+    print(f"{'Bundle':>12} | {'Bytes':>13} | {'Encode us':>15} | {'Decode us':>15} | {'Speedup':>7}")
+    print(f"{'msgs x size':>12} | {'json/binary':>13} | {'json/binary':>15} | {'json/binary':>15} | {'enc+dec':>7}")
+    print("-" * 78)
+    
+    for count, size in CASES:
+        row = bench_case(count, size, number)
+        j, b = row[FORMAT_JSON], row[FORMAT_BINARY]
+        speedup = (j['encode_us'] + j['decode_us']) / (b['encode_us'] + b['decode_us'])
+        print(f"{f'{count} x {size}':>12} | {j['bytes']:>6}/{b['bytes']:<6} | "
+              f"{j['encode_us']:>7.2f}/{b['encode_us']:<7.2f} | "
+              f"{j['decode_us']:>7.2f}/{b['decode_us']:<7.2f} | {speedup:>6.2f}x")
+    
+    print("-" * 78)
+    print(f"{'Bundle':>12} | {'decode_packet us':>16} | {'parse_datagram us':>17} | {'Speedup':>7}")
+    for count, size in CASES:
+        decode_us, parse_us = bench_zero_copy(count, size, number)
+        print(f"{f'{count} x {size}':>12} | {decode_us:>16.2f} | {parse_us:>17.2f} | "
+              f"{decode_us / parse_us:>6.2f}x")
+    
+    print("-" * 78)
+    for fmt in (FORMAT_JSON, FORMAT_BINARY):
+        print(f"ACK {fmt:>6} (cum + 2 SACK): {len(encode_ack(12345, [(12350, 12352), (12360, 12360)], 64, fmt))} bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark bộ nhớ cho trạng thái nhận của server UDP.
+
+Đẩy hàng triệu message (có đảo thứ tự trong từng nhóm nhỏ) qua
+OptimizedUDPServer.process_message và so sánh với cách cũ giữ mọi seq đã
+xử lý trong một set. Bộ nhớ được đo bằng tracemalloc tại các mốc: với cửa
+sổ trượt bitmap đường bộ nhớ phải đi ngang, còn set cũ tăng tuyến tính.
+Phần cuối tạo nhiều client rồi cho chúng im lặng để kiểm tra loại bỏ theo TTL.
+
+Chạy: python src/bench_receive_state.py --messages 2000000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from optimized_udp_server import OptimizedUDPServer
+
+CLIENT = ('127.0.0.1', 40000)
+REORDER_SPAN = 32
+
+def reordered_seqs(count: int, seed: int = 1):
+    """Sinh seq 0..count-1, xáo trộn trong từng nhóm REORDER_SPAN để có message vượt thứ tự"""
+    rng = random.Random(seed)
+    for base in range(0, count, REORDER_SPAN):
+        block = list(range(base, min(base + REORDER_SPAN, count)))
+        rng.shuffle(block)
+        yield from block
+
+def checkpoints(count: int):
+    return {count * i // 5 for i in range(1, 6)}
+
+def bench_window(count: int):
+    server = OptimizedUDPServer(port=0, loss_rate=0.0, verbose=False)
+    client_key = server.get_client_key(CLIENT)
+    marks = checkpoints(count)
+    rows = []
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    processed = 0
+    for i, seq in enumerate(reordered_seqs(count), 1):
+        processed += server.process_message(client_key, seq, 'x')
+        if i in marks:
+            rows.append((i, tracemalloc.get_traced_memory()[0]))
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    server.socket.close()
+    assert processed == count
+    return rows, elapsed
+
+def bench_set(count: int):
+    """Cách cũ: một set lưu mọi seq đã xử lý của client"""
+    processed_seqs = set()
+    marks = checkpoints(count)
+    rows = []
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for i, seq in enumerate(reordered_seqs(count), 1):
+        if seq not in processed_seqs:
+            processed_seqs.add(seq)
+        if i in marks:
+            rows.append((i, tracemalloc.get_traced_memory()[0]))
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return rows, elapsed
+
+def bench_eviction(num_clients: int, idle_ttl: float):
+    server = OptimizedUDPServer(port=0, loss_rate=0.0, verbose=False, idle_ttl=idle_ttl)
+    for port in range(num_clients):
+        server.get_client_key(('127.0.0.1', port))
+    before = len(server.sessions)
+    time.sleep(idle_ttl * 1.5)
+    evicted = server.evict_idle_clients(time.monotonic())
+    server.socket.close()
+    return before, evicted, len(server.sessions)
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP receive-state memory benchmark")
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=10_000, help="Số client cho bài kiểm tra TTL")
+    parser.add_argument('--ttl', type=float, default=0.5, help="idle TTL (giây) cho bài kiểm tra TTL")
+    args = parser.parse_args()
+
+    print("RECEIVE STATE MEMORY BENCHMARK")
+    print("=" * 60)
+    print(f"{'Messages':>12} | {'Engine':<14} | {'Memory KB':>12}")
+    print("-" * 60)
+
+    for name, bench in (("set (cũ)", bench_set), ("bitmap window", bench_window)):
+        rows, elapsed = bench(args.messages)
+        for count, memory in rows:
+            print(f"{count:>12} | {name:<14} | {memory / 1024:>12.1f}")
+        print(f"{'':>12} | {name:<14} | {args.messages / elapsed:>9.0f} msg/s")
+        print("-" * 60)
+
+    before, evicted, remaining = bench_eviction(args.clients, args.ttl)
+    print(f"Idle eviction: {before} clients -> evicted {evicted}, còn lại {remaining}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
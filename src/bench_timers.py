@@ -0,0 +1,70 @@
+"""
+Stress benchmark cho cơ chế timer gửi lại.
+
+So sánh cách cũ (mỗi message một threading.Timer, tức một OS thread) với
+TimerWheel (một thread cho tất cả). Với mỗi mức message đang chờ ACK, đo
+số thread đỉnh và CPU time để đặt rồi hủy toàn bộ timer (giống như khi
+ACK về trước khi hết hạn).
+
+Chạy: python src/bench_timers.py
+"""
+
+import threading
+import time
+
+from timer_wheel import TimerWheel
+
+IN_FLIGHT_LEVELS = [100, 1000, 5000]
+TIMEOUT = 1.0
+
+def noop():
+    pass
+
+def bench_threading_timers(count: int):
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    timers = []
+    for _ in range(count):
+        timer = threading.Timer(TIMEOUT, noop)
+        timer.start()
+        timers.append(timer)
+    peak_threads = threading.active_count()
+
+    for timer in timers:
+        timer.cancel()
+    for timer in timers:
+        timer.join()
+    return peak_threads, time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+def bench_timer_wheel(count: int):
+    wheel = TimerWheel()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    handles = [wheel.schedule(TIMEOUT, noop) for _ in range(count)]
+    peak_threads = threading.active_count()
+
+    for handle in handles:
+        handle.cancel()
+    elapsed = (time.process_time() - cpu_start, time.perf_counter() - wall_start)
+    wheel.stop()
+    return (peak_threads,) + elapsed
+
+def main():
+    print("RETRANSMISSION TIMER STRESS BENCHMARK")
+    print("=" * 70)
+    print(f"{'In-flight':>10} | {'Engine':<16} | {'Peak threads':>12} | {'CPU ms':>9} | {'Wall ms':>9}")
+    print("-" * 70)
+
+    for count in IN_FLIGHT_LEVELS:
+        for name, bench in (("threading.Timer", bench_threading_timers),
+                            ("TimerWheel", bench_timer_wheel)):
+            try:
+                threads, cpu_s, wall_s = bench(count)
+            except RuntimeError as e:
+                # Hết tài nguyên tạo thread mới
+                print(f"{count:>10} | {name:<16} | {'FAILED':>12} | {e}")
+                continue
+            print(f"{count:>10} | {name:<16} | {threads:>12} | {cpu_s * 1000:>9.1f} | {wall_s * 1000:>9.1f}")
+
+    print("=" * 70)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Bộ benchmark giao thức UDP tin cậy, tái lập được giữa các commit.
+
+Mỗi kịch bản chạy server và client ở hai process riêng trên loopback
+(server asyncio với port tạm, client asyncio với `clients` phiên chia đều
+số message) và đo:
+
+  - goodput              : Mbit/s payload đã được ACK (không tính header, ACK, gửi lại)
+  - messages_per_s       : số message được ACK mỗi giây
+  - retransmission_ratio : số lần gửi lại / số message
+  - ack_overhead         : ACK datagram mỗi message và bytes ACK / bytes dữ liệu
+  - rtt_us               : phân vị RTT (histogram log-bucket, chỉ mẫu không gửi lại)
+  - delivery_us          : phân vị thời gian từ lần gửi đầu đến ACK, kể cả message gửi lại
+  - fec                  : bytes parity / bytes dữ liệu và số datagram server dựng lại
+  - link_drops           : datagram bị nút cổ chai mô phỏng bỏ vì hàng đợi đầy (--bottleneck-mbps)
+  - kernel_drops         : datagram kernel bỏ vì buffer socket đầy (Linux), server và ACK ở client
+
+Sweep là tích Descartes của các danh sách tham số (số message, kích thước,
+bundle size, loss, số phiên đồng thời, nhóm FEC, pacing, nút cổ chai). Mất gói do server mô phỏng bằng RNG
+có seed nên cùng seed cho cùng chuỗi quyết định. Kết quả ghi ra JSON kèm
+commit hiện tại; --compare đọc một file JSON cũ và báo các kịch bản chậm
+đi quá ngưỡng (exit code 1), dùng để so sánh giữa hai commit. Khi sweep
+có cả FEC tắt (0) và bật, bảng cuối so sánh từng cặp kịch bản: overhead
+băng thông và độ trễ giao nhận tiết kiệm được ở mỗi mức loss. Tương tự,
+khi sweep có cả pacing bật và tắt, bảng cuối so sánh goodput, số datagram bị
+nút cổ chai bỏ, số lần gửi lại và p99 giao nhận của từng cặp. Nút cổ chai
+(--bottleneck-mbps, mỗi phiên một đường) có hàng đợi nông
+BOTTLENECK_QUEUE_DELAY như buffer của switch: burst vượt hàng đợi bị bỏ.
+
+Chạy: python src/bench_udp.py --output bench.json
+      python src/bench_udp.py --quick --compare bench.json
+      python src/bench_udp.py --bundles 4 --loss 0.01,0.05,0.1 --fec 0,4,8
+      python src/bench_udp.py --bundles 1 --loss 0 --bottleneck-mbps 50 --pacing 1,0
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from async_udp import AsyncOptimizedUDPClient, AsyncOptimizedUDPServer, run_session
+from impairment import ImpairmentConfig
+from udp_codec import FORMAT_BINARY, FORMATS
+
+try:
+    from latency_histogram import LatencyHistogram
+except ImportError:
+    # latency_histogram.py chỉ có một bản, ở python/ (dùng chung với bộ benchmark TCP);
+    # có thể chỉ đường bằng PYTHONPATH=python, nếu không thì tự thêm thư mục đó
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+    from latency_histogram import LatencyHistogram
+
+DEFAULT_MESSAGES = [2000]
+DEFAULT_SIZES = [64, 512]
+DEFAULT_BUNDLES = [1, 16]
+DEFAULT_LOSS = [0.0, 0.05]
+DEFAULT_CLIENTS = [1, 8]
+DEFAULT_FEC = [0]
+DEFAULT_PACING = [True]
+DEFAULT_BOTTLENECK = [0.0]
+# Hàng đợi của nút cổ chai mô phỏng (giây truyền), nông như buffer của switch
+BOTTLENECK_QUEUE_DELAY = 0.002
+SERVER_START_TIMEOUT = 10.0
+# Ngưỡng mặc định để --compare coi là chậm đi (phần trăm messages/s)
+REGRESSION_THRESHOLD = 10.0
+
+@dataclass
+class Scenario:
+    messages: int
+    size: int
+    bundle_size: int
+    loss: float
+    clients: int
+    wire_format: str = FORMAT_BINARY
+    seed: int = 1
+    fec_group: int = 0
+    pacing: bool = True
+    bottleneck_mbps: float = 0.0
+
+    @property
+    def key(self) -> str:
+        key = (f"m{self.messages}-s{self.size}-b{self.bundle_size}-l{self.loss:g}"
+               f"-c{self.clients}-{self.wire_format}")
+        if self.fec_group:
+            key += f"-f{self.fec_group}"
+        if self.bottleneck_mbps:
+            key += f"-bn{self.bottleneck_mbps:g}"
+        return key if self.pacing else key + "-nopace"
+
+    def impairment(self, index: int) -> Optional[ImpairmentConfig]:
+        """Nút cổ chai trên chiều dữ liệu của phiên thứ `index` (None nếu không giới hạn)"""
+        if not self.bottleneck_mbps:
+            return None
+        return ImpairmentConfig(seed=self.seed + index, rate_bps=self.bottleneck_mbps * 1e6,
+                                max_queue_delay=BOTTLENECK_QUEUE_DELAY)
+
+def run_bench_server(loss: float, seed: int, port_queue, stop_event, result_queue):
+    """Process server: bind port tạm, báo port về, chạy đến khi stop_event rồi gửi stats"""
+    async def serve():
+        server = AsyncOptimizedUDPServer(host='127.0.0.1', port=0, loss_rate=loss,
+                                         verbose=False, seed=seed)
+        port_queue.put(server.socket.getsockname()[1])
+        serve_task = asyncio.create_task(server.serve(stats_interval=3600))
+        await asyncio.get_running_loop().run_in_executor(None, stop_event.wait)
+        serve_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await serve_task
+        result_queue.put(server.stats_snapshot())
+
+    asyncio.run(serve())
+
+def make_payloads(count: int, size: int, offset: int) -> List[str]:
+    """`count` message ASCII dài đúng `size` bytes, mỗi message khác nhau"""
+    return [f"{offset + i:012d}".ljust(size, 'x')[:size] for i in range(count)]
+
+def run_bench_clients(scenario: Scenario, port: int, timeout: float, result_queue):
+    """Process client: chạy mọi phiên trên một event loop, gửi kết quả về qua queue"""
+    async def run():
+        per_client = scenario.messages // scenario.clients
+        clients = [AsyncOptimizedUDPClient(server_host='127.0.0.1', server_port=port,
+                                           wire_format=scenario.wire_format, verbose=False,
+                                           bundle_size=scenario.bundle_size,
+                                           fec_group=scenario.fec_group, pacing=scenario.pacing,
+                                           impairment=scenario.impairment(i))
+                   for i in range(scenario.clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(client, make_payloads(per_client, scenario.size, i * per_client), timeout)
+            for i, client in enumerate(clients)
+        ))
+        elapsed = time.perf_counter() - start
+
+        rtt = LatencyHistogram(unit='us')
+        delivery = LatencyHistogram(unit='us')
+        totals: Dict[str, int] = {}
+        for client in clients:
+            rtt.merge(client.stats['rtt_histogram'])
+            delivery.merge(client.stats['delivery_histogram'])
+            for key in ('messages_sent', 'messages_acked', 'messages_requeued', 'retransmissions',
+                        'bundles_sent', 'acks_received', 'bytes_sent', 'ack_bytes_received', 'parity_sent',
+                        'parity_bytes', 'fragmented_messages', 'fragments_sent'):
+                totals[key] = totals.get(key, 0) + client.stats[key]
+            totals['paced_sends'] = totals.get('paced_sends', 0) + client.pacer.stats['paced_sends']
+            totals['link_drops'] = totals.get('link_drops', 0) + (client.link.stats['queue_drops']
+                                                                  if client.link else 0)
+            totals['kernel_drops'] = totals.get('kernel_drops', 0) + client.kernel_drops.read()
+        totals['sessions_completed'] = sum(1 for c in clients if not c.unacked_messages)
+        return {'elapsed': elapsed, 'client': totals, 'rtt': rtt.to_dict(),
+                'delivery': delivery.to_dict()}
+
+    result_queue.put(asyncio.run(run()))
+
+def run_scenario(scenario: Scenario, timeout: float) -> dict:
+    """Một lần chạy: server và client ở hai process riêng, trả về số liệu thô"""
+    port_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_bench_server, daemon=True,
+                                     args=(scenario.loss, scenario.seed, port_queue,
+                                           stop_event, result_queue))
+    server.start()
+    port = port_queue.get(timeout=SERVER_START_TIMEOUT)
+
+    client_queue = multiprocessing.Queue()
+    client = multiprocessing.Process(target=run_bench_clients, daemon=True,
+                                     args=(scenario, port, timeout, client_queue))
+    client.start()
+    # Chờ lâu hơn timeout của client một chút: client tự dừng khi hết hạn chờ ACK
+    result = client_queue.get(timeout=timeout + SERVER_START_TIMEOUT)
+    client.join()
+
+    stop_event.set()
+    result['server'] = result_queue.get(timeout=SERVER_START_TIMEOUT)
+    server.join()
+    return result
+
+def compute_metrics(scenario: Scenario, raw: dict) -> dict:
+    client, server = raw['client'], raw['server']
+    elapsed = raw['elapsed']
+    messages = scenario.messages // scenario.clients * scenario.clients
+    # Message lớn hơn một datagram đi thành nhiều mảnh, mỗi mảnh được ACK / gửi lại riêng
+    fragments = (client['fragments_sent'] / client['fragmented_messages']
+                 if client['fragmented_messages'] else 1)
+    acked = (client['messages_acked'] - client['messages_requeued']) / fragments
+    rtt = LatencyHistogram.from_dict(raw['rtt'])
+    delivery = LatencyHistogram.from_dict(raw['delivery'])
+    data_bytes = client['bytes_sent'] - client['parity_bytes']
+    return {
+        'elapsed_s': elapsed,
+        'messages': messages,
+        'messages_acked': acked,
+        'sessions_completed': client['sessions_completed'],
+        'goodput_mbps': acked * scenario.size * 8 / elapsed / 1e6 if elapsed else 0.0,
+        'messages_per_s': acked / elapsed if elapsed else 0.0,
+        'retransmission_ratio': client['retransmissions'] / (messages * fragments) if messages else 0.0,
+        'datagrams_sent': client['bundles_sent'] + client['retransmissions'] + client['parity_sent'],
+        'ack_overhead': {
+            'acks_sent': server.get('acks_sent', 0),
+            'acks_per_message': server.get('acks_sent', 0) / messages if messages else 0.0,
+            'ack_bytes_ratio': (client['ack_bytes_received'] / client['bytes_sent']
+                                if client['bytes_sent'] else 0.0),
+        },
+        'fec': {
+            'parity_sent': client['parity_sent'],
+            'overhead': client['parity_bytes'] / data_bytes if data_bytes else 0.0,
+            'recovered': server.get('fec_recovered', 0),
+        },
+        'paced_sends': client['paced_sends'],
+        'link_drops': client['link_drops'],
+        'kernel_drops': {
+            'server': server.get('kernel_drops', 0),
+            'client_acks': client['kernel_drops'],
+        },
+        'server_packets_lost': server.get('packets_lost', 0),
+        'rtt_us': rtt.summary(),
+        'delivery_us': delivery.summary(),
+    }
+
+def summarize(runs: List[dict]) -> dict:
+    """Trung vị của các lần lặp cho những chỉ số dùng để so sánh"""
+    summary = dict(runs[len(runs) // 2])
+    for key in ('elapsed_s', 'goodput_mbps', 'messages_per_s', 'retransmission_ratio'):
+        summary[key] = statistics.median(run[key] for run in runs)
+    for histogram in ('rtt_us', 'delivery_us'):
+        summary[histogram] = dict(summary[histogram])
+        for pct in ('mean', 'p50', 'p99'):
+            summary[histogram][pct] = statistics.median(run[histogram][pct] for run in runs)
+    return summary
+
+def fec_comparison(results: List[dict]) -> List[dict]:
+    """Ghép mỗi kịch bản có FEC với kịch bản cùng tham số nhưng tắt FEC"""
+    baseline = {entry['key']: entry['summary'] for entry in results if not entry['scenario']['fec_group']}
+    rows = []
+    for entry in results:
+        scenario = entry['scenario']
+        if not scenario['fec_group']:
+            continue
+        base = baseline.get(Scenario(**{**scenario, 'fec_group': 0}).key)
+        if base is None:
+            continue
+        fec = entry['summary']
+        rows.append({
+            'key': entry['key'],
+            'loss': scenario['loss'],
+            'fec_group': scenario['fec_group'],
+            'bandwidth_overhead': fec['fec']['overhead'],
+            'recovered': fec['fec']['recovered'],
+            'retransmissions_saved': round((base['retransmission_ratio'] - fec['retransmission_ratio'])
+                                           * fec['messages']),
+            'delivery_mean_saved_us': base['delivery_us']['mean'] - fec['delivery_us']['mean'],
+            'delivery_p99_saved_us': base['delivery_us']['p99'] - fec['delivery_us']['p99'],
+            'elapsed_saved_s': base['elapsed_s'] - fec['elapsed_s'],
+        })
+    return rows
+
+def print_fec_comparison(rows: List[dict]):
+    print("\nFEC so với không FEC (cùng tham số):")
+    print(f"  {'Scenario':<40} | {'overhead':>8} | {'rebuilt':>7} | {'retx saved':>10} | "
+          f"{'mean ms':>8} | {'p99 ms':>8} | {'elapsed s':>9}")
+    for row in rows:
+        print(f"  {row['key']:<40} | {row['bandwidth_overhead'] * 100:>7.1f}% | {row['recovered']:>7} | "
+              f"{row['retransmissions_saved']:>10} | {row['delivery_mean_saved_us'] / 1000:>+8.2f} | "
+              f"{row['delivery_p99_saved_us'] / 1000:>+8.2f} | {row['elapsed_saved_s']:>+9.2f}")
+
+def pacing_comparison(results: List[dict]) -> List[dict]:
+    """Ghép mỗi kịch bản có pacing với kịch bản cùng tham số nhưng tắt pacing"""
+    unpaced = {entry['key']: entry['summary'] for entry in results if not entry['scenario']['pacing']}
+    rows = []
+    for entry in results:
+        scenario = entry['scenario']
+        if not scenario['pacing']:
+            continue
+        base = unpaced.get(Scenario(**{**scenario, 'pacing': False}).key)
+        if base is None:
+            continue
+        paced = entry['summary']
+        rows.append({
+            'key': entry['key'],
+            'bottleneck_mbps': scenario['bottleneck_mbps'],
+            'goodput_mbps': (paced['goodput_mbps'], base['goodput_mbps']),
+            'link_drops': (paced['link_drops'], base['link_drops']),
+            'retransmissions': (round(paced['retransmission_ratio'] * paced['messages']),
+                                round(base['retransmission_ratio'] * base['messages'])),
+            'delivery_p99_us': (paced['delivery_us']['p99'], base['delivery_us']['p99']),
+        })
+    return rows
+
+def print_pacing_comparison(rows: List[dict]):
+    print("\nPacing so với không pacing (cùng tham số, giá trị có / không pacing):")
+    print(f"  {'Scenario':<40} | {'Mbit/s':>15} | {'link drops':>13} | {'retx':>13} | {'dlv p99 ms':>17}")
+    for row in rows:
+        print(f"  {row['key']:<40} | {row['goodput_mbps'][0]:>7.2f}/{row['goodput_mbps'][1]:<7.2f} | "
+              f"{row['link_drops'][0]:>6}/{row['link_drops'][1]:<6} | "
+              f"{row['retransmissions'][0]:>6}/{row['retransmissions'][1]:<6} | "
+              f"{row['delivery_p99_us'][0] / 1000:>8.2f}/{row['delivery_p99_us'][1] / 1000:<8.2f}")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> int:
+    """In chênh lệch so với file JSON cũ, trả về số kịch bản chậm đi quá ngưỡng"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {entry['key']: entry['summary'] for entry in baseline['results']}
+
+    print(f"\nSo với {baseline_path} (commit {baseline.get('commit') or '?'}):")
+    regressions = 0
+    for entry in results:
+        old = previous.get(entry['key'])
+        if not old or not old['messages_per_s']:
+            continue
+        new = entry['summary']
+        change = (new['messages_per_s'] / old['messages_per_s'] - 1) * 100
+        p99_change = new['rtt_us']['p99'] - old['rtt_us']['p99']
+        flag = ''
+        if change < -threshold:
+            regressions += 1
+            flag = '  <-- CHẬM ĐI'
+        print(f"  {entry['key']:<40} msgs/s {change:+6.1f}%  p99 RTT {p99_change / 1000:+8.3f} ms{flag}")
+    return regressions
+
+def print_row(key: str, summary: dict):
+    print(f"{key:<40} | {summary['messages_per_s']:>9.0f} | {summary['goodput_mbps']:>8.2f} | "
+          f"{summary['retransmission_ratio']:>6.3f} | {summary['ack_overhead']['acks_per_message']:>6.3f} | "
+          f"{summary['rtt_us']['p50'] / 1000:>7.3f} | {summary['rtt_us']['p99'] / 1000:>7.3f} | "
+          f"{summary['delivery_us']['p99'] / 1000:>8.3f}")
+
+def parse_list(kind):
+    return lambda text: [kind(item) for item in text.split(',') if item]
+
+def parse_flag(text: str) -> bool:
+    return text.strip().lower() not in ('0', 'false', 'off', 'no')
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Reproducible UDP protocol benchmark")
+    parser.add_argument('--messages', type=parse_list(int), default=DEFAULT_MESSAGES,
+                        help="Tổng số message mỗi kịch bản (danh sách, phân cách bằng dấu phẩy)")
+    parser.add_argument('--sizes', type=parse_list(int), default=DEFAULT_SIZES, help="Kích thước message (bytes)")
+    parser.add_argument('--bundles', type=parse_list(int), default=DEFAULT_BUNDLES,
+                        help="Số message tối đa mỗi bundle")
+    parser.add_argument('--loss', type=parse_list(float), default=DEFAULT_LOSS, help="Tỉ lệ mất gói mô phỏng")
+    parser.add_argument('--clients', type=parse_list(int), default=DEFAULT_CLIENTS,
+                        help="Số phiên đồng thời")
+    parser.add_argument('--fec', type=parse_list(int), default=DEFAULT_FEC,
+                        help="Số bundle mỗi nhóm FEC (0 = tắt), ví dụ 0,4,8")
+    parser.add_argument('--pacing', type=parse_list(parse_flag), default=DEFAULT_PACING,
+                        help="Bật/tắt pacing phía gửi, ví dụ 1,0 để so sánh")
+    parser.add_argument('--bottleneck-mbps', type=parse_list(float), default=DEFAULT_BOTTLENECK,
+                        help="Băng thông nút cổ chai mô phỏng mỗi phiên (Mbit/s, 0 = không giới hạn)")
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_BINARY)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help="Số lần chạy mỗi kịch bản (lấy trung vị)")
+    parser.add_argument('--timeout', type=float, default=60.0, help="Thời gian chờ ACK tối đa mỗi lần chạy")
+    parser.add_argument('--quick', action='store_true', help="Một kịch bản nhỏ để kiểm tra nhanh")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    parser.add_argument('--compare', help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Phần trăm messages/s giảm được coi là chậm đi")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.messages, args.sizes, args.bundles, args.loss, args.clients = [500], [64], [16], [0.05], [4]
+
+    scenarios = [Scenario(messages, size, bundle_size, loss, clients, args.format, args.seed, fec_group,
+                          pacing, bottleneck)
+                 for messages, size, bundle_size, loss, clients, fec_group, bottleneck, pacing in itertools.product(
+                     args.messages, args.sizes, args.bundles, args.loss, args.clients, args.fec,
+                     args.bottleneck_mbps, args.pacing)]
+
+    print(f"UDP PROTOCOL BENCHMARK ({len(scenarios)} kịch bản x {args.repeat} lần)")
+    print("=" * 115)
+    print(f"{'Scenario':<40} | {'msgs/s':>9} | {'Mbit/s':>8} | {'retx':>6} | {'ack/m':>6} | "
+          f"{'p50 ms':>7} | {'p99 ms':>7} | {'dlv p99':>8}")
+    print("-" * 115)
+
+    results = []
+    for scenario in scenarios:
+        runs = [compute_metrics(scenario, run_scenario(scenario, args.timeout))
+                for _ in range(args.repeat)]
+        summary = summarize(runs)
+        results.append({'key': scenario.key, 'scenario': asdict(scenario),
+                        'summary': summary, 'runs': runs})
+        print_row(scenario.key, summary)
+    print("=" * 115)
+
+    comparison = fec_comparison(results)
+    if comparison:
+        print_fec_comparison(comparison)
+    paced = pacing_comparison(results)
+    if paced:
+        print_pacing_comparison(paced)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'fec_comparison': comparison,
+        'pacing_comparison': paced,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Đã ghi kết quả vào {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Điều khiển tắc nghẽn (congestion control) cho client UDP, tính theo số message.
+
+  - Slow start : cwnd < ssthresh, mỗi message được ACK tăng cwnd thêm 1
+                 (cwnd gấp đôi sau mỗi RTT)
+  - Congestion avoidance: cwnd >= ssthresh, cwnd tăng khoảng 1 mỗi RTT
+  - AIMD khi mất gói: timeout gửi lại là tín hiệu mất gói, ssthresh = cwnd/2
+    và cwnd = ssthresh; nhiều timeout trong cùng một RTT chỉ giảm một lần
+
+Cửa sổ gửi thực tế là min(cwnd, rwnd), trong đó rwnd là cửa sổ nhận do
+server quảng bá trong mỗi ACK (flow control).
+"""
+
+INITIAL_CWND = 4.0
+INITIAL_SSTHRESH = 64.0
+MIN_CWND = 1.0
+MAX_CWND = 4096.0
+INITIAL_RWND = 64
+
+class CongestionController:
+    def __init__(self, initial_cwnd: float = INITIAL_CWND, ssthresh: float = INITIAL_SSTHRESH,
+                 max_cwnd: float = MAX_CWND):
+        self.cwnd = initial_cwnd
+        self.ssthresh = ssthresh
+        self.max_cwnd = max_cwnd
+        self.rwnd = INITIAL_RWND
+        self.last_reduction = 0.0
+        self.loss_events = 0
+
+    def on_ack(self, acked_count: int, rwnd: int = None):
+        """Mở rộng cwnd theo số message vừa được ACK, cập nhật rwnd từ server"""
+        if rwnd is not None:
+            self.rwnd = rwnd
+        if acked_count <= 0:
+            return
+
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked_count
+        else:
+            self.cwnd += acked_count / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_cwnd)
+
+    def on_loss(self, now: float, rtt: float):
+        """Giảm nhân (multiplicative decrease), tối đa một lần mỗi RTT"""
+        if now - self.last_reduction < rtt:
+            return
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = self.ssthresh
+        self.last_reduction = now
+        self.loss_events += 1
+
+    def window(self) -> int:
+        """Số message tối đa được phép đang bay (chưa ACK)"""
+        return max(1, int(min(self.cwnd, self.rwnd)))
+
+    def snapshot(self) -> dict:
+        return {
+            'cwnd': self.cwnd,
+            'ssthresh': self.ssthresh,
+            'rwnd': self.rwnd,
+            'loss_events': self.loss_events,
+        }
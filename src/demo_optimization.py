@@ -1,39 +1,32 @@
-import threading
-import time
-from optimized_udp_server import OptimizedUDPServer
-from optimized_udp_client import OptimizedUDPClient
+"""
+Demo tổng hợp các kỹ thuật tối ưu hóa UDP, chạy bằng bộ benchmark bench_udp.
 
-def run_demo():
-    """Chạy demo đầy đủ các kỹ thuật tối ưu hóa"""
-    
+Thay cho bản cũ (một server thread, tám chuỗi cố định rồi sleep, không đo gì),
+demo chạy một sweep nhỏ của bench_udp: server và client ở hai process riêng
+trên loopback, so sánh bundling (1 vs 16 message mỗi datagram), mất gói (0 vs
+5%) và FEC (tắt vs nhóm 4 bundle), in bảng goodput / tỉ lệ gửi lại / RTT.
+Tham số dòng lệnh thêm vào được chuyển tiếp cho bench_udp và ghi đè sweep mặc
+định, ví dụ --output demo.json. Sweep đầy đủ dùng thẳng bench_udp.py.
+
+Chạy: python src/demo_optimization.py
+"""
+
+import sys
+from typing import List
+
+import bench_udp
+
+DEMO_ARGS = ['--messages', '1000', '--sizes', '64', '--bundles', '1,16', '--loss', '0,0.05',
+             '--clients', '4', '--fec', '0,4']
+
+def run_demo(extra_args: List[str] = ()):
+    """Chạy sweep demo của bench_udp (extra_args ghi đè tham số mặc định)"""
     print("UDP PROTOCOL OPTIMIZATION DEMO")
     print("=" * 60)
     print("Môn: Lập trình Mạng - Elearning Project")
+    print("Bundling, ACK tích lũy + SACK, RTO thích ứng, gửi lại chọn lọc, FEC")
     print("=" * 60)
-    
-    # Khởi động server trong thread riêng
-    server = OptimizedUDPServer(port=8888)
-    server_thread = threading.Thread(target=server.start, daemon=True)
-    server_thread.start()
-    
-    # Chờ server khởi động
-    time.sleep(2)
-    
-    print("\nBAT DAU DEMO CLIENT")
-    print("-" * 40)
-    
-    # Khởi động client
-    client = OptimizedUDPClient(server_port=8888)
-    client.start_demo()
-    
-    print("\nKET THUC DEMO!")
-    print("Các kỹ thuật đã được minh họa:")
-    print("  Packet Bundling")
-    print("  Selective Retransmission") 
-    print("  ACK-based Reliability")
-    print("  Loss Detection & Handling")
-    print("  Sequence Numbering")
-    print("  Duplicate Prevention")
+    bench_udp.main(DEMO_ARGS + list(extra_args))
 
 if __name__ == "__main__":
-    run_demo()
+    run_demo(sys.argv[1:])
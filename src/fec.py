@@ -0,0 +1,85 @@
+"""
+Forward error correction bằng XOR parity cho giao thức bundle UDP.
+
+Client gom k datagram dữ liệu liên tiếp thành một nhóm và gửi thêm một gói
+parity = XOR của cả nhóm (các datagram được đệm 0 đến độ dài lớn nhất).
+Server giữ bản sao các datagram FEC vừa nhận; khi gói parity đến mà nhóm
+thiếu đúng một datagram, datagram đó được dựng lại ngay bằng XOR parity với
+các thành viên còn lại, không phải chờ RTO của client:
+
+    mất = parity ^ d1 ^ ... ^ d(k-1)
+
+Chi phí băng thông là một datagram trên mỗi k datagram (~1/k). XOR chỉ
+sửa được một datagram mất mỗi nhóm; mất từ hai trở lên thì vẫn dựa vào gửi
+lại như thường. Mã Reed-Solomon sửa được nhiều hơn nhưng số học trên GF(2^8)
+thuần Python chậm hơn hẳn một phép XOR số nguyên lớn, nên không dùng ở đây.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from udp_codec import encode_parity
+
+# Số datagram FEC tối đa server giữ lại cho mỗi client chờ gói parity
+FEC_HISTORY = 64
+
+def xor_datagrams(datagrams, length: int) -> int:
+    """XOR các datagram (đệm 0 bên phải đến `length` bytes) dưới dạng một số nguyên"""
+    result = 0
+    for data in datagrams:
+        result ^= int.from_bytes(bytes(data).ljust(length, b'\0'), 'big')
+    return result
+
+class FecEncoder:
+    """Phía gửi: gom datagram theo nhóm k, trả về gói parity khi nhóm đủ"""
+
+    def __init__(self, group_size: int):
+        if group_size < 1:
+            raise ValueError("group_size phải >= 1")
+        self.group_size = group_size
+        self.members: List[Tuple[int, bytes]] = []
+
+    def add(self, first_seq: int, datagram: bytes, connection_id: int = 0) -> Optional[bytes]:
+        """Thêm một datagram dữ liệu (nhận diện bằng seq đầu tiên), trả về parity khi đủ nhóm"""
+        self.members.append((first_seq, datagram))
+        if len(self.members) >= self.group_size:
+            return self.flush(connection_id)
+        return None
+
+    def flush(self, connection_id: int = 0) -> Optional[bytes]:
+        """Parity cho nhóm hiện tại dù chưa đủ k datagram (gọi khi hết dữ liệu để gửi)"""
+        if not self.members:
+            return None
+        length = max(len(data) for _, data in self.members)
+        parity = xor_datagrams((data for _, data in self.members), length).to_bytes(length, 'big')
+        packet = encode_parity([(first_seq, len(data)) for first_seq, data in self.members], parity,
+                               connection_id)
+        self.members = []
+        return packet
+
+class FecDecoder:
+    """Phía nhận: giữ các datagram FEC gần nhất của một client để dựng lại datagram mất"""
+
+    def __init__(self, history: int = FEC_HISTORY):
+        self.history = history
+        # first_seq -> bytes, dict giữ thứ tự chèn nên phần tử đầu là cũ nhất
+        self.received: Dict[int, bytes] = {}
+
+    def store(self, first_seq: int, datagram):
+        """Lưu bản sao một datagram FEC (buffer nhận gốc sẽ bị ghi đè ở lô sau)"""
+        self.received[first_seq] = bytes(datagram)
+        if len(self.received) > self.history:
+            del self.received[next(iter(self.received))]
+
+    def recover(self, members: List[Tuple[int, int]], parity) -> Optional[bytes]:
+        """Datagram bị mất nếu nhóm thiếu đúng một thành viên, ngược lại None
+
+        Các thành viên của nhóm được bỏ khỏi bộ nhớ: parity chỉ dùng được một lần.
+        """
+        missing = [(first_seq, length) for first_seq, length in members if first_seq not in self.received]
+        present = [self.received.pop(first_seq) for first_seq, _ in members if first_seq in self.received]
+        if len(missing) != 1:
+            return None
+
+        length = len(parity)
+        recovered = int.from_bytes(parity, 'big') ^ xor_datagrams(present, length)
+        return recovered.to_bytes(length, 'big')[:missing[0][1]]
@@ -0,0 +1,216 @@
+"""
+Bộ mô phỏng suy hao mạng (network impairment) có seed, chạy ngay trong process.
+
+Mỗi endpoint bọc đường gửi của socket bằng một ImpairedLink; mọi datagram đi
+qua NetworkImpairment để quyết định số phận của nó:
+
+  - loss       : mất gói Bernoulli với xác suất `loss`
+  - burst      : mất gói theo chùm Gilbert-Elliott, hai trạng thái good/bad,
+                 chuyển good -> bad với xác suất burst_p, bad -> good với burst_r;
+                 ở trạng thái bad gói mất với xác suất burst_loss
+  - delay      : trễ cố định + jitter ngẫu nhiên trong [0, jitter)
+  - reorder    : với xác suất `reorder` gói bị giữ thêm reorder_delay giây để
+                 các gói sau vượt lên trước
+  - duplicate  : với xác suất `duplicate` gói được gửi thêm một bản sao
+  - rate_bps   : giới hạn băng thông, gói xếp hàng theo thời gian truyền
+                 (bytes * 8 / rate); hàng đợi dài quá max_queue_delay thì tail-drop
+
+Mọi quyết định dùng random.Random(seed) riêng và chỉ phụ thuộc thứ tự gói,
+nên cùng seed cho cùng chuỗi mất / trùng / đảo thứ tự giữa các lần chạy
+(riêng hàng đợi băng thông phụ thuộc thời gian gửi thực tế).
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+@dataclass
+class ImpairmentConfig:
+    seed: Optional[int] = None
+    loss: float = 0.0
+    burst_p: float = 0.0
+    burst_r: float = 0.5
+    burst_loss: float = 1.0
+    delay: float = 0.0
+    jitter: float = 0.0
+    reorder: float = 0.0
+    reorder_delay: float = 0.002
+    duplicate: float = 0.0
+    rate_bps: float = 0.0
+    max_queue_delay: float = 0.1
+
+    def is_active(self) -> bool:
+        return any((self.loss, self.burst_p, self.delay, self.jitter, self.reorder,
+                    self.duplicate, self.rate_bps))
+
+class NetworkImpairment:
+    """Quyết định số phận từng datagram, không làm I/O"""
+
+    def __init__(self, config: ImpairmentConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.bad_state = False
+        # Thời điểm đường truyền (giới hạn băng thông) rảnh trở lại
+        self.link_free_at = 0.0
+        self.stats = {
+            'datagrams': 0,
+            'lost': 0,
+            'burst_lost': 0,
+            'queue_drops': 0,
+            'duplicated': 0,
+            'reordered': 0,
+            'delayed': 0,
+        }
+
+    def is_lost(self) -> bool:
+        """Mất gói Bernoulli hoặc Gilbert-Elliott (khi burst_p > 0)"""
+        config = self.config
+        if config.burst_p > 0:
+            if self.bad_state:
+                if self.rng.random() < config.burst_r:
+                    self.bad_state = False
+            elif self.rng.random() < config.burst_p:
+                self.bad_state = True
+            if self.bad_state:
+                if self.rng.random() < config.burst_loss:
+                    self.stats['burst_lost'] += 1
+                    return True
+                return False
+        return self.rng.random() < config.loss
+
+    def plan(self, nbytes: int, now: Optional[float] = None) -> List[float]:
+        """Trả về độ trễ (giây) cho mỗi bản sao cần gửi; danh sách rỗng nghĩa là gói bị mất"""
+        config = self.config
+        self.stats['datagrams'] += 1
+
+        if self.is_lost():
+            self.stats['lost'] += 1
+            return []
+
+        delay = config.delay
+        if config.jitter:
+            delay += self.rng.random() * config.jitter
+        if config.reorder and self.rng.random() < config.reorder:
+            delay += config.reorder_delay
+            self.stats['reordered'] += 1
+
+        if config.rate_bps:
+            now = time.monotonic() if now is None else now
+            start = max(now, self.link_free_at)
+            if start - now > config.max_queue_delay:
+                self.stats['queue_drops'] += 1
+                return []
+            self.link_free_at = start + nbytes * 8 / config.rate_bps
+            delay += self.link_free_at - now
+
+        delays = [delay]
+        if config.duplicate and self.rng.random() < config.duplicate:
+            delays.append(delay)
+            self.stats['duplicated'] += 1
+        if delay > 0:
+            self.stats['delayed'] += 1
+        return delays
+
+class DelayLine:
+    """Một thread gửi các datagram bị trễ đúng hạn (heap theo thời điểm đến hạn)"""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='delay-line', daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay: float, callback: Callable, *args):
+        with self.condition:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.counter), callback, args))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.heap or self.heap[0][0] > time.monotonic()):
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                _, _, callback, args = heapq.heappop(self.heap)
+            try:
+                callback(*args)
+            except OSError:
+                pass
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+class ImpairedLink:
+    """Bọc hàm gửi thật: send(data, *args) đi qua NetworkImpairment rồi mới tới send_fn"""
+
+    def __init__(self, config: ImpairmentConfig, send_fn: Callable, schedule: Optional[Callable] = None):
+        self.impairment = NetworkImpairment(config)
+        self.send_fn = send_fn
+        self.delay_line = None
+        if schedule is None:
+            self.delay_line = DelayLine()
+            schedule = self.delay_line.schedule
+        self.schedule = schedule
+        # Gửi có thể đến từ nhiều thread (vòng nhận, timer, handler)
+        self.lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        return self.impairment.stats
+
+    def send(self, data: bytes, *args):
+        with self.lock:
+            delays = self.impairment.plan(len(data))
+        for delay in delays:
+            if delay > 0:
+                self.schedule(delay, self.send_fn, data, *args)
+            else:
+                self.send_fn(data, *args)
+
+    def close(self):
+        if self.delay_line:
+            self.delay_line.stop()
+
+def format_impairment_stats(stats: dict) -> str:
+    return (f"{stats['datagrams']} datagrams, mất {stats['lost']} (burst {stats['burst_lost']}), "
+            f"tràn hàng đợi {stats['queue_drops']}, trùng {stats['duplicated']}, "
+            f"đảo thứ tự {stats['reordered']}, trễ {stats['delayed']}")
+
+def add_impairment_arguments(parser: argparse.ArgumentParser):
+    """Thêm các tham số dòng lệnh của bộ mô phỏng suy hao (dùng chung --loss của CLI)"""
+    group = parser.add_argument_group("network impairment")
+    group.add_argument('--seed', type=int, default=None, help="Seed cho mọi quyết định ngẫu nhiên")
+    group.add_argument('--burst-p', type=float, default=0.0,
+                       help="Gilbert-Elliott: xác suất chuyển good -> bad")
+    group.add_argument('--burst-r', type=float, default=0.5,
+                       help="Gilbert-Elliott: xác suất chuyển bad -> good")
+    group.add_argument('--delay-ms', type=float, default=0.0, help="Trễ cố định mỗi datagram")
+    group.add_argument('--jitter-ms', type=float, default=0.0, help="Jitter ngẫu nhiên thêm vào trễ")
+    group.add_argument('--reorder', type=float, default=0.0, help="Xác suất một datagram bị đảo thứ tự")
+    group.add_argument('--duplicate', type=float, default=0.0, help="Xác suất một datagram bị nhân đôi")
+    group.add_argument('--rate-mbps', type=float, default=0.0, help="Giới hạn băng thông (0 = không giới hạn)")
+    group.add_argument('--ack-loss', type=float, default=0.0, help="Tỉ lệ mất gói chiều ACK (server -> client)")
+
+def impairment_from_args(args) -> Tuple[Optional[ImpairmentConfig], Optional[ImpairmentConfig]]:
+    """(suy hao chiều dữ liệu, suy hao chiều ACK), None cho chiều không có suy hao"""
+    data = ImpairmentConfig(
+        seed=args.seed, loss=args.loss, burst_p=args.burst_p, burst_r=args.burst_r,
+        delay=args.delay_ms / 1000, jitter=args.jitter_ms / 1000, reorder=args.reorder,
+        duplicate=args.duplicate, rate_bps=args.rate_mbps * 1_000_000)
+    ack = None
+    if args.ack_loss:
+        # Seed khác chiều dữ liệu để hai chiều không mất gói đồng bộ
+        ack = ImpairmentConfig(seed=None if args.seed is None else args.seed + 1_000_003,
+                               loss=args.ack_loss)
+    return (data if data.is_active() else None), ack
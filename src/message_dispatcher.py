@@ -0,0 +1,113 @@
+"""
+Chuyển message đã sắp thứ tự từ vòng nhận của server sang handler của ứng dụng.
+
+Vòng nhận chỉ đẩy message vào hàng đợi rồi quay lại đọc socket ngay; handler
+chạy trên một pool riêng nên công việc nặng không chặn việc nhận gói:
+
+  - thread  : mỗi shard một thread gọi handler trực tiếp (hợp với I/O, C ext)
+  - process : mỗi shard một thread chuyển message sang ProcessPoolExecutor
+              (hợp với việc nặng CPU; handler phải pickle được)
+
+Mỗi stream của một client được băm cố định vào một shard và mỗi shard xử lý
+tuần tự, nên message của cùng một stream luôn đến handler theo đúng thứ tự;
+các stream khác nhau có thể rơi vào shard khác nhau và chạy song song, một
+handler chậm ở stream dữ liệu lớn không làm trễ stream cần độ trễ thấp.
+Hàng đợi có giới hạn: server hỏi free_slots()/backlog() để thu nhỏ cửa sổ
+nhận quảng bá cho client (backpressure) thay vì chặn vòng nhận; on_progress
+được gọi (từ thread của shard) sau mỗi message để server báo cửa sổ mở lại.
+"""
+
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+MODE_THREAD = 'thread'
+MODE_PROCESS = 'process'
+MODES = (MODE_THREAD, MODE_PROCESS)
+
+DEFAULT_WORKERS = 4
+DEFAULT_CAPACITY = 4096
+
+class MessageDispatcher:
+    def __init__(self, handler: Callable, workers: int = DEFAULT_WORKERS,
+                 capacity: int = DEFAULT_CAPACITY, mode: str = MODE_THREAD):
+        if mode not in MODES:
+            raise ValueError(f"mode phải là một trong {MODES}")
+        self.handler = handler
+        self.capacity = capacity
+        self.mode = mode
+        self.executor = ProcessPoolExecutor(max_workers=workers) if mode == MODE_PROCESS else None
+        # on_progress(client_key) sau mỗi message xử lý xong, chạy trên thread của shard
+        self.on_progress: Optional[Callable] = None
+
+        self.lock = threading.Lock()
+        self.pending = 0
+        # Số message đang chờ handler của từng client
+        self.client_backlog: Dict[object, int] = {}
+        self.stats = {
+            'dispatched': 0,
+            'completed': 0,
+            'handler_errors': 0,
+            'peak_backlog': 0,
+        }
+
+        self.shards = [queue.SimpleQueue() for _ in range(workers)]
+        self.threads = [threading.Thread(target=self._run_shard, args=(shard,),
+                                         name=f'udp-handler-{i}', daemon=True)
+                        for i, shard in enumerate(self.shards)]
+        for thread in self.threads:
+            thread.start()
+
+    def free_slots(self) -> int:
+        """Số message hàng đợi còn nhận được"""
+        return max(0, self.capacity - self.pending)
+
+    def backlog(self, client_key) -> int:
+        """Số message của client đã nhận nhưng handler chưa xử lý xong"""
+        return self.client_backlog.get(client_key, 0)
+
+    def submit(self, client_key, stream_id: int, seq: int, payload: bytes):
+        """Đưa một message (đã theo thứ tự) vào shard của stream, không bao giờ chặn"""
+        with self.lock:
+            self.pending += 1
+            self.client_backlog[client_key] = self.client_backlog.get(client_key, 0) + 1
+            self.stats['dispatched'] += 1
+            self.stats['peak_backlog'] = max(self.stats['peak_backlog'], self.pending)
+        self.shards[hash((client_key, stream_id)) % len(self.shards)].put((client_key, stream_id, seq, payload))
+
+    def _run_shard(self, shard: queue.SimpleQueue):
+        while True:
+            item = shard.get()
+            if item is None:
+                return
+            client_key, stream_id, seq, payload = item
+            try:
+                if self.executor:
+                    self.executor.submit(self.handler, client_key, stream_id, seq, payload).result()
+                else:
+                    self.handler(client_key, stream_id, seq, payload)
+            except Exception as e:
+                self.stats['handler_errors'] += 1
+                print(f"Lỗi handler seq={seq} từ {client_key}: {e}")
+
+            with self.lock:
+                self.pending -= 1
+                self.stats['completed'] += 1
+                remaining = self.client_backlog[client_key] - 1
+                if remaining:
+                    self.client_backlog[client_key] = remaining
+                else:
+                    del self.client_backlog[client_key]
+            if self.on_progress:
+                self.on_progress(client_key)
+
+    def close(self, wait: bool = True):
+        """Dừng các shard sau khi xử lý hết message đã nhận"""
+        for shard in self.shards:
+            shard.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        if self.executor:
+            self.executor.shutdown(wait=wait)
@@ -1,130 +1,484 @@
+import os
+import secrets
 import socket
+import sys
 import time
-import json
 import threading
 import asyncio
-from typing import Dict, List
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple, Union
+from dataclasses import dataclass, field
+
+from congestion import CongestionController
+from fec import FecEncoder
+from impairment import (ImpairedLink, ImpairmentConfig, add_impairment_arguments,
+                        format_impairment_stats, impairment_from_args)
+from pacing import Pacer
+from reassembly import split_message
+from rto_estimator import RtoEstimator
+from socket_buffers import (DEFAULT_BANDWIDTH_BPS, DEFAULT_RTT, MIN_BUFFER, KernelDropCounter,
+                            add_buffer_arguments, buffer_size, format_buffers, tune_buffers)
+from timer_wheel import TimerHandle, TimerWheel
+from udp_bundler import DEFAULT_MAX_COUNT, DEFAULT_MAX_DATAGRAM, DEFAULT_MAX_DELAY, Bundler
+from udp_codec import (CodecError, DEFAULT_STREAM, FORMAT_BINARY, FORMATS, MAX_STREAM_ID, STREAM_UNORDERED,
+                       decode_packet, encode_bundle, encode_hello, encode_response, encode_single,
+                       fragment_payload_size, stream_fields)
+
+try:
+    from latency_histogram import LatencyHistogram
+except ImportError:
+    # latency_histogram.py chỉ có một bản, ở python/ (dùng chung với bộ benchmark TCP);
+    # có thể chỉ đường bằng PYTHONPATH=python, nếu không thì tự thêm thư mục đó
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+    from latency_histogram import LatencyHistogram
+
+MAX_RETRIES = 8
+# Tick nhỏ hơn MIN_RTO để timer gửi lại có độ phân giải mili giây
+TIMER_TICK = 0.005
+# Chu kỳ kiểm tra lại cửa sổ gửi khi cửa sổ đầy
+WINDOW_POLL_INTERVAL = 0.001
 
 @dataclass
 class SentMessage:
     seq: int
-    content: str
+    # Chuỗi, bytes hoặc memoryview (mảnh của một message lớn)
+    content: Union[str, bytes, memoryview]
     timestamp: float
+    # Thời điểm gửi gần nhất (cập nhật khi gửi lại), dùng để đo RTT
+    sent_at: float = 0.0
+    # Lần gửi đầu tiên, để đo độ trễ giao nhận kể cả khi phải gửi lại
+    first_sent_at: float = 0.0
     retries: int = 0
     acked: bool = False
+    timer: Optional[TimerHandle] = field(default=None, repr=False, compare=False)
+    # Stream ID trên dây (kèm bit STREAM_UNORDERED) và số thứ tự riêng trong stream
+    stream: int = DEFAULT_STREAM
+    stream_seq: int = 0
+    # (index, count, total) khi message là một mảnh của message lớn hơn một datagram
+    fragment: Optional[Tuple[int, int, int]] = None
+
+    @property
+    def stream_fields(self) -> Optional[Tuple[int, int]]:
+        """(stream, stream_seq) cần ghi lên dây, None nếu là stream mặc định với stream_seq = seq"""
+        return stream_fields(self.seq, self.stream, self.stream_seq)
 
 class OptimizedUDPClient:
-    def __init__(self, server_host='localhost', server_port=8888):
+    def __init__(self, server_host='localhost', server_port=8888, wire_format=FORMAT_BINARY,
+                 verbose=True, max_datagram=DEFAULT_MAX_DATAGRAM, bundle_size=DEFAULT_MAX_COUNT,
+                 max_delay=DEFAULT_MAX_DELAY, impairment: Optional[ImpairmentConfig] = None,
+                 fec_group: int = 0, use_connection_id: bool = True, pacing: bool = True,
+                 max_rate_bps: float = 0.0, bandwidth_bps: float = DEFAULT_BANDWIDTH_BPS,
+                 rtt: float = DEFAULT_RTT):
+        if wire_format not in FORMATS:
+            raise ValueError(f"wire_format phải là một trong {FORMATS}")
+        if fec_group and wire_format != FORMAT_BINARY:
+            raise ValueError("FEC chỉ hỗ trợ định dạng binary")
         self.server_addr = (server_host, server_port)
+        self.wire_format = wire_format
+        self.verbose = verbose
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.socket.settimeout(1.0)
+        # Buffer gửi theo BDP của tốc độ gửi tối đa (bandwidth_bps=0: giữ mặc định OS); chiều nhận chỉ mang ACK
+        send_rate = max_rate_bps or bandwidth_bps
+        self.buffers = (tune_buffers(self.socket, MIN_BUFFER, buffer_size(send_rate, rtt))
+                        if bandwidth_bps else tune_buffers(self.socket))
+        # ACK kernel bỏ vì buffer nhận đầy (không tính vào mất gói mô phỏng)
+        self.kernel_drops = KernelDropCounter(self.socket)
         
         # Quản lý messages chưa được ACK
         self.unacked_messages: Dict[int, SentMessage] = {}
+        # Message mới chỉ được SACK: server còn giữ trong buffer sắp xếp lại, chưa giao cho
+        # ứng dụng, nên được giữ đến khi ACK tích lũy vượt qua để gửi lại nếu server mất phiên
+        self.sacked: Dict[int, SentMessage] = {}
         self.sequence_num = 0
-        self.bundle_size = 3
+        # Seq nhỏ nhất chưa từng gửi (message gửi theo thứ tự seq, bundler có thể còn giữ vài seq)
+        self.next_send_seq = 0
+        self.bundle_size = bundle_size
+        
+        # Stream: stream_seq kế tiếp của mỗi stream đã mở, stream_seq nhỏ nhất chưa từng gửi
+        # (để báo server trong HELLO khi bắt tay lại) và các stream giao không theo thứ tự
+        self.stream_seqs: Dict[int, int] = {DEFAULT_STREAM: 0}
+        self.stream_sent: Dict[int, int] = {}
+        self.unordered_streams: Set[int] = set()
+        # Giữ thứ tự gửi theo seq khi nhiều stream cùng gửi (tạo trong event loop, xem send_within_window)
+        self.send_lock: Optional[asyncio.Lock] = None
+        
+        # Bundling theo ngân sách byte: flush khi đầy MTU, đủ số lượng hoặc quá hạn chờ
+        self.bundler = Bundler(max_datagram=max_datagram, max_count=bundle_size,
+                               max_delay=max_delay, wire_format=wire_format)
+        # Timer flush bundle đang mở khi quá max_delay (loop.call_later, đặt khi bundle nhận
+        # message đầu tiên) và task đang gửi bundle quá hạn
+        self.bundle_deadline: Optional[asyncio.TimerHandle] = None
+        self.deadline_tasks: Set[asyncio.Task] = set()
+        # Message lớn hơn một datagram được cắt thành mảnh có ACK / gửi lại riêng
+        # (chỉ định dạng binary; bản JSON vẫn gửi nguyên và để tầng IP phân mảnh)
+        self.max_fragment = fragment_payload_size(max_datagram) if wire_format == FORMAT_BINARY else 0
+        
+        # FEC: một gói XOR parity sau mỗi fec_group bundle, server tự dựng lại một bundle mất
+        self.fec = FecEncoder(fec_group) if fec_group else None
+        
+        # Connection ID do server cấp qua HELLO/WELCOME (chỉ định dạng binary), giữ phiên
+        # khi địa chỉ nguồn đổi; 0 = chưa bắt tay, server nhận diện theo địa chỉ
+        self.use_connection_id = use_connection_id and wire_format == FORMAT_BINARY
+        self.connection_id = 0
+        self.handshake_nonce = 0
+        self.handshake_attempts = 0
+        self.handshake_sent_at = 0.0
+        self.handshake_timer: Optional[TimerHandle] = None
+        self.handshake_done = self.create_event()
+        if not self.use_connection_id:
+            self.handshake_done.set()
         
         # Thống kê
         self.stats = {
             'messages_sent': 0,
             'messages_acked': 0,
+            # Message đã SACK phải gửi lại sau RESET: được ACK lần nữa nên messages_acked
+            # đếm chúng hai lần, số message thật sự đã giao là messages_acked - messages_requeued
+            'messages_requeued': 0,
             'retransmissions': 0,
             'bundles_sent': 0,
-            'rtt_samples': []
+            'acks_received': 0,
+            'bytes_sent': 0,
+            'ack_bytes_received': 0,
+            'parity_sent': 0,
+            'handshakes': 0,
+            'resets_received': 0,
+            'path_challenges': 0,
+            'parity_bytes': 0,
+            'fragmented_messages': 0,
+            'fragments_sent': 0,
+            'rtt_histogram': LatencyHistogram(unit='us'),
+            # Từ lần gửi đầu đến khi được ACK, tính cả message đã gửi lại (khác RTT theo Karn)
+            'delivery_histogram': LatencyHistogram(unit='us'),
+            'rto': 0.0,
+            'window_stalls': 0
         }
         
+        # RTO thích ứng (Jacobson/Karels + Karn)
+        self.rto_estimator = RtoEstimator()
+        self.stats['rto'] = self.rto_estimator.rto
+        
+        # Cửa sổ gửi: cwnd (slow start + AIMD) và rwnd do server quảng bá
+        self.congestion = CongestionController()
+        
+        # Pacing: rải cửa sổ đều trong một SRTT thay vì xả burst, kèm trần cứng max_rate_bps (bit/s)
+        self.pacer = Pacer(max_rate_bps / 8, burst=2 * max_datagram, pacing=pacing)
+        
         # Lock cho thread safety
         self.lock = threading.Lock()
         
+        # Một timer wheel (một thread) cho mọi timer gửi lại
+        self.timers = self.create_timers()
+        
+        # Mô phỏng suy hao có seed trên đường gửi dữ liệu (loss / delay / reorder / ...)
+        self.link = (ImpairedLink(impairment, self.transmit, self.link_scheduler())
+                     if impairment and impairment.is_active() else None)
+        
         # Biến điều khiển thread
         self.listening_active = True
         
-        print(f"UDP Client kết nối đến {server_host}:{server_port}")
-        print("Kỹ thuật: Smart Bundling + Selective Retransmission")
-        print("=" * 50)
+        self.log(f"UDP Client kết nối đến {server_host}:{server_port}")
+        self.log("Kỹ thuật: Smart Bundling + Selective Retransmission")
+        self.log(f"Bundling: tối đa {max_datagram} bytes / {bundle_size} messages mỗi datagram")
+        self.log(f"Định dạng gói tin: {wire_format}")
+        if fec_group:
+            self.log(f"FEC: 1 gói parity mỗi {fec_group} bundle")
+        if max_rate_bps:
+            self.log(f"Trần tốc độ gửi: {max_rate_bps / 1e6:g} Mbit/s")
+        self.log(f"Socket buffers: {format_buffers(self.buffers)}")
+        self.log("=" * 50)
+
+    def log(self, message: str):
+        """In log chi tiết theo từng gói (tắt bằng verbose=False khi chạy tải lớn)"""
+        if self.verbose:
+            print(message)
+
+    def create_timers(self):
+        """Bộ lập lịch timer gửi lại; bản asyncio dùng loop.call_later thay cho wheel"""
+        return TimerWheel(tick=TIMER_TICK)
+
+    def create_event(self):
+        """Cờ báo bắt tay xong; bản asyncio dùng asyncio.Event để await được"""
+        return threading.Event()
+
+    def link_scheduler(self):
+        """Bộ lập lịch cho gói bị trễ; None để ImpairedLink tự tạo DelayLine (bản asyncio dùng call_later)"""
+        return None
+
+    def transmit(self, data: bytes):
+        """Gửi thật một datagram đến server; bản asyncio ghi đè để gửi qua transport"""
+        self.socket.sendto(data, self.server_addr)
+
+    def send_datagram(self, data: bytes, messages: int = 0):
+        """Gửi một datagram (mang `messages` message dữ liệu), qua mô phỏng suy hao nếu có
+
+        Luôn được gọi dưới self.lock (bucket của pacer dùng chung với thread timer).
+        """
+        self.stats['bytes_sent'] += len(data)
+        self.pacer.on_send(len(data), messages)
+        if self.link:
+            self.link.send(data)
+        else:
+            self.transmit(data)
+
+    def open_stream(self, unordered: bool = False) -> int:
+        """Mở một stream mới với dãy stream_seq riêng, trả về stream ID
+
+        Message mất ở stream này chỉ chặn việc giao của chính nó; unordered=True
+        cho stream mà server giao ngay từng message không chờ thứ tự.
+        """
+        stream_id = len(self.stream_seqs)
+        if stream_id > MAX_STREAM_ID:
+            raise ValueError(f"Tối đa {MAX_STREAM_ID + 1} stream mỗi client")
+        self.stream_seqs[stream_id] = 0
+        if unordered:
+            self.unordered_streams.add(stream_id)
+        return stream_id
+
+    def stream_bases(self) -> List[Tuple[int, int]]:
+        """(stream, stream_seq chưa ACK nhỏ nhất) của mỗi stream có thứ tự đã gửi, kèm trong HELLO"""
+        bases = {}
+        for message in self.unacked_messages.values():
+            stream_id = message.stream & MAX_STREAM_ID
+            bases[stream_id] = min(bases.get(stream_id, message.stream_seq), message.stream_seq)
+        return [(stream_id, bases.get(stream_id, next_seq)) for stream_id, next_seq in self.stream_sent.items()
+                if stream_id not in self.unordered_streams]
+
+    def start_handshake(self):
+        """Xin connection ID mới (lần đầu hoặc sau RESET), WELCOME về thì handshake_done được set"""
+        with self.lock:
+            self.connection_id = 0
+            self.handshake_done.clear()
+            self.handshake_nonce = secrets.randbits(32)
+            self.handshake_attempts = 0
+        self.send_hello()
+
+    def send_hello(self):
+        """Gửi (lại) HELLO, hẹn gửi lại theo RTO cho đến khi nhận WELCOME"""
+        with self.lock:
+            if self.handshake_done.is_set() or not self.listening_active:
+                return
+            if self.handshake_attempts > MAX_RETRIES:
+                self.log("Bắt tay thất bại, gửi không kèm connection ID")
+                self.use_connection_id = False
+                self.handshake_done.set()
+                return
+            # Seq chưa ACK nhỏ nhất (unacked_messages giữ thứ tự seq tăng dần): server bắt đầu từ đó
+            initial_seq = next(iter(self.unacked_messages), self.next_send_seq)
+            self.send_datagram(encode_hello(self.handshake_nonce, initial_seq, self.stream_bases()))
+            self.handshake_sent_at = time.monotonic()
+            self.handshake_timer = self.timers.schedule(
+                self.rto_estimator.timeout_for(self.handshake_attempts), self.send_hello)
+            self.handshake_attempts += 1
+            self.log(f"HELLO (lần {self.handshake_attempts}, bắt đầu từ seq={initial_seq})")
+
+    def on_control_packet(self, packet: dict):
+        """WELCOME cấp connection ID, RESET báo server đã mất phiên và cần bắt tay lại,
+        CHALLENGE kiểm tra địa chỉ mới của client (sau NAT rebinding)"""
+        if packet['type'] == 'welcome':
+            with self.lock:
+                if self.handshake_done.is_set() or packet['nonce'] != self.handshake_nonce:
+                    return
+                self.connection_id = packet['cid']
+                if self.handshake_timer:
+                    self.handshake_timer.cancel()
+                # Karn: chỉ lấy mẫu RTT khi HELLO chưa phải gửi lại
+                if self.handshake_attempts == 1:
+                    self.stats['rto'] = self.rto_estimator.on_sample(time.monotonic() - self.handshake_sent_at)
+                self.stats['handshakes'] += 1
+                self.handshake_done.set()
+            self.log(f"WELCOME: connection ID {self.connection_id}")
+        elif packet['type'] == 'reset':
+            if not packet['cid'] or packet['cid'] != self.connection_id:
+                return
+            self.stats['resets_received'] += 1
+            self.log(f"RESET connection ID {packet['cid']}, bắt tay lại")
+            self.requeue_sacked()
+            self.start_handshake()
+        elif packet['type'] == 'challenge':
+            if not packet['cid'] or packet['cid'] != self.connection_id:
+                return
+            self.stats['path_challenges'] += 1
+            with self.lock:
+                self.send_datagram(encode_response(packet['cid'], packet['token']))
+
+    def requeue_sacked(self):
+        """Server mất phiên cùng buffer sắp xếp lại: message chỉ mới được SACK phải gửi lại"""
+        with self.lock:
+            if not self.sacked:
+                return
+            self.log(f"Gửi lại {len(self.sacked)} message đã SACK nhưng chưa được ACK tích lũy")
+            self.stats['messages_requeued'] += len(self.sacked)
+            for message in self.sacked.values():
+                self.setup_retransmission(message)
+            # Giữ unacked_messages theo thứ tự seq tăng dần
+            self.unacked_messages = dict(sorted({**self.unacked_messages, **self.sacked}.items()))
+            self.sacked.clear()
+
+    async def ensure_connection(self):
+        """Bắt tay nếu chưa có connection ID, chờ đến khi xong (hoặc chuyển sang không dùng ID)"""
+        if self.handshake_done.is_set():
+            return
+        if not self.handshake_attempts:
+            self.start_handshake()
+        await self.wait_for_handshake()
+
+    async def wait_for_handshake(self):
+        while not self.handshake_done.is_set() and self.listening_active:
+            await asyncio.sleep(WINDOW_POLL_INTERVAL)
 
     def send_bundle(self, messages: List[SentMessage]):
         """Gửi một bundle messages đến server"""
-        bundle_data = {
-            'type': 'bundle',
-            'messages': [{'seq': msg.seq, 'content': msg.content} for msg in messages]
-        }
-        
-        data = json.dumps(bundle_data).encode()
+        data = encode_bundle([(msg.seq, msg.content) for msg in messages], self.wire_format,
+                             fec=self.fec is not None, connection_id=self.connection_id,
+                             streams=[msg.stream_fields for msg in messages],
+                             fragments=[msg.fragment for msg in messages])
         
         with self.lock:
-            self.socket.sendto(data, self.server_addr)
+            self.send_datagram(data, len(messages))
+            sent_at = time.monotonic()
             self.stats['bundles_sent'] += 1
             self.stats['messages_sent'] += len(messages)
+            self.next_send_seq = max(self.next_send_seq, messages[-1].seq + 1)
             
             # Lưu trữ messages chờ ACK
             for msg in messages:
+                self.stream_sent[msg.stream & MAX_STREAM_ID] = msg.stream_seq + 1
+                msg.sent_at = msg.first_sent_at = sent_at
                 self.unacked_messages[msg.seq] = msg
                 self.setup_retransmission(msg)
             
-            seq_list = [msg.seq for msg in messages]
-            print(f"SENT bundle: {len(messages)} messages (seq: {seq_list})")
+            if self.verbose:
+                seq_list = [msg.seq for msg in messages]
+                self.log(f"SENT bundle: {len(messages)} messages (seq: {seq_list})")
+            
+            if self.fec:
+                self.send_parity(self.fec.add(messages[0].seq, data, self.connection_id))
+
+    def send_parity(self, parity: Optional[bytes]):
+        """Gửi gói parity của nhóm FEC vừa đủ (None: nhóm chưa đủ, không gửi gì)"""
+        if parity is None:
+            return
+        self.send_datagram(parity)
+        self.stats['parity_sent'] += 1
+        self.stats['parity_bytes'] += len(parity)
+        if self.verbose:
+            self.log(f"SENT parity: {len(parity)} bytes")
 
     def setup_retransmission(self, message: SentMessage):
-        """Thiết lập cơ chế gửi lại cho message"""
-        def retransmit():
-            time.sleep(1.0)  # Timeout 1 giây
+        """Đặt timer gửi lại cho message trên timer wheel (O(1))"""
+        if self.listening_active:
+            timeout = self.rto_estimator.timeout_for(message.retries)
+            message.timer = self.timers.schedule(timeout, self.retransmit, message)
+
+    def retransmit(self, message: SentMessage):
+        """Callback của timer wheel khi message hết hạn chờ ACK"""
+        with self.lock:
+            if not self.listening_active or message.seq not in self.unacked_messages:
+                return
             
-            with self.lock:
-                if not self.listening_active or message.seq not in self.unacked_messages:
-                    return
-                    
-                if message.retries >= 3:
-                    print(f"DROP seq={message.seq} (đạt max retries)")
-                    del self.unacked_messages[message.seq]
-                    return
-                
-                message.retries += 1
-                self.stats['retransmissions'] += 1
+            if not self.handshake_done.is_set():
+                # Đang bắt tay lại sau RESET: chưa có ID để gửi, hoãn mà không tính là một lần thử
+                self.setup_retransmission(message)
+                return
                 
-                retry_data = {
-                    'type': 'single',
-                    'message': {'seq': message.seq, 'content': message.content}
-                }
-                
-                print(f"RETRANSMIT seq={message.seq} (lần {message.retries})")
-                
-                try:
-                    self.socket.sendto(json.dumps(retry_data).encode(), self.server_addr)
-                except OSError:
-                    return
-                
-                if self.listening_active and message.retries < 3:
-                    threading.Timer(1.0, retransmit).start()
+            if message.retries >= MAX_RETRIES:
+                self.log(f"DROP seq={message.seq} (đạt max retries)")
+                del self.unacked_messages[message.seq]
+                return
+            
+            message.retries += 1
+            self.stats['retransmissions'] += 1
+            # Timeout gửi lại là tín hiệu mất gói cho AIMD; RTO chỉ lùi theo số lần gửi lại
+            # của chính message (setup_retransmission), RTO chung giữ nguyên
+            self.congestion.on_loss(time.monotonic(), self.rto_estimator.srtt or self.rto_estimator.rto)
+            
+            retry_data = encode_single(message.seq, message.content, self.wire_format, self.connection_id,
+                                       message.stream_fields, message.fragment)
+            
+            if self.verbose:
+                self.log(f"RETRANSMIT seq={message.seq} (lần {message.retries}, "
+                      f"timeout kế tiếp {self.rto_estimator.timeout_for(message.retries) * 1000:.0f} ms)")
+            
+            try:
+                self.send_datagram(retry_data, 1)
+            except OSError:
+                return
+            message.sent_at = time.monotonic()
+            
+            self.setup_retransmission(message)
+
+    def acked_seqs(self, ack_data: dict) -> List[int]:
+        """Các seq đang chờ nằm trong ACK tích lũy hoặc trong một SACK block"""
+        cumulative = ack_data['cum']
+        acked = []
+        # unacked_messages giữ thứ tự chèn, tức thứ tự seq tăng dần
+        for seq in self.unacked_messages:
+            if seq > cumulative:
+                break
+            acked.append(seq)
         
-        if self.listening_active:
-            threading.Timer(1.0, retransmit).start()
+        for lo, hi in ack_data['sack']:
+            for seq in range(max(lo, cumulative + 1), hi + 1):
+                if seq in self.unacked_messages:
+                    acked.append(seq)
+        return acked
+
+    def process_ack(self, ack_data: dict) -> List[int]:
+        """Xóa hàng loạt các message đã được ACK, trả về danh sách seq vừa xác nhận"""
+        now = time.monotonic()
+        acked = self.acked_seqs(ack_data)
+        
+        cumulative = ack_data['cum']
+        if self.sacked:
+            for seq in [seq for seq in self.sacked if seq <= cumulative]:
+                del self.sacked[seq]
+        
+        newest_clean = None
+        for seq in acked:
+            message = self.unacked_messages.pop(seq)
+            if seq > cumulative:
+                self.sacked[seq] = message
+            if message.timer:
+                message.timer.cancel()
+            self.stats['delivery_histogram'].record((now - message.first_sent_at) * 1_000_000)
+            # Karn: bỏ qua mẫu RTT của message đã gửi lại (không rõ ACK cho lần gửi nào)
+            if message.retries == 0:
+                self.stats['rtt_histogram'].record((now - message.sent_at) * 1_000_000)
+                if newest_clean is None or message.sent_at > newest_clean.sent_at:
+                    newest_clean = message
+        
+        # Mỗi ACK chỉ cập nhật RTO bằng một mẫu: message gửi gần nhất
+        if newest_clean is not None:
+            self.stats['rto'] = self.rto_estimator.on_sample(now - newest_clean.sent_at)
+        
+        self.congestion.on_ack(len(acked), ack_data.get('wnd'))
+        
+        self.stats['acks_received'] += 1
+        self.stats['messages_acked'] += len(acked)
+        return acked
 
     def listen_for_acks(self):
         """Lắng nghe ACK từ server"""
         while self.listening_active:
             try:
                 data, _ = self.socket.recvfrom(65535)
-                ack_data = json.loads(data.decode())
+                ack_data, _ = decode_packet(data)
+                self.stats['ack_bytes_received'] += len(data)
                 
-                if ack_data['type'] == 'ack':
-                    seq_num = ack_data['seq']
-                    
+                if ack_data['type'] != 'ack':
+                    self.on_control_packet(ack_data)
+                else:
                     with self.lock:
-                        if seq_num in self.unacked_messages:
-                            message = self.unacked_messages[seq_num]
-                            rtt = time.time() - message.timestamp
-                            self.stats['rtt_samples'].append(rtt)
-                            
-                            del self.unacked_messages[seq_num]
-                            self.stats['messages_acked'] += 1
-                            
-                            print(f"ACK seq={seq_num} (RTT: {rtt:.3f}s)")
+                        acked = self.process_ack(ack_data)
+                    
+                    if acked and self.verbose:
+                        self.log(f"ACK cum={ack_data['cum']} sack={ack_data['sack']} "
+                              f"-> xác nhận {len(acked)} messages {acked}")
                             
             except socket.timeout:
                 continue
-            except json.JSONDecodeError as e:
+            except CodecError as e:
                 if self.listening_active:
                     print(f"Lỗi decode ACK: {e}")
             except OSError as e:
@@ -134,26 +488,166 @@ class OptimizedUDPClient:
                 if self.listening_active:
                     print(f"Lỗi nhận ACK: {e}")
 
-    async def send_messages(self, messages_content: List[str]):
-        """Gửi danh sách messages với kỹ thuật bundling"""
-        message_queue: List[SentMessage] = []
-        
+    def window_available(self, count: int) -> bool:
+        """Còn chỗ trong cửa sổ gửi cho `count` message nữa không"""
+        in_flight = len(self.unacked_messages)
+        # Luôn cho phép gửi khi không còn gì đang bay (thăm dò khi rwnd = 0)
+        return in_flight == 0 or in_flight + count <= self.congestion.window()
+
+    async def pace(self):
+        """Chờ đến lượt datagram kế tiếp theo pacing_rate (tính lại từ cửa sổ và SRTT hiện tại)
+
+        Gửi lại chạy trên thread timer và trừ vào cùng bucket dưới self.lock, nên
+        bucket chỉ được đọc / sửa dưới lock; việc ngủ diễn ra ngoài lock.
+        """
+        congestion = self.congestion
+        with self.lock:
+            self.pacer.update(congestion.window(), self.rto_estimator.srtt,
+                              congestion.cwnd < congestion.ssthresh)
+            delay = self.pacer.delay()
+        await self.pacer.wait(delay)
+
+    async def wait_for_window(self, count: int):
+        """Chờ đến khi cửa sổ gửi cho phép thêm `count` message"""
+        if not self.window_available(count):
+            self.stats['window_stalls'] += 1
+        while not self.window_available(count) and self.listening_active:
+            await asyncio.sleep(WINDOW_POLL_INTERVAL)
+
+    def fragment_payload(self, content: Union[str, bytes]) -> Optional[bytes]:
+        """Payload của message cần phân mảnh (lớn hơn một mảnh), None nếu message vừa một datagram"""
+        if not self.max_fragment:
+            if not isinstance(content, str):
+                raise ValueError("Message bytes chỉ hỗ trợ định dạng binary")
+            return None
+        if isinstance(content, str):
+            # UTF-8 tối đa 4 bytes mỗi ký tự: chuỗi ngắn không cần encode thử
+            if len(content) * 4 <= self.max_fragment:
+                return None
+            content = content.encode()
+        return content if len(content) > self.max_fragment else None
+
+    async def send_messages(self, messages_content: List[Union[str, bytes]], stream: int = DEFAULT_STREAM):
+        """Gửi danh sách messages trên một stream với bundling theo MTU, giới hạn bởi cửa sổ gửi
+
+        Nhiều lời gọi trên các stream khác nhau có thể chạy đồng thời (asyncio.gather),
+        message của các stream dùng chung bundle, cửa sổ gửi và seq chung. Message
+        (chuỗi hoặc bytes) lớn hơn một datagram được gửi thành nhiều mảnh.
+        """
+        if stream not in self.stream_seqs:
+            raise ValueError(f"Stream {stream} chưa được mở (open_stream)")
+        stream_word = stream | STREAM_UNORDERED if stream in self.unordered_streams else stream
         for content in messages_content:
+            payload = self.fragment_payload(content)
+            if payload is not None:
+                await self.send_fragmented(payload, stream, stream_word)
+                continue
             message = SentMessage(
                 seq=self.sequence_num,
                 content=content,
-                timestamp=time.time()
+                timestamp=time.monotonic(),
+                stream=stream_word,
+                stream_seq=self.stream_seqs[stream]
             )
             self.sequence_num += 1
-            message_queue.append(message)
+            self.stream_seqs[stream] += 1
             
-            if len(message_queue) >= self.bundle_size:
-                self.send_bundle(message_queue)
-                message_queue = []
-                await asyncio.sleep(0.2)
+            bundles = self.bundler.add(message)
+            self.arm_bundle_deadline()
+            if bundles:
+                await self.send_within_window(*bundles)
         
-        if message_queue:
-            self.send_bundle(message_queue)
+        self.cancel_bundle_deadline()
+        bundle = self.bundler.flush()
+        if bundle:
+            await self.send_within_window(bundle)
+        if self.fec:
+            # Nhóm cuối chưa đủ k bundle vẫn cần parity, không thì bundle cuối mất phải chờ RTO
+            with self.lock:
+                self.send_parity(self.fec.flush(self.connection_id))
+
+    async def send_fragmented(self, payload: bytes, stream: int, stream_word: int):
+        """Cắt payload thành các mảnh vừa một datagram, mỗi mảnh một seq và stream_seq liên tiếp
+
+        Mỗi mảnh đi riêng một datagram; bundle đang mở được gửi trước để seq vẫn
+        đi theo thứ tự. Mảnh là memoryview trên payload nên không copy thêm.
+        """
+        self.cancel_bundle_deadline()
+        pending = self.bundler.flush()
+        now = time.monotonic()
+        fragments = []
+        for fields, chunk in split_message(payload, self.max_fragment):
+            fragments.append([SentMessage(seq=self.sequence_num, content=chunk, timestamp=now,
+                                          stream=stream_word, stream_seq=self.stream_seqs[stream],
+                                          fragment=fields)])
+            self.sequence_num += 1
+            self.stream_seqs[stream] += 1
+        self.stats['fragmented_messages'] += 1
+        self.stats['fragments_sent'] += len(fragments)
+        if self.verbose:
+            self.log(f"FRAGMENT {len(payload)} bytes -> {len(fragments)} mảnh (seq từ {fragments[0][0].seq})")
+        # Xếp hàng cả bundle đang mở lẫn mọi mảnh trong một lần giữ lock: không bundle
+        # nào của stream khác (seq lớn hơn) chen vào giữa
+        await self.send_within_window(*([pending] if pending else []), *fragments)
+
+    def arm_bundle_deadline(self):
+        """Hẹn flush bundle đang mở khi message đầu tiên của nó chờ đủ max_delay
+
+        add() chỉ xét hạn chờ khi có message mới: nếu luồng gửi dừng (chờ cửa sổ,
+        chờ pacing, hoặc ứng dụng chưa gửi tiếp) bundle sẽ bị giữ vô hạn. Timer chạy
+        trên event loop đang gửi nên không cần lock.
+        """
+        if self.bundle_deadline is None and self.bundler.pending:
+            self.bundle_deadline = asyncio.get_running_loop().call_later(
+                self.bundler.time_until_due(), self.on_bundle_deadline)
+
+    def cancel_bundle_deadline(self):
+        if self.bundle_deadline is not None:
+            self.bundle_deadline.cancel()
+            self.bundle_deadline = None
+
+    def on_bundle_deadline(self):
+        """Callback của loop.call_later: gửi bundle quá hạn trong một task riêng"""
+        self.bundle_deadline = None
+        task = asyncio.get_running_loop().create_task(self.flush_due_bundle())
+        self.deadline_tasks.add(task)
+        task.add_done_callback(self.deadline_tasks.discard)
+
+    async def flush_due_bundle(self):
+        """Flush bundle đang mở nếu đã quá hạn, không thì hẹn lại theo message đầu tiên của nó
+
+        Bundle có thể đã được gửi (size/count) và một bundle mới mở sau khi timer
+        được đặt. Flush và xếp hàng vào send_lock diễn ra liền trong một bước của
+        loop nên bundle vẫn đi đúng thứ tự seq so với các bundle khác.
+        """
+        if not self.bundler.due():
+            self.arm_bundle_deadline()
+            return
+        await self.send_within_window(self.bundler.flush('deadline'))
+
+    async def send_within_window(self, *bundles: List[SentMessage]):
+        """Gửi lần lượt các bundle, tách nhỏ bundle lớn hơn phần cửa sổ còn trống
+
+        Khi cửa sổ bằng 0 (server quảng bá rwnd = 0) chỉ một message được gửi
+        đi để thăm dò, thay vì cả bundle rơi ngoài cửa sổ rồi phải gửi lại.
+        Lock FIFO giữ các bundle đi đúng thứ tự bundler tạo ra (tức thứ tự seq)
+        khi nhiều stream cùng chờ cửa sổ: unacked_messages phải tăng dần theo seq.
+        """
+        if self.send_lock is None:
+            self.send_lock = asyncio.Lock()
+        async with self.send_lock:
+            for bundle in bundles:
+                while bundle:
+                    await self.ensure_connection()
+                    await self.wait_for_window(1)
+                    await self.pace()
+                    room = max(1, self.congestion.window() - len(self.unacked_messages))
+                    self.send_bundle(bundle[:room])
+                    bundle = bundle[room:]
+
+    def delivered(self) -> int:
+        """Số message đã được ACK, không tính lần ACK lại của message SACK bị gửi lại"""
+        return self.stats['messages_acked'] - self.stats['messages_requeued']
 
     def print_stats(self):
         """In thống kê hiệu suất"""
@@ -161,16 +655,64 @@ class OptimizedUDPClient:
         print("CLIENT STATISTICS")
         print("="*50)
         print(f"Messages Sent: {self.stats['messages_sent']}")
-        print(f"Messages ACKed: {self.stats['messages_acked']}")
+        print(f"Messages ACKed: {self.delivered()}")
+        if self.stats['messages_requeued']:
+            print(f"SACKed Messages Requeued: {self.stats['messages_requeued']}")
         print(f"Retransmissions: {self.stats['retransmissions']}")
         print(f"Bundles Sent: {self.stats['bundles_sent']}")
         
-        if self.stats['rtt_samples']:
-            avg_rtt = sum(self.stats['rtt_samples']) / len(self.stats['rtt_samples'])
-            print(f"Average RTT: {avg_rtt:.3f}s")
+        bundling = self.bundler.snapshot()
+        if bundling['bundles']:
+            print(f"Messages/Bundle: {bundling['messages_per_bundle']:.1f}, "
+                  f"Bytes/Bundle: {bundling['bytes_per_bundle']:.0f}/{self.bundler.max_datagram}, "
+                  f"Fill Ratio: {bundling['fill_ratio'] * 100:.1f}%")
+            print("Flush reasons: " + ", ".join(f"{reason}={count}"
+                                                for reason, count in bundling['flushes'].items()))
+            if bundling['oversized']:
+                print(f"Oversized Messages: {bundling['oversized']}")
+        print(f"ACK Datagrams Received: {self.stats['acks_received']}")
+        if self.kernel_drops.available:
+            print(f"Kernel Drops: {self.kernel_drops.read()} ACK (buffer nhận đầy; {format_buffers(self.buffers)})")
+        if self.stats['fragmented_messages']:
+            print(f"Fragmented Messages: {self.stats['fragmented_messages']} "
+                  f"({self.stats['fragments_sent']} mảnh, tối đa {self.max_fragment} bytes mỗi mảnh)")
+        if len(self.stream_seqs) > 1:
+            print("Streams: " + ", ".join(
+                f"{stream_id}{'(unordered)' if stream_id in self.unordered_streams else ''}={count}"
+                for stream_id, count in self.stream_seqs.items()))
+        if self.use_connection_id:
+            print(f"Connection ID: {self.connection_id} (bắt tay {self.stats['handshakes']}, "
+                  f"RESET {self.stats['resets_received']}, CHALLENGE {self.stats['path_challenges']})")
+        if self.fec:
+            data_bytes = self.stats['bytes_sent'] - self.stats['parity_bytes']
+            print(f"FEC Parity Sent: {self.stats['parity_sent']} "
+                  f"(+{self.stats['parity_bytes'] / max(data_bytes, 1) * 100:.1f}% bytes)")
+        if self.link:
+            print(f"Data link: {format_impairment_stats(self.link.stats)}")
+        
+        rto = self.rto_estimator.snapshot()
+        if rto['srtt'] is not None:
+            print(f"SRTT: {rto['srtt'] * 1000:.3f} ms, RTTVAR: {rto['rttvar'] * 1000:.3f} ms")
+        print(f"Current RTO: {rto['rto'] * 1000:.1f} ms ({rto['samples']} mẫu RTT)")
+        
+        window = self.congestion.snapshot()
+        print(f"cwnd: {window['cwnd']:.1f}, ssthresh: {window['ssthresh']:.1f}, "
+              f"rwnd: {window['rwnd']}, loss events: {window['loss_events']}")
+        print(f"Window Stalls: {self.stats['window_stalls']}")
+        pacing = self.pacer.snapshot()
+        if pacing['paced_sends'] or pacing['max_rate']:
+            cap = f", trần {pacing['max_rate'] * 8 / 1e6:g} Mbit/s" if pacing['max_rate'] else ""
+            print(f"Pacing: {pacing['rate'] * 8 / 1e6:.2f} Mbit/s{cap}, chờ {pacing['paced_sends']} lần "
+                  f"(tổng {pacing['pacing_delay'] * 1000:.1f} ms)")
+        
+        rtt_histogram = self.stats['rtt_histogram']
+        if rtt_histogram:
+            print("RTT:")
+            for line in rtt_histogram.format_report(scale=1000, unit='ms'):
+                print(line)
         
         if self.stats['messages_sent'] > 0:
-            success_rate = (self.stats['messages_acked'] / self.stats['messages_sent']) * 100
+            success_rate = (self.delivered() / self.stats['messages_sent']) * 100
             print(f"Success Rate: {success_rate:.1f}%")
         
         with self.lock:
@@ -197,7 +739,8 @@ class OptimizedUDPClient:
         ]
         
         print("\nStarting UDP Optimization Demo...")
-        print(f"Sẽ gửi {len(demo_messages)} messages với bundle size {self.bundle_size}")
+        print(f"Sẽ gửi {len(demo_messages)} messages, mỗi bundle tối đa "
+              f"{self.bundler.max_datagram} bytes / {self.bundle_size} messages")
         
         try:
             asyncio.run(self.send_messages(demo_messages))
@@ -206,6 +749,9 @@ class OptimizedUDPClient:
             
         finally:
             self.listening_active = False
+            self.timers.stop()
+            if self.link:
+                self.link.close()
             time.sleep(0.1)
             try:
                 self.socket.close()
@@ -220,5 +766,31 @@ class OptimizedUDPClient:
             print(f"\nCòn {len(self.unacked_messages)} messages chưa được xác nhận")
 
 if __name__ == "__main__":
-    client = OptimizedUDPClient()
+    import argparse
+    parser = argparse.ArgumentParser(description="Optimized UDP Client")
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_BINARY,
+                        help="Định dạng gói tin trên dây")
+    parser.add_argument('--max-datagram', type=int, default=DEFAULT_MAX_DATAGRAM,
+                        help="Trần kích thước datagram (bytes) khi bundling")
+    parser.add_argument('--bundle-size', type=int, default=DEFAULT_MAX_COUNT,
+                        help="Số message tối đa mỗi bundle")
+    parser.add_argument('--max-delay', type=float, default=DEFAULT_MAX_DELAY,
+                        help="Thời gian chờ tối đa trước khi flush bundle (giây)")
+    parser.add_argument('--fec', type=int, default=0,
+                        help="Gửi một gói XOR parity mỗi N bundle (0 = tắt FEC)")
+    parser.add_argument('--no-pacing', action='store_true',
+                        help="Tắt pacing theo cwnd/SRTT (gửi cả cửa sổ một lượt)")
+    parser.add_argument('--max-rate-mbps', type=float, default=0.0,
+                        help="Trần cứng tốc độ gửi (0 = không giới hạn)")
+    parser.add_argument('--loss', type=float, default=0.0, help="Tỉ lệ mất gói chiều gửi")
+    add_impairment_arguments(parser)
+    add_buffer_arguments(parser)
+    args = parser.parse_args()
+    
+    impairment, _ = impairment_from_args(args)
+    client = OptimizedUDPClient(wire_format=args.format, max_datagram=args.max_datagram,
+                                bundle_size=args.bundle_size, max_delay=args.max_delay,
+                                impairment=impairment, fec_group=args.fec, pacing=not args.no_pacing,
+                                max_rate_bps=args.max_rate_mbps * 1_000_000,
+                                bandwidth_bps=args.bandwidth_mbps * 1_000_000, rtt=args.rtt_ms / 1000)
     client.start_demo()
@@ -1,17 +1,119 @@
+import collections
+import secrets
+import select
 import socket
 import time
-import json
-import random
-from typing import Dict, Set
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import threading
 
+from batched_io import BATCH_SIZE, BatchReceiver, BatchSender
+from fec import FecDecoder
+from impairment import ImpairedLink, ImpairmentConfig, NetworkImpairment, format_impairment_stats
+from message_dispatcher import DEFAULT_CAPACITY, DEFAULT_WORKERS, MODE_THREAD, MessageDispatcher
+from reassembly import DEFAULT_MAX_BYTES, DEFAULT_MAX_MESSAGE, Fragment, Reassembler
+from receive_window import BUFFERED, DELIVERED, DUPLICATE, OUT_OF_WINDOW, ReceiveWindow
+from socket_buffers import (DEFAULT_BANDWIDTH_BPS, DEFAULT_RTT, MIN_BUFFER, KernelDropCounter, buffer_size,
+                            format_buffers, tune_buffers)
+from udp_codec import (CodecError, DEFAULT_STREAM, FORMAT_BINARY, MAX_STREAM_ID, STREAM_UNORDERED, TYPE_BUNDLE,
+                       TYPE_FEC_BUNDLE, TYPE_HELLO, TYPE_PARITY, TYPE_RESPONSE, TYPE_SINGLE, decode_packet,
+                       decode_parity, encode_ack, encode_challenge, encode_reset, encode_welcome, parse_datagram,
+                       payload_text)
+
+# Số SACK block tối đa trong một ACK
+MAX_SACK_BLOCKS = 16
+# Cửa sổ nhận mặc định (số message), quảng bá cho client trong mỗi ACK
+RECEIVE_WINDOW = 256
+# Client không gửi gì trong khoảng này (giây) sẽ bị xóa trạng thái nhận
+IDLE_TTL = 60.0
+# Số stream có thứ tự tối đa mỗi phiên (mỗi stream giữ một cửa sổ sắp xếp lại)
+MAX_STREAMS = 256
+# Phiên nửa mở (đã WELCOME, chưa nhận gói dữ liệu nào) tối đa, tổng và mỗi host nguồn:
+# HELLO không tốn gì để gửi nên flood HELLO (nonce mới mỗi gói) không được làm sessions
+# lớn vô hạn; vượt giới hạn thì phiên nửa mở cũ nhất bị bỏ, như SYN cache của TCP. Giới hạn
+# mỗi host đủ rộng cho vài trăm client cùng bắt tay từ một máy (benchmark trên loopback)
+MAX_HALF_OPEN = 4096
+MAX_HALF_OPEN_PER_HOST = 1024
+# Khoảng tối thiểu giữa hai CHALLENGE của một phiên (giây): gói từ địa chỉ chưa xác thực
+# không khuếch đại thành một CHALLENGE mỗi gói, và kẻ giả mạo địa chỉ không thay được
+# CHALLENGE đang chờ của client thật liên tục
+PATH_CHALLENGE_INTERVAL = 0.2
+
 class OptimizedUDPServer:
-    def __init__(self, host='localhost', port=8888):
+    def __init__(self, host='localhost', port=8888, loss_rate=0.0, verbose=True,
+                 receive_window=RECEIVE_WINDOW, idle_ttl=IDLE_TTL, batch_size=BATCH_SIZE,
+                 reuse_port=False, on_message: Optional[Callable] = None, seed=None,
+                 impairment: Optional[ImpairmentConfig] = None, on_fragment: Optional[Callable] = None,
+                 reassembly_bytes=DEFAULT_MAX_BYTES, max_message=DEFAULT_MAX_MESSAGE,
+                 bandwidth_bps=DEFAULT_BANDWIDTH_BPS, rtt=DEFAULT_RTT, max_half_open=MAX_HALF_OPEN,
+                 max_half_open_per_host=MAX_HALF_OPEN_PER_HOST):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Buffer nhận theo BDP để burst không bị kernel lặng lẽ bỏ (bandwidth_bps=0: giữ mặc định OS);
+        # chiều gửi chỉ mang ACK
+        self.buffers = (tune_buffers(self.socket, buffer_size(bandwidth_bps, rtt), MIN_BUFFER)
+                        if bandwidth_bps else tune_buffers(self.socket))
+        # Datagram kernel bỏ vì buffer nhận đầy, tách biệt với packets_lost (mô phỏng)
+        self.kernel_drops = KernelDropCounter(self.socket)
+        if reuse_port:
+            # Nhiều process cùng bind một port, kernel chia client theo 4-tuple
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise OSError("SO_REUSEPORT không được hỗ trợ trên nền tảng này")
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.socket.bind((host, port))
+        self.loss_rate = loss_rate
+        # Mất gói chiều vào: bỏ cả datagram trước khi phân tích (Bernoulli có seed)
+        self.ingress = (NetworkImpairment(ImpairmentConfig(seed=seed, loss=loss_rate))
+                        if loss_rate > 0 else None)
+        self.verbose = verbose
+        self.receive_window = receive_window
+        self.idle_ttl = idle_ttl
+        self.last_eviction = time.monotonic()
+        
+        # Cửa sổ nhận (bitmap + buffer có giới hạn) cho mỗi client, khóa theo connection ID
+        self.sessions: Dict[int, ReceiveWindow] = {}
+        # Client không bắt tay (JSON, client cũ): địa chỉ -> connection ID do server tự cấp
+        self.addresses: Dict[Tuple[str, int], int] = {}
+        # Nonce của HELLO -> connection ID, để HELLO gửi lại (WELCOME bị mất) không mở phiên mới
+        self.hellos: Dict[int, int] = {}
+        # Phiên nửa mở theo thứ tự mở (cũ nhất trước) -> host nguồn, và số phiên nửa mở mỗi host
+        self.half_open: Dict[int, str] = {}
+        self.half_open_hosts: Dict[str, int] = {}
+        self.max_half_open = max_half_open
+        self.max_half_open_per_host = max_half_open_per_host
+        # Datagram FEC gần nhất của các client dùng FEC, chờ gói parity của nhóm
+        self.fec_decoders: Dict[int, FecDecoder] = {}
         
-        self.expected_seq: Dict[str, int] = {}
-        self.processed_seqs: Dict[str, Set[int]] = {}
+        # Callback on_message(client_key, stream_id, seq, payload) nhận message theo đúng
+        # thứ tự của từng stream; client_key là connection ID (int) của phiên, seq là
+        # stream_seq (trùng seq chung ở stream mặc định khi client không mở stream nào);
+        # payload là memoryview (bytes nếu từng nằm trong buffer sắp xếp lại), chỉ hợp lệ
+        # trong lúc gọi; cần giữ lại thì bytes(payload), cần chuỗi thì payload_text(payload)
+        self.on_message = on_message
+        # Message lớn đến theo mảnh được ghép lại (bộ nhớ có giới hạn) rồi mới tới on_message
+        # / handler với seq là stream_seq của mảnh đầu. Có on_fragment(client_key, stream_id,
+        # seq, offset, total, chunk) thì từng mảnh được chuyển thẳng cho nó (streaming, theo
+        # thứ tự offset ở stream có thứ tự) và server không giữ message nào trong bộ nhớ
+        self.on_fragment = on_fragment
+        self.reassembler = Reassembler(reassembly_bytes, max_message)
+        # Handler chạy trên pool riêng qua hàng đợi có giới hạn (register_handler)
+        self.dispatcher: Optional[MessageDispatcher] = None
+        # Client đã bị từ chối vì backlog, cần báo khi cửa sổ mở lại
+        self.throttled: Set[int] = set()
+        # Thread handler không chạm vào trạng thái của vòng nhận: chúng xếp callback vào
+        # đây (call_in_loop) và đánh thức vòng nhận qua socketpair (tạo khi đăng ký handler)
+        self.loop_calls: collections.deque = collections.deque()
+        self.wakeup: Optional[Tuple[socket.socket, socket.socket]] = None
+        self.window_check_pending = False
+        
+        # I/O theo lô: nhận nhiều datagram mỗi lần thức dậy, ACK gom lại gửi một lượt
+        self.batch_size = batch_size
+        self.receiver = None
+        self.sender = BatchSender(self.socket, batch_size)
+        # Các phiên cần ACK trong lô hiện tại (dict giữ thứ tự, dùng như ordered set)
+        self.pending_acks: Dict[int, None] = {}
+        
+        # Suy hao chiều ra (ACK): loss / burst / delay / reorder / duplicate / băng thông
+        self.link = (ImpairedLink(impairment, self.transmit, self.link_scheduler())
+                     if impairment and impairment.is_active() else None)
         
         self.stats = {
             'total_packets': 0,
@@ -19,76 +121,469 @@ class OptimizedUDPServer:
             'messages_processed': 0,
             'duplicates_dropped': 0,
             'acks_sent': 0,
-            'packets_lost': 0
+            'acks_coalesced': 0,
+            'packets_lost': 0,
+            'window_drops': 0,
+            'backpressure_drops': 0,
+            'window_updates': 0,
+            'clients_evicted': 0,
+            'half_open_evicted': 0,
+            'parity_received': 0,
+            'fec_recovered': 0,
+            'handshakes': 0,
+            'rebinds': 0,
+            'path_challenges': 0,
+            'path_failures': 0,
+            'unexpected_packets': 0,
+            'resets_sent': 0,
+            'stream_limit_drops': 0,
+            'fragments_received': 0,
+            'reassembly_drops': 0
         }
         
-        print(f"Optimized UDP Server tại {host}:{port}")
-        print("Kỹ thuật: Bundling + Selective ACK + Loss Handling")
-        print("=" * 50)
+        self.log(f"Optimized UDP Server tại {host}:{port}")
+        self.log("Kỹ thuật: Bundling + Selective ACK + Loss Handling")
+        self.log(f"Socket buffers: {format_buffers(self.buffers)}")
+        self.log("=" * 50)
+
+    def log(self, message: str):
+        """In log chi tiết theo từng gói (tắt bằng verbose=False khi chạy tải lớn)
+
+        Trên đường xử lý từng gói, lời gọi được bọc trong `if self.verbose:` để khi
+        tắt log không phải định dạng f-string nào.
+        """
+        if self.verbose:
+            print(message)
+
+    def new_connection_id(self) -> int:
+        """Connection ID u32 ngẫu nhiên khác 0, khó đoán để client khác không chiếm phiên"""
+        while True:
+            connection_id = secrets.randbits(32)
+            if connection_id and connection_id not in self.sessions:
+                return connection_id
+
+    def open_session(self, address, fmt: str = FORMAT_BINARY, expected: int = 0,
+                     nonce: Optional[int] = None, stream_bases: List[Tuple[int, int]] = ()) -> int:
+        """Tạo phiên mới cho client tại `address`, trả về connection ID
+
+        stream_bases là các (stream, stream_seq bắt đầu) client gửi kèm HELLO khi bắt
+        tay lại giữa chừng; không có thì phiên bắt đầu ở chế độ một stream.
+        """
+        client_key = self.new_connection_id()
+        session = self.sessions[client_key] = ReceiveWindow(self.receive_window, fmt, expected,
+                                                            address, nonce)
+        if stream_bases and list(stream_bases) != [(DEFAULT_STREAM, expected)]:
+            session.open_streams(stream_bases[:MAX_STREAMS])
+        if self.dispatcher:
+            # Cửa sổ ban đầu không hứa nhiều hơn chỗ trống hiện có của handler
+            session.right_edge = expected + self.handler_window(client_key)
+        return client_key
+
+    def get_client_key(self, address) -> int:
+        """Connection ID của client không bắt tay, tra theo tuple địa chỉ (mở phiên nếu chưa có)"""
+        client_key = self.addresses.get(address)
+        if client_key is None:
+            client_key = self.addresses[address] = self.open_session(address)
+        return client_key
+
+    def link_scheduler(self):
+        """Bộ lập lịch cho gói bị trễ; None để ImpairedLink tự tạo DelayLine (bản asyncio dùng call_later)"""
+        return None
+
+    def transmit(self, data: bytes, address):
+        """Gửi thật một datagram; bản asyncio ghi đè để gửi qua transport"""
+        self.socket.sendto(data, address)
+
+    def send_datagram(self, data: bytes, address):
+        """Gửi một datagram, qua mô phỏng suy hao nếu có"""
+        if self.link:
+            self.link.send(data, address)
+        else:
+            self.transmit(data, address)
+
+    def get_sack_blocks(self, client_key) -> List[Tuple[int, int]]:
+        """Các khoảng [lo, hi] đã nhận vượt thứ tự, đọc từ bitmap của cửa sổ nhận"""
+        return self.sessions[client_key].sack_blocks(MAX_SACK_BLOCKS)
+
+    def register_handler(self, handler: Callable, workers: int = DEFAULT_WORKERS,
+                         mode: str = MODE_THREAD, capacity: int = DEFAULT_CAPACITY):
+        """Đăng ký handler(client_key, stream_id, seq, payload: bytes) chạy trên thread/process pool
+
+        Message của cùng một stream đến handler theo đúng thứ tự. Khi hàng đợi
+        đầy, cửa sổ nhận quảng bá thu nhỏ về 0 thay vì chặn vòng nhận.
+        """
+        if self.dispatcher:
+            self.dispatcher.close()
+        if self.wakeup is None:
+            self.wakeup = socket.socketpair()
+            for end in self.wakeup:
+                end.setblocking(False)
+        self.dispatcher = MessageDispatcher(handler, workers, capacity, mode)
+        self.dispatcher.on_progress = self.on_handler_progress
+
+    def call_in_loop(self, callback: Callable):
+        """Hẹn chạy callback trên vòng nhận (gọi được từ thread khác); bản asyncio dùng call_soon_threadsafe"""
+        self.loop_calls.append(callback)
+        try:
+            self.wakeup[1].send(b'\0')
+        except (BlockingIOError, OSError):
+            # Buffer của socketpair đầy nghĩa là vòng nhận đã có tín hiệu chờ
+            pass
+
+    def run_loop_calls(self):
+        """Chạy trên vòng nhận: xóa tín hiệu đánh thức rồi chạy các callback đã hẹn"""
+        try:
+            while self.wakeup[0].recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self.loop_calls:
+            self.loop_calls.popleft()()
+
+    def on_handler_progress(self, client_key):
+        """Chạy trên thread handler: chỉ hẹn vòng nhận kiểm tra lại cửa sổ của các client bị từ chối"""
+        if self.throttled and not self.window_check_pending:
+            self.window_check_pending = True
+            self.call_in_loop(self.reopen_windows)
 
-    def get_client_key(self, address):
-        return f"{address[0]}:{address[1]}"
+    def reopen_windows(self):
+        """Chạy trên vòng nhận: client bị từ chối nào có cửa sổ mở lại một nửa thì được ACK ngay
 
-    def simulate_packet_loss(self, probability=0.3):
-        return random.random() < probability
+        Duyệt mọi client bị từ chối chứ không chỉ client vừa xong: hàng đợi đầy
+        (free_slots) có thể chặn cả client không có backlog. Cập nhật cửa sổ là
+        ACK bình thường (kèm SACK) đi qua send_ack / flush_acks, tức cùng đường
+        với mọi ACK khác (mô phỏng suy hao, transport asyncio) và mép phải quảng
+        bá chỉ được sửa trên vòng nhận.
+        """
+        self.window_check_pending = False
+        if not self.throttled:
+            return
+        threshold = max(1, min(self.receive_window, self.dispatcher.capacity) // 2)
+        for key in list(self.throttled):
+            if self.handler_window(key) >= threshold:
+                self.throttled.discard(key)
+                if key in self.sessions:
+                    self.stats['window_updates'] += 1
+                    self.send_ack(key)
+        self.flush_acks()
+
+    def handler_window(self, client_key) -> int:
+        """Số message handler còn nhận được cho client: phần cửa sổ chưa bị backlog chiếm, tối đa chỗ trống của hàng đợi"""
+        if not self.dispatcher:
+            return self.receive_window
+        return max(0, min(self.receive_window - self.dispatcher.backlog(client_key),
+                          self.dispatcher.free_slots()))
+
+    def advertised_window(self, client_key) -> int:
+        """Số message client còn được gửi thêm: cửa sổ trừ đi buffer sắp xếp lại và backlog của handler"""
+        return min(self.sessions[client_key].available(), self.handler_window(client_key))
 
-    def send_ack(self, seq_num: int, address):
-        ack = json.dumps({'type': 'ack', 'seq': seq_num})
-        self.socket.sendto(ack.encode(), address)
-        self.stats['acks_sent'] += 1
+    def send_datagrams(self, datagrams: List[Tuple[bytes, tuple]]):
+        """Gửi nhiều datagram một lượt (sendmmsg trên Linux); bản asyncio ghi đè"""
+        if self.link:
+            for data, address in datagrams:
+                self.link.send(data, address)
+            return
+        self.sender.send(datagrams)
+
+    def schedule_ack_flush(self):
+        """Hẹn gửi các ACK đang chờ; vòng lặp start() tự flush sau mỗi lô nên không cần làm gì"""
 
-    def handle_bundle(self, bundle_data: dict, address):
-        client_key = self.get_client_key(address)
+    def send_ack(self, client_key: int):
+        """Đánh dấu client cần ACK; nhiều datagram cùng client trong một lô chỉ sinh một ACK"""
+        if client_key in self.pending_acks:
+            self.stats['acks_coalesced'] += 1
+            return
+        if not self.pending_acks:
+            self.schedule_ack_flush()
+        self.pending_acks[client_key] = None
+
+    def flush_acks(self):
+        """Gửi ACK tích lũy (seq liên tục cao nhất) kèm cửa sổ nhận và SACK block cho mỗi client đang chờ"""
+        datagrams = []
+        for client_key in self.pending_acks:
+            session = self.sessions.get(client_key)
+            if session is None:
+                continue
+            sack_blocks = self.get_sack_blocks(client_key)
+            window = session.advertise(self.advertised_window(client_key))
+            # ACK đi đến địa chỉ gần nhất của phiên, theo client khi NAT đổi port
+            datagrams.append((encode_ack(session.cumulative, sack_blocks, window, session.fmt),
+                              session.address))
+        self.pending_acks.clear()
         
-        if client_key not in self.expected_seq:
-            self.expected_seq[client_key] = 0
-            self.processed_seqs[client_key] = set()
+        if datagrams:
+            self.send_datagrams(datagrams)
+            self.stats['acks_sent'] += len(datagrams)
+
+    def process_message(self, client_key, seq_num: int, payload,
+                        stream: Optional[Tuple[int, int]] = None,
+                        fragment: Optional[Tuple[int, int, int]] = None) -> int:
+        """Xử lý một message, trả về số message (tính cả mảnh) được giao theo thứ tự
+
+        stream là (stream kèm bit STREAM_UNORDERED, stream_seq); None là stream mặc
+        định với stream_seq = seq. seq chung chỉ dùng để loại trùng và ACK, thứ tự
+        giao tính riêng trong từng stream. fragment là (index, count, total) khi
+        message là một mảnh của message lớn hơn.
+        """
+        session = self.sessions[client_key]
+        stream_word, stream_seq = stream or (DEFAULT_STREAM, seq_num)
+        stream_id = stream_word & MAX_STREAM_ID
+        ordered = not stream_word & STREAM_UNORDERED
         
-        expected = self.expected_seq[client_key]
-        processed_seqs = self.processed_seqs[client_key]
+        if fragment is not None:
+            self.stats['fragments_received'] += 1
+            payload = Fragment(*fragment, payload)
+            if not self.on_fragment and not self.reassembler.admits(
+                    (client_key, stream_id, stream_seq - fragment[0]), fragment[2]):
+                # Không ghi nhận seq: mảnh không được ACK, client gửi lại khi bộ nhớ ghép đã trống
+                if self.verbose:
+                    self.log(f"REASSEMBLY FULL seq={seq_num} ({self.reassembler.reserved} bytes đang ghép)")
+                self.stats['reassembly_drops'] += 1
+                return 0
         
-        print(f"Bundle từ {client_key}: {len(bundle_data['messages'])} messages")
+        if (self.dispatcher and seq_num >= session.right_edge
+                and seq_num >= session.expected + self.handler_window(client_key)):
+            # Handler chưa theo kịp và seq nằm ngoài cửa sổ đã hứa: không nhận thêm,
+            # client gửi lại khi cửa sổ mở. Seq trong cửa sổ đã quảng bá luôn được nhận.
+            if self.verbose:
+                self.log(f"BACKPRESSURE seq={seq_num} (backlog {self.dispatcher.backlog(client_key)})")
+            self.stats['backpressure_drops'] += 1
+            self.throttled.add(client_key)
+            return 0
         
-        processed_count = 0
-        for message in bundle_data['messages']:
-            seq_num = message['seq']
-            
-            if self.simulate_packet_loss():
-                print(f"MẤT seq={seq_num}")
-                self.stats['packets_lost'] += 1
+        if stream is None and session.streams is None:
+            # Phiên chưa dùng stream: cửa sổ của phiên chính là stream mặc định (stream_seq = seq)
+            window = session
+            status, delivered = session.offer(seq_num, payload)
+        else:
+            window = None
+            if session.streams is None:
+                # Seq chung từ nay chỉ được mark: trạng thái của stream mặc định phải rời khỏi
+                # cửa sổ của phiên trước, kể cả khi message đầu tiên thuộc stream không thứ tự
+                session.stream(DEFAULT_STREAM)
+            if ordered:
+                if stream_id not in session.streams and len(session.streams) >= MAX_STREAMS:
+                    # Không ghi nhận seq: message không được ACK, client không thể mở thêm stream
+                    if self.verbose:
+                        self.log(f"STREAM LIMIT seq={seq_num} stream={stream_id} (tối đa {MAX_STREAMS})")
+                    self.stats['stream_limit_drops'] += 1
+                    return 0
+                window = session.stream(stream_id)
+                if stream_seq >= window.expected + window.size:
+                    if self.verbose:
+                        self.log(f"NGOÀI CỬA SỔ stream={stream_id}:{stream_seq} (waiting {window.expected})")
+                    self.stats['window_drops'] += 1
+                    return 0
+            status, delivered = session.mark(seq_num), []
+            if status not in (DUPLICATE, OUT_OF_WINDOW):
+                if window is None:
+                    # Stream không thứ tự: giao ngay, seq chung đã loại trùng
+                    status, delivered = DELIVERED, [(stream_seq, payload)]
+                else:
+                    # stream_seq đã giao với seq chung mới (gửi lại sau khi bắt tay lại) là DUPLICATE
+                    status, delivered = window.offer(stream_seq, payload)
+        
+        if status == DUPLICATE:
+            if self.verbose:
+                self.log(f"DUPLICATE seq={seq_num}, bỏ qua")
+            self.stats['duplicates_dropped'] += 1
+            return 0
+        
+        if status == OUT_OF_WINDOW:
+            # Vượt cửa sổ nhận đã quảng bá: không buffer, client sẽ gửi lại
+            if self.verbose:
+                self.log(f"NGOÀI CỬA SỔ seq={seq_num} "
+                         f"(window {session.expected}..{session.expected + session.size - 1})")
+            self.stats['window_drops'] += 1
+            return 0
+        
+        if status == BUFFERED:
+            if self.verbose:
+                self.log(f"BUFFER seq={seq_num} stream={stream_id}:{stream_seq} (waiting {window.expected})")
+            return 0
+        
+        if self.verbose:
+            if fragment is None:
+                self.log(f"PROCESS seq={seq_num} stream={stream_id}:{stream_seq}: {payload_text(payload)}")
+            else:
+                self.log(f"PROCESS seq={seq_num} stream={stream_id}:{stream_seq}: "
+                         f"mảnh {fragment[0] + 1}/{fragment[1]} ({len(payload.payload)} bytes)")
+            for seq, _ in delivered[1:]:
+                self.log(f"PROCESS BUFFERED stream={stream_id}:{seq}")
+        
+        count = len(delivered)
+        if fragment is not None or count > 1:
+            # Mảnh có thể nằm trong các message vừa được giải phóng khỏi buffer sắp xếp lại
+            delivered = self.reassemble(client_key, stream_id, delivered)
+        
+        if self.on_message:
+            for seq, data in delivered:
+                self.on_message(client_key, stream_id, seq, data)
+        if self.dispatcher:
+            # Handler chạy bất đồng bộ nên phải copy khỏi buffer nhận
+            for seq, data in delivered:
+                self.dispatcher.submit(client_key, stream_id, seq, bytes(data))
+        return count
+    
+    def reassemble(self, client_key, stream_id: int, delivered: List[Tuple[int, object]]) -> List[Tuple[int, object]]:
+        """Thay các mảnh trong delivered bằng message đã ghép đủ, hoặc chuyển từng mảnh cho on_fragment"""
+        messages = []
+        for seq, data in delivered:
+            if not isinstance(data, Fragment):
+                messages.append((seq, data))
                 continue
-            
-            if seq_num in processed_seqs:
-                print(f"DUPLICATE seq={seq_num}, bỏ qua")
-                self.stats['duplicates_dropped'] += 1
+            first_seq = seq - data.index
+            if self.on_fragment:
+                self.on_fragment(client_key, stream_id, first_seq, data.offset, data.total, data.payload)
                 continue
-            
-            if seq_num == expected:
-                print(f"PROCESS seq={seq_num}: {message['content']}")
-                processed_seqs.add(seq_num)
-                self.expected_seq[client_key] += 1
-                processed_count += 1
-                self.send_ack(seq_num, address)
-                
-                self.process_buffered(client_key, address)
+            message = self.reassembler.add((client_key, stream_id, first_seq), data)
+            if message is not None:
+                if self.verbose:
+                    self.log(f"REASSEMBLED stream={stream_id}:{first_seq}: {data.count} mảnh, {data.total} bytes")
+                messages.append((first_seq, message))
+        return messages
+
+    def ensure_client(self, client_key: int, fmt: str = None, address=None) -> Optional[ReceiveWindow]:
+        """Lấy trạng thái nhận của phiên, đánh dấu còn hoạt động và kiểm tra địa chỉ nếu client đổi port
+
+        Trả về None nếu connection ID không tồn tại (đã bị xóa hoặc thuộc worker khác).
+        """
+        session = self.sessions.get(client_key)
+        if session is None:
+            return None
+        if fmt is not None:
+            session.fmt = fmt
+        if address is not None and address != session.address:
+            # NAT rebinding: cùng connection ID từ địa chỉ mới. ACK vẫn về địa chỉ cũ cho đến
+            # khi địa chỉ mới trả lời đúng CHALLENGE (handle_path_response)
+            self.challenge_path(client_key, session, address)
+        session.last_seen = time.monotonic()
+        return session
+
+    def challenge_path(self, client_key: int, session: ReceiveWindow, address):
+        """Gửi CHALLENGE tới địa chỉ mới của phiên, tối đa một lần mỗi PATH_CHALLENGE_INTERVAL
+
+        Địa chỉ đang được kiểm tra giữ nguyên token khi gửi lại, để RESPONSE còn
+        trên đường về không bị coi là sai.
+        """
+        now = time.monotonic()
+        challenge = session.challenge
+        if challenge is not None and now - challenge[2] < PATH_CHALLENGE_INTERVAL:
+            return
+        token = challenge[1] if challenge is not None and challenge[0] == address else secrets.randbits(64)
+        session.challenge = (address, token, now)
+        self.stats['path_challenges'] += 1
+        self.send_datagram(encode_challenge(client_key, token), address)
+
+    def handle_path_response(self, data, client_key: int, address):
+        """RESPONSE đúng token từ đúng địa chỉ đã được CHALLENGE: chuyển phiên sang địa chỉ mới"""
+        session = self.sessions.get(client_key)
+        challenge = session.challenge if session is not None else None
+        try:
+            token = decode_packet(bytes(data))[0]['token']
+        except CodecError:
+            token = None
+        if challenge is None or challenge[0] != address or challenge[1] != token:
+            self.stats['path_failures'] += 1
+            return
+        self.log(f"REBIND {client_key}: {session.address} -> {address}")
+        self.stats['rebinds'] += 1
+        session.address = address
+        session.challenge = None
+        session.last_seen = time.monotonic()
+        # Báo ngay trạng thái nhận tới địa chỉ mới, ACK gửi về địa chỉ cũ có thể đã mất
+        self.send_ack(client_key)
+
+    def evict_idle_clients(self, now: float) -> int:
+        """Xóa trạng thái của các client im lặng quá idle_ttl giây"""
+        idle = [key for key, session in self.sessions.items()
+                if now - session.last_seen > self.idle_ttl]
+        for key in idle:
+            self.drop_session(key)
+            self.log(f"EVICT {key} (không hoạt động quá {self.idle_ttl:.0f}s)")
+        self.stats['clients_evicted'] += len(idle)
+        return len(idle)
+
+    def drop_session(self, client_key: int):
+        """Xóa phiên cùng mọi trạng thái gắn với nó (FEC, ghép mảnh, địa chỉ, nonce)"""
+        session = self.sessions.pop(client_key)
+        self.fec_decoders.pop(client_key, None)
+        self.reassembler.discard(client_key)
+        self.throttled.discard(client_key)
+        self.establish(client_key)
+        if self.addresses.get(session.address) == client_key:
+            del self.addresses[session.address]
+        if session.nonce is not None and self.hellos.get(session.nonce) == client_key:
+            del self.hellos[session.nonce]
+
+    def establish(self, client_key: int):
+        """Phiên đã nhận gói dữ liệu (hoặc đã bị xóa): không còn tính là nửa mở"""
+        host = self.half_open.pop(client_key, None)
+        if host is not None:
+            remaining = self.half_open_hosts[host] - 1
+            if remaining:
+                self.half_open_hosts[host] = remaining
             else:
-                if seq_num > expected:
-                    processed_seqs.add(seq_num)
-                    print(f"BUFFER seq={seq_num} (waiting {expected})")
-        
-        self.stats['messages_processed'] += processed_count
-        return processed_count
+                del self.half_open_hosts[host]
+
+    def limit_half_open(self, host: str):
+        """Nhường chỗ cho một phiên nửa mở mới từ `host`: bỏ phiên nửa mở cũ nhất nếu đã đầy
 
-    def process_buffered(self, client_key: str, address):
-        expected = self.expected_seq[client_key]
-        processed_seqs = self.processed_seqs[client_key]
+        Host đã chạm giới hạn riêng thì bỏ phiên cũ nhất của chính host đó, để một
+        nguồn flood HELLO không đẩy phiên đang bắt tay của client khác ra ngoài.
+        """
+        if self.half_open_hosts.get(host, 0) >= self.max_half_open_per_host:
+            victim = next(key for key, owner in self.half_open.items() if owner == host)
+        elif len(self.half_open) >= self.max_half_open:
+            victim = next(iter(self.half_open))
+        else:
+            return
+        self.drop_session(victim)
+        self.stats['half_open_evicted'] += 1
+        self.log(f"HALF-OPEN EVICT {victim} (HELLO mới từ {host})")
+
+    def handle_hello(self, data, address):
+        """Cấp connection ID cho client; HELLO gửi lại (WELCOME bị mất) nhận lại đúng ID cũ"""
+        try:
+            packet, _ = decode_packet(bytes(data))
+        except CodecError as e:
+            self.log(f"Lỗi decode HELLO: {e}")
+            return
+        nonce = packet['nonce']
+        client_key = self.hellos.get(nonce)
+        session = self.sessions.get(client_key) if client_key is not None else None
+        if session is None or session.address != address:
+            host = address[0]
+            self.limit_half_open(host)
+            client_key = self.open_session(address, FORMAT_BINARY, packet['seq'], nonce, packet['streams'])
+            self.hellos[nonce] = client_key
+            self.half_open[client_key] = host
+            self.half_open_hosts[host] = self.half_open_hosts.get(host, 0) + 1
+            self.stats['handshakes'] += 1
+            self.log(f"HELLO từ {address}: connection ID {client_key}, bắt đầu từ seq={packet['seq']}")
+        self.send_datagram(encode_welcome(client_key, nonce), address)
+
+    def handle_bundle(self, messages: List[Tuple[int, memoryview]], client_key: int,
+                      streams: Optional[List[Tuple[int, int]]] = None,
+                      fragments: Optional[List[Optional[Tuple[int, int, int]]]] = None):
+        if self.verbose:
+            self.log(f"Bundle từ {client_key}: {len(messages)} messages")
         
-        while expected in processed_seqs:
-            print(f"PROCESS BUFFERED seq={expected}")
-            self.send_ack(expected, address)
-            expected += 1
+        processed_count = 0
+        if streams is None and fragments is None:
+            for seq_num, payload in messages:
+                processed_count += self.process_message(client_key, seq_num, payload)
+        else:
+            for i, (seq_num, payload) in enumerate(messages):
+                processed_count += self.process_message(client_key, seq_num, payload, streams and streams[i],
+                                                        fragments and fragments[i])
         
-        self.expected_seq[client_key] = expected
+        # Một ACK cho cả bundle thay vì một ACK cho mỗi seq
+        self.send_ack(client_key)
+        
+        self.stats['messages_processed'] += processed_count
+        return processed_count
 
     def print_stats(self):
         print("\n" + "="*50)
@@ -97,10 +592,49 @@ class OptimizedUDPServer:
         print(f"Total Packets: {self.stats['total_packets']}")
         print(f"Bundles Received: {self.stats['bundles_received']}")
         print(f"Messages Processed: {self.stats['messages_processed']}")
-        print(f"ACKs Sent: {self.stats['acks_sent']}")
+        print(f"ACKs Sent: {self.stats['acks_sent']} (gom {self.stats['acks_coalesced']} ACK trùng client)")
         print(f"Packets Lost: {self.stats['packets_lost']}")
+        if self.kernel_drops.available:
+            print(f"Kernel Drops: {self.kernel_drops.read()} (buffer nhận đầy; {format_buffers(self.buffers)})")
+        if self.stats['parity_received']:
+            print(f"FEC: {self.stats['fec_recovered']} datagram dựng lại từ "
+                  f"{self.stats['parity_received']} gói parity")
+        if self.link:
+            print(f"ACK link: {format_impairment_stats(self.link.stats)}")
         print(f"Duplicates Dropped: {self.stats['duplicates_dropped']}")
-        print(f"Active Clients: {len(self.expected_seq)}")
+        print(f"Out-of-window Drops: {self.stats['window_drops']}")
+        # Thread in stats chạy song song với vòng nhận: chụp danh sách phiên trước khi duyệt
+        sessions = list(self.sessions.values())
+        open_streams = sum(len(session.streams or ()) for session in sessions)
+        if open_streams > len(sessions) or self.stats['stream_limit_drops']:
+            print(f"Ordered Streams: {open_streams} (vượt giới hạn {self.stats['stream_limit_drops']})")
+        if self.stats['fragments_received']:
+            reassembly = self.reassembler.stats
+            print(f"Fragments: {self.stats['fragments_received']} mảnh, ghép xong {reassembly['completed']} "
+                  f"message, đang ghép {len(self.reassembler.partials)} ({self.reassembler.reserved} bytes, "
+                  f"đỉnh {reassembly['peak_bytes']}), hết hạn {reassembly['timed_out']}, "
+                  f"bỏ vì đầy {self.stats['reassembly_drops']}, mảnh sai {reassembly['rejected']}")
+        if self.dispatcher:
+            handler_stats = self.dispatcher.stats
+            print(f"Handler ({self.dispatcher.mode}): {handler_stats['completed']}/{handler_stats['dispatched']} "
+                  f"xong, backlog đỉnh {handler_stats['peak_backlog']}, lỗi {handler_stats['handler_errors']}, "
+                  f"backpressure drops {self.stats['backpressure_drops']}, "
+                  f"window updates {self.stats['window_updates']}")
+        print(f"Active Clients: {len(self.sessions)} (bắt tay {self.stats['handshakes']}, "
+              f"đổi địa chỉ {self.stats['rebinds']} (challenge {self.stats['path_challenges']}, "
+              f"trả lời sai {self.stats['path_failures']}), RESET {self.stats['resets_sent']})")
+        print(f"Evicted Idle Clients: {self.stats['clients_evicted']}")
+        if self.stats['unexpected_packets']:
+            print(f"Unexpected Packets: {self.stats['unexpected_packets']} (ACK/WELCOME/RESET/CHALLENGE gửi tới server)")
+        if self.stats['half_open_evicted']:
+            print(f"Evicted Half-open Sessions: {self.stats['half_open_evicted']} "
+                  f"(đang nửa mở {len(self.half_open)}/{self.max_half_open})")
+        if self.receiver:
+            print(f"I/O: {self.receiver.backend}/{self.sender.backend}, "
+                  f"{self.receiver.average_batch():.1f} datagrams mỗi lần thức dậy")
+            if self.sender.stats['partial_sends'] or self.sender.stats['blocked']:
+                print(f"ACK Send: {self.sender.stats['partial_sends']} lô gửi tiếp sau khi sendmmsg gửi thiếu, "
+                      f"{self.sender.stats['blocked']} datagram bỏ vì buffer gửi đầy")
 
     def start(self):
         print("Server đang lắng nghe...")
@@ -114,44 +648,166 @@ class OptimizedUDPServer:
         stats_thread = threading.Thread(target=stats_printer, daemon=True)
         stats_thread.start()
         
+        self.receiver = BatchReceiver(self.socket, self.batch_size)
+        
         try:
             while True:
-                data, address = self.socket.recvfrom(65535)
-                self.stats['total_packets'] += 1
-                
-                try:
-                    message_data = json.loads(data.decode())
-                    
-                    if message_data['type'] == 'bundle':
-                        self.stats['bundles_received'] += 1
-                        self.handle_bundle(message_data, address)
-                    elif message_data['type'] == 'single':
-                        self.handle_single_message(message_data['message'], address)
-                        
-                except json.JSONDecodeError as e:
-                    print(f"Lỗi decode JSON: {e}")
+                if self.wakeup:
+                    # Có handler: chờ cả datagram lẫn tín hiệu từ thread handler
+                    ready = select.select([self.socket, self.wakeup[0]], [], [])[0]
+                    if self.wakeup[0] in ready:
+                        self.run_loop_calls()
+                    if self.socket not in ready:
+                        continue
+                self.process_batch()
                     
         except KeyboardInterrupt:
             print("\nĐang dừng server...")
+            self.close_handlers()
             self.print_stats()
         finally:
+            if self.link:
+                self.link.close()
             self.socket.close()
 
-    def handle_single_message(self, message: dict, address):
-        client_key = self.get_client_key(address)
-        seq_num = message['seq']
+    def close_handlers(self):
+        """Chờ handler xử lý hết các message đã nhận rồi dừng pool"""
+        if self.dispatcher:
+            self.dispatcher.close()
+
+    def process_batch(self) -> int:
+        """Nhận một lô datagram, xử lý từng gói rồi gửi ACK một lượt"""
+        batch = self.receiver.receive()
+        for view, address in batch:
+            self.handle_datagram(view, address)
+        self.flush_acks()
+        return len(batch)
+
+    def stats_snapshot(self) -> dict:
+        """Bản sao stats kèm số client và số liệu I/O, dùng để gộp giữa các worker"""
+        snapshot = dict(self.stats)
+        snapshot['active_clients'] = len(self.sessions)
+        if self.receiver:
+            snapshot['wakeups'] = self.receiver.stats['wakeups']
+            snapshot['datagrams'] = self.receiver.stats['datagrams']
+        snapshot['reassembled'] = self.reassembler.stats['completed']
+        snapshot['kernel_drops'] = self.kernel_drops.read()
+        return snapshot
+
+    def handle_datagram(self, data, address):
+        """Phân tích một datagram (JSON hoặc nhị phân, bytes hoặc memoryview) và chuyển cho handler"""
+        self.stats['total_packets'] += 1
+        
+        if self.ingress and not self.ingress.plan(len(data)):
+            if self.verbose:
+                self.log(f"MẤT datagram {len(data)} bytes từ {address}")
+            self.stats['packets_lost'] += 1
+            return
+        
+        try:
+            packet_type, client_key, messages, streams, fragments, fmt = parse_datagram(data)
+        except CodecError as e:
+            if self.verbose:
+                self.log(f"Lỗi decode gói tin: {e}")
+            return
+        
+        if packet_type == TYPE_HELLO:
+            self.handle_hello(data, address)
+            return
+        if packet_type == TYPE_RESPONSE:
+            self.handle_path_response(data, client_key, address)
+            return
+        if packet_type not in (TYPE_BUNDLE, TYPE_FEC_BUNDLE, TYPE_SINGLE, TYPE_PARITY):
+            # ACK / WELCOME / RESET / CHALLENGE chỉ đi từ server tới client: không mở phiên,
+            # không trả lời (RESET cho RESET có thể thành vòng lặp giữa hai server)
+            self.stats['unexpected_packets'] += 1
+            return
+        if not client_key:
+            if packet_type == TYPE_PARITY:
+                # Parity chỉ có ích cho phiên đã có bundle, không mở phiên mới
+                client_key = self.addresses.get(address)
+                if client_key is None:
+                    return
+            else:
+                # Client không bắt tay: gói dữ liệu mở phiên theo địa chỉ, bundle đầu tiên
+                # có thể đã mất và chỉ bản gửi lại đến nơi
+                client_key = self.get_client_key(address)
+        if self.ensure_client(client_key, fmt, address) is None:
+            # Phiên không còn (bị xóa vì TTL, server khởi động lại, worker khác): client bắt tay lại
+            self.log(f"RESET connection ID {client_key} từ {address}")
+            self.stats['resets_sent'] += 1
+            self.send_datagram(encode_reset(client_key), address)
+            return
+        if self.half_open:
+            self.establish(client_key)
         
-        if client_key not in self.expected_seq:
+        # Quét client không hoạt động theo chu kỳ, chi phí chia đều cho các gói
+        now = time.monotonic()
+        if now - self.last_eviction >= self.idle_ttl / 4:
+            self.last_eviction = now
+            self.evict_idle_clients(now)
+            for key in self.reassembler.expire(now):
+                self.log(f"REASSEMBLY TIMEOUT {key[0]} stream={key[1]}:{key[2]}")
+        
+        if packet_type == TYPE_BUNDLE:
+            self.stats['bundles_received'] += 1
+            self.handle_bundle(messages, client_key, streams, fragments)
+        elif packet_type == TYPE_FEC_BUNDLE:
+            self.stats['bundles_received'] += 1
+            if messages:
+                self.fec_decoder(client_key).store(messages[0][0], data)
+            self.handle_bundle(messages, client_key, streams, fragments)
+        elif packet_type == TYPE_SINGLE:
+            self.handle_single_message(messages[0], client_key, streams and streams[0],
+                                       fragments and fragments[0])
+        elif packet_type == TYPE_PARITY:
+            self.handle_parity(data, client_key)
+
+    def fec_decoder(self, client_key: int) -> FecDecoder:
+        decoder = self.fec_decoders.get(client_key)
+        if decoder is None:
+            decoder = self.fec_decoders[client_key] = FecDecoder()
+        return decoder
+
+    def handle_parity(self, data, client_key: int):
+        """Dựng lại datagram mất của nhóm FEC (nếu mất đúng một) và xử lý như vừa nhận được"""
+        self.stats['parity_received'] += 1
+        try:
+            members, parity = decode_parity(data)
+            recovered = self.fec_decoder(client_key).recover(members, parity)
+            if recovered is None:
+                return
+            packet_type, _, messages, streams, fragments, _ = parse_datagram(recovered)
+        except CodecError as e:
+            self.log(f"Lỗi decode gói parity: {e}")
             return
-            
-        processed_seqs = self.processed_seqs[client_key]
         
-        if seq_num not in processed_seqs:
-            print(f"RETRANSMITTED seq={seq_num}: {message['content']}")
-            processed_seqs.add(seq_num)
-            self.send_ack(seq_num, address)
-            self.stats['messages_processed'] += 1
+        if self.verbose:
+            self.log(f"FEC dựng lại {len(messages)} messages (seq từ {messages[0][0] if messages else '?'})")
+        self.stats['fec_recovered'] += 1
+        if packet_type == TYPE_FEC_BUNDLE:
+            self.handle_bundle(messages, client_key, streams, fragments)
+
+    def handle_single_message(self, message: Tuple[int, memoryview], client_key: int,
+                              stream: Optional[Tuple[int, int]] = None,
+                              fragment: Optional[Tuple[int, int, int]] = None):
+        seq_num, payload = message
+        
+        if self.verbose:
+            self.log(f"RETRANSMITTED seq={seq_num}")
+        self.stats['messages_processed'] += self.process_message(client_key, seq_num, payload, stream,
+                                                                 fragment)
+        
+        # Luôn ACK lại: bản gửi lại có thể do ACK trước đó bị mất
+        self.send_ack(client_key)
 
 if __name__ == "__main__":
-    server = OptimizedUDPServer()
+    import argparse
+    parser = argparse.ArgumentParser(description="Optimized UDP Server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--loss', type=float, default=0.0, help="Tỉ lệ mất gói mô phỏng (0 = không mô phỏng)")
+    args = parser.parse_args()
+
+    server = OptimizedUDPServer(args.host, args.port, loss_rate=args.loss)
     server.start()
@@ -0,0 +1,127 @@
+"""
+Pacing cho phía gửi UDP: giãn các datagram theo thời gian thay vì xả cả cửa sổ một lượt.
+
+Cửa sổ gửi (cwnd) chỉ giới hạn số message đang bay. Không có pacing, mỗi
+lần ACK mở cửa sổ client gửi liền một mạch mọi thứ được phép, đợt burst đó
+tràn buffer socket của bên nhận (hoặc hàng đợi của nút cổ chai) và gây mất
+gói do chính mình. Pacer là một token bucket tính theo byte:
+
+  - tốc độ : pacing_rate = gain * cửa sổ * bytes mỗi message / SRTT, tức cả
+             cửa sổ được gửi rải đều trong một RTT (gain 2 ở slow start để
+             cwnd vẫn gấp đôi mỗi RTT, 1.25 ở congestion avoidance), kẹp bởi
+             trần cứng max_rate nếu có; chưa có mẫu RTT thì chỉ trần cứng
+  - burst  : bucket chứa tối đa `burst` bytes (mặc định hai datagram), rảnh
+             lâu cũng không được xả bù một lượt lớn
+  - gửi trước, trả sau: mỗi datagram (kể cả gửi lại, parity, HELLO) trừ đúng
+             số byte thật vào bucket; bucket âm thì datagram dữ liệu kế tiếp
+             chờ đến khi trả hết nợ (delay = nợ / tốc độ)
+
+Thời gian tính bằng time.perf_counter (độ phân giải dưới micro giây) và nợ
+được tính liên tục, không làm tròn theo tick nên không trôi tốc độ. Event
+loop chỉ ngủ chính xác đến mili giây (epoll làm tròn timeout lên 1 ms), nên
+bên gửi ngủ phần lớn thời gian chờ rồi quay vòng nhường loop cho phần dưới
+SPIN_THRESHOLD cuối (wait_until), giữ khoảng cách giữa các datagram dưới
+mili giây mà ACK vẫn được xử lý trong lúc chờ.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from udp_bundler import DEFAULT_MAX_DATAGRAM
+
+# gain của pacing_rate theo pha của cwnd (giống Linux TCP: sk_pacing_ss/ca_ratio)
+SLOW_START_GAIN = 2.0
+CONGESTION_AVOIDANCE_GAIN = 1.25
+# Phần thời gian chờ cuối cùng được quay vòng thay vì ngủ (độ phân giải timer của event loop)
+SPIN_THRESHOLD = 0.001
+# Trọng số mẫu mới của trung bình trượt bytes mỗi message
+BYTES_PER_MESSAGE_WEIGHT = 1 / 8
+
+class Pacer:
+    def __init__(self, max_rate: float = 0.0, burst: int = 2 * DEFAULT_MAX_DATAGRAM, pacing: bool = True):
+        # Trần cứng (bytes/s), 0 = không giới hạn
+        self.max_rate = max_rate
+        self.burst = burst
+        # False: chỉ áp trần cứng, không pacing theo cửa sổ
+        self.pacing = pacing
+        # Tốc độ suy ra từ cửa sổ / SRTT (bytes/s), 0 = chưa biết
+        self.window_rate = 0.0
+        self.bytes_per_message = 0.0
+        self.tokens = float(burst)
+        self.updated_at = time.perf_counter()
+        self.stats = {
+            'paced_sends': 0,
+            'pacing_delay': 0.0,
+        }
+
+    @property
+    def rate(self) -> float:
+        """Tốc độ đang áp dụng (bytes/s), 0 = không giới hạn"""
+        window_rate = self.window_rate if self.pacing else 0.0
+        if window_rate and self.max_rate:
+            return min(window_rate, self.max_rate)
+        return window_rate or self.max_rate
+
+    def update(self, window: float, srtt: Optional[float], slow_start: bool):
+        """Tính lại pacing_rate từ cửa sổ gửi (message) và SRTT (giây)"""
+        if not self.pacing or not srtt or not self.bytes_per_message:
+            return
+        gain = SLOW_START_GAIN if slow_start else CONGESTION_AVOIDANCE_GAIN
+        self.window_rate = gain * window * self.bytes_per_message / srtt
+
+    def refill(self, now: float):
+        rate = self.rate
+        if rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * rate)
+        else:
+            self.tokens = self.burst
+        self.updated_at = now
+
+    def on_send(self, nbytes: int, messages: int = 0, now: Optional[float] = None):
+        """Trừ một datagram vừa gửi vào bucket; messages > 0 cập nhật bytes mỗi message"""
+        self.refill(now or time.perf_counter())
+        self.tokens -= nbytes
+        if messages:
+            sample = nbytes / messages
+            if self.bytes_per_message:
+                self.bytes_per_message += (sample - self.bytes_per_message) * BYTES_PER_MESSAGE_WEIGHT
+            else:
+                self.bytes_per_message = sample
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Số giây phải chờ trước datagram kế tiếp (0 nếu gửi được ngay)"""
+        self.refill(now or time.perf_counter())
+        rate = self.rate
+        if self.tokens >= 0 or not rate:
+            return 0.0
+        return -self.tokens / rate
+
+    async def wait(self, delay: Optional[float] = None):
+        """Chờ đến lượt datagram kế tiếp trên event loop hiện tại
+
+        `delay` đã tính sẵn (dưới lock của người gọi) thì chỉ ngủ, không chạm vào bucket.
+        """
+        if delay is None:
+            delay = self.delay()
+        if delay <= 0:
+            return
+        self.stats['paced_sends'] += 1
+        self.stats['pacing_delay'] += delay
+        await wait_until(time.perf_counter() + delay)
+
+    def snapshot(self) -> dict:
+        return {
+            'rate': self.rate,
+            'max_rate': self.max_rate,
+            'bytes_per_message': self.bytes_per_message,
+            **self.stats,
+        }
+
+async def wait_until(deadline: float):
+    """Ngủ đến gần `deadline` (perf_counter) rồi quay vòng nhường loop cho phần dưới mili giây"""
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN_THRESHOLD:
+        await asyncio.sleep(remaining - SPIN_THRESHOLD)
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(0)
@@ -0,0 +1,139 @@
+"""
+Phân mảnh và ghép lại message lớn ở tầng ứng dụng cho giao thức UDP.
+
+Message lớn hơn một datagram được client cắt thành các mảnh vừa MTU, mỗi mảnh
+là một message bình thường với seq chung và stream_seq liên tiếp, nên ACK /
+SACK / gửi lại hoạt động theo từng mảnh: mất một mảnh chỉ phải gửi lại đúng
+mảnh đó. Không còn phân mảnh ở tầng IP (mất một mảnh IP là mất cả datagram)
+và message không còn bị chặn ở 64 KB của một datagram UDP.
+
+Server ghép lại bằng Reassembler: mỗi message đang ghép giữ một bytearray
+đúng `total` bytes, cấp phát khi mảnh đầu tiên được giao, mảnh được chép
+thẳng vào vị trí của nó nên mảnh đến theo thứ tự nào cũng được. Ở stream có
+thứ tự, mảnh được giao theo stream_seq nên mỗi stream chỉ có một message đang
+ghép, mảnh đến sớm nằm ở buffer sắp xếp lại (đã bị chặn bởi cửa sổ nhận).
+Bộ nhớ bị chặn bởi max_bytes: mảnh của message chưa bắt đầu ghép chỉ được
+nhận khi còn đủ chỗ cho toàn bộ message (admits), nếu không mảnh bị bỏ mà
+không ACK và client gửi lại sau, giống như khi cửa sổ nhận đầy. Chỗ chỉ bị
+chiếm khi mảnh được giao, nên message đứng sau trong một stream không thể giữ
+chỗ của message đứng trước nó (không deadlock); đổi lại giới hạn là gần đúng,
+có thể vượt một chút khi nhiều mảnh cùng được nhận trước khi được giao.
+Message không nhận thêm mảnh nào trong `timeout` giây (client đã bỏ cuộc) bị
+hủy để trả bộ nhớ. Mảnh có (count, total) khác message đang ghép, hoặc nằm
+ngoài buffer của nó, bị bỏ (stats['rejected']): chép nó vào sẽ làm bytearray
+lớn quá phần đã giữ chỗ (vượt giới hạn bộ nhớ) hoặc ghi đè dữ liệu đã ghép.
+
+Ứng dụng không cần cả message trong bộ nhớ thì nhận từng mảnh qua callback
+on_fragment của server (streaming) và Reassembler không giữ gì.
+"""
+
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from udp_codec import MAX_FRAGMENTS, fragment_chunk
+
+# Tổng bộ nhớ tối đa cho các message đang ghép dở (mọi client)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Message lớn nhất server chịu ghép lại
+DEFAULT_MAX_MESSAGE = 16 * 1024 * 1024
+# Message không nhận thêm mảnh nào trong khoảng này (giây) bị hủy
+REASSEMBLY_TIMEOUT = 30.0
+
+class Fragment(NamedTuple):
+    """Một mảnh đang trên đường giao: vị trí trong message và payload của nó"""
+    index: int
+    count: int
+    total: int
+    payload: object
+
+    @property
+    def offset(self) -> int:
+        return self.index * fragment_chunk(self.total, self.count)
+
+def split_message(payload, max_fragment: int) -> Iterator[Tuple[Tuple[int, int, int], memoryview]]:
+    """Cắt payload thành các ((index, count, total), mảnh) mỗi mảnh tối đa `max_fragment` bytes"""
+    total = len(payload)
+    count = -(-total // max_fragment)
+    if count > MAX_FRAGMENTS:
+        raise ValueError(f"Message {total} bytes cần {count} mảnh, tối đa {MAX_FRAGMENTS}")
+    chunk = fragment_chunk(total, count)
+    view = memoryview(payload)
+    for index in range(count):
+        yield (index, count, total), view[index * chunk:(index + 1) * chunk]
+
+class PartialMessage:
+    __slots__ = ('buffer', 'count', 'received', 'last_seen')
+
+    def __init__(self, total: int, count: int, now: float):
+        self.buffer = bytearray(total)
+        self.count = count
+        self.received = 0
+        self.last_seen = now
+
+class Reassembler:
+    """Ghép các mảnh thành message, khóa theo (client, stream, stream_seq của mảnh đầu)"""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_message: int = DEFAULT_MAX_MESSAGE,
+                 timeout: float = REASSEMBLY_TIMEOUT):
+        self.max_bytes = max_bytes
+        self.max_message = min(max_message, max_bytes)
+        self.timeout = timeout
+        # dict giữ thứ tự tạo, phần tử đầu là message bắt đầu sớm nhất
+        self.partials: Dict[tuple, PartialMessage] = {}
+        # Tổng kích thước các message đang ghép (cấp phát đủ ngay từ mảnh đầu tiên được giao)
+        self.reserved = 0
+        self.stats = {
+            'completed': 0,
+            'timed_out': 0,
+            'rejected': 0,
+            'peak_bytes': 0,
+        }
+
+    def admits(self, key: tuple, total: int) -> bool:
+        """Mảnh của message `key` có được nhận không: message đang ghép, hoặc còn đủ chỗ cho cả message"""
+        return key in self.partials or (total <= self.max_message
+                                        and self.reserved + total <= self.max_bytes)
+
+    def add(self, key: tuple, fragment: Fragment, now: Optional[float] = None) -> Optional[bytearray]:
+        """Chép một mảnh (đã loại trùng) vào message, trả về message khi đủ mảnh
+
+        Mảnh không khớp message đang ghép (count / total khác) hoặc nằm ngoài
+        phạm vi của message bị bỏ qua và trả về None.
+        """
+        if now is None:
+            now = time.monotonic()
+        offset = fragment.offset
+        partial = self.partials.get(key)
+        if (not 0 <= fragment.index < fragment.count or offset + len(fragment.payload) > fragment.total
+                or partial is not None and (partial.count != fragment.count
+                                            or len(partial.buffer) != fragment.total)):
+            self.stats['rejected'] += 1
+            return None
+        if partial is None:
+            partial = self.partials[key] = PartialMessage(fragment.total, fragment.count, now)
+            self.reserved += fragment.total
+            self.stats['peak_bytes'] = max(self.stats['peak_bytes'], self.reserved)
+        partial.buffer[offset:offset + len(fragment.payload)] = fragment.payload
+        partial.received += 1
+        partial.last_seen = now
+        if partial.received < partial.count:
+            return None
+        del self.partials[key]
+        self.reserved -= len(partial.buffer)
+        self.stats['completed'] += 1
+        return partial.buffer
+
+    def expire(self, now: float) -> List[tuple]:
+        """Hủy các message không nhận thêm mảnh nào quá `timeout` giây, trả về khóa của chúng"""
+        expired = [key for key, partial in self.partials.items() if now - partial.last_seen > self.timeout]
+        for key in expired:
+            self.reserved -= len(self.partials.pop(key).buffer)
+        self.stats['timed_out'] += len(expired)
+        return expired
+
+    def discard(self, client_key) -> int:
+        """Bỏ mọi message đang ghép của một client (phiên bị xóa)"""
+        keys = [key for key in self.partials if key[0] == client_key]
+        for key in keys:
+            self.reserved -= len(self.partials.pop(key).buffer)
+        return len(keys)
@@ -0,0 +1,163 @@
+"""
+Trạng thái nhận có giới hạn cho mỗi client của server UDP.
+
+Thay cho một set chứa mọi seq đã xử lý (lớn dần mãi mãi), mỗi client chỉ
+giữ một cửa sổ trượt neo tại expected_seq:
+
+  - bitmap : số nguyên Python, bit i = 1 nghĩa là seq (expected + i) đã
+             nhận vượt thứ tự; kiểm tra trùng lặp là một phép dịch bit
+  - buffer : nội dung các message nhận vượt thứ tự, tối đa `size` phần tử,
+             được giao theo đúng thứ tự khi khoảng trống được lấp đầy;
+             payload memoryview (kể cả payload của một Fragment) được copy
+             sang bytes vì buffer nhận gốc sẽ bị ghi đè ở lô kế tiếp (chỉ
+             trên đường vượt thứ tự)
+
+Mọi seq < expected đã được xử lý nên không cần lưu lại. Bộ nhớ cho mỗi
+client vì vậy bị chặn bởi kích thước cửa sổ nhận, không phụ thuộc số
+message đã nhận. last_seen dùng để loại bỏ client không hoạt động (TTL).
+Phiên được server tra theo connection ID; address là địa chỉ gần nhất của
+client (đích của ACK), đổi theo client khi NAT gán lại port.
+
+Phiên chỉ dùng stream mặc định (stream_seq = seq) giao thẳng bằng offer trên
+cửa sổ của phiên. Khi client dùng stream, cửa sổ của phiên chỉ ghi nhận seq
+chung đã nhận (mark, cho ACK và SACK) mà không giữ nội dung; trạng thái cũ
+chuyển sang stream mặc định và mỗi stream có thứ tự có một ReceiveWindow
+riêng tính theo stream_seq, nên khoảng trống của stream này không chặn việc
+giao message của stream khác. Message bị giữ trong một stream luôn có seq
+chung nằm trong cửa sổ của phiên, nên tổng buffer của mọi stream vẫn bị
+chặn bởi `size`.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from reassembly import Fragment
+from udp_codec import DEFAULT_STREAM, FORMAT_BINARY
+
+# Kết quả của ReceiveWindow.offer
+DELIVERED = 'delivered'
+BUFFERED = 'buffered'
+DUPLICATE = 'duplicate'
+OUT_OF_WINDOW = 'out_of_window'
+
+def retain(content):
+    """Bản sao giữ lại được của content: memoryview trỏ vào buffer nhận sẽ bị ghi đè ở lô sau"""
+    if isinstance(content, memoryview):
+        return bytes(content)
+    if isinstance(content, Fragment) and isinstance(content.payload, memoryview):
+        return content._replace(payload=bytes(content.payload))
+    return content
+
+class ReceiveWindow:
+    __slots__ = ('size', 'expected', 'bitmap', 'buffer', 'fmt', 'last_seen', 'right_edge',
+                 'address', 'nonce', 'streams', 'challenge')
+
+    def __init__(self, size: int, fmt: str = FORMAT_BINARY, expected: int = 0, address=None,
+                 nonce: Optional[int] = None):
+        self.size = size
+        # Client bắt tay lại giữa chừng (RESET) báo seq chưa ACK nhỏ nhất để bắt đầu từ đó
+        self.expected = expected
+        self.bitmap = 0
+        self.buffer: Dict[int, Union[bytes, str]] = {}
+        # Định dạng (json/binary) client đang dùng, ACK trả về cùng định dạng
+        self.fmt = fmt
+        self.last_seen = time.monotonic()
+        # Seq nhỏ nhất nằm ngoài cửa sổ đã quảng bá; không được co lại (như TCP)
+        self.right_edge = expected + size
+        self.address = address
+        # Nonce của HELLO đã mở phiên (None với client không bắt tay)
+        self.nonce = nonce
+        # stream ID -> cửa sổ sắp xếp lại theo stream_seq (tạo khi gặp lần đầu)
+        self.streams: Optional[Dict[int, 'ReceiveWindow']] = None
+        # (địa chỉ mới, token, thời điểm gửi) của CHALLENGE đang chờ RESPONSE, None nếu không có
+        self.challenge = None
+
+    @property
+    def cumulative(self) -> int:
+        """Seq liên tục cao nhất đã nhận (-1 nếu chưa có)"""
+        return self.expected - 1
+
+    def is_duplicate(self, seq: int) -> bool:
+        return seq < self.expected or (self.bitmap >> (seq - self.expected)) & 1 == 1
+
+    def offer(self, seq: int, content) -> Tuple[str, List[Tuple[int, object]]]:
+        """Nhận một message, trả về (kết quả, các (seq, content) được giao theo thứ tự)"""
+        if self.is_duplicate(seq):
+            return DUPLICATE, []
+        if seq >= self.expected + self.size:
+            return OUT_OF_WINDOW, []
+
+        if seq != self.expected:
+            self.bitmap |= 1 << (seq - self.expected)
+            self.buffer[seq] = retain(content)
+            return BUFFERED, []
+
+        # Số bit 1 liên tiếp từ bit 0 (sau khi đánh dấu seq vừa nhận) là số message giao được
+        bitmap = self.bitmap | 1
+        run = (~bitmap & (bitmap + 1)).bit_length() - 1
+        delivered = [(seq, content)]
+        delivered.extend((s, self.buffer.pop(s)) for s in range(seq + 1, seq + run))
+        self.expected += run
+        self.bitmap = bitmap >> run
+        return DELIVERED, delivered
+
+    def mark(self, seq: int) -> str:
+        """Ghi nhận seq đã nhận mà không giữ nội dung (nội dung nằm ở cửa sổ của stream)"""
+        if self.is_duplicate(seq):
+            return DUPLICATE
+        if seq >= self.expected + self.size:
+            return OUT_OF_WINDOW
+        if seq != self.expected:
+            self.bitmap |= 1 << (seq - self.expected)
+            return BUFFERED
+        bitmap = self.bitmap | 1
+        run = (~bitmap & (bitmap + 1)).bit_length() - 1
+        self.expected += run
+        self.bitmap = bitmap >> run
+        return DELIVERED
+
+    def open_streams(self, bases: List[Tuple[int, int]]):
+        """Chuyển sang chế độ stream với các (stream ID, stream_seq bắt đầu) cho trước"""
+        self.streams = {stream_id: ReceiveWindow(self.size, self.fmt, base) for stream_id, base in bases}
+
+    def stream(self, stream_id: int) -> 'ReceiveWindow':
+        """Cửa sổ của một stream (tạo mới từ stream_seq 0 nếu chưa có)
+
+        Lần đầu gọi, trạng thái hiện có của phiên (mọi message trước đó thuộc stream
+        mặc định với stream_seq = seq) chuyển nguyên sang cửa sổ của stream mặc định.
+        """
+        if self.streams is None:
+            default = ReceiveWindow(self.size, self.fmt, self.expected)
+            default.bitmap, default.buffer = self.bitmap, self.buffer
+            self.buffer = {}
+            self.streams = {DEFAULT_STREAM: default}
+        window = self.streams.get(stream_id)
+        if window is None:
+            window = self.streams[stream_id] = ReceiveWindow(self.size, self.fmt)
+        return window
+
+    def advertise(self, window: int) -> int:
+        """Ghi nhận cửa sổ vừa quảng bá, mép phải chỉ tiến chứ không lùi"""
+        self.right_edge = max(self.right_edge, self.expected + window)
+        return window
+
+    def available(self) -> int:
+        """Số chỗ trống còn lại trong buffer sắp xếp lại (tính cả buffer của các stream)"""
+        buffered = len(self.buffer)
+        if self.streams:
+            buffered += sum(len(window.buffer) for window in self.streams.values())
+        return max(0, self.size - buffered)
+
+    def sack_blocks(self, max_blocks: int) -> List[Tuple[int, int]]:
+        """Các khoảng [lo, hi] đã nhận vượt thứ tự, đọc trực tiếp từ bitmap"""
+        blocks: List[Tuple[int, int]] = []
+        bitmap, base = self.bitmap, self.expected
+        while bitmap and len(blocks) < max_blocks:
+            gap = (bitmap & -bitmap).bit_length() - 1
+            bitmap >>= gap
+            base += gap
+            run = (~bitmap & (bitmap + 1)).bit_length() - 1
+            blocks.append((base, base + run - 1))
+            bitmap >>= run
+            base += run
+        return blocks
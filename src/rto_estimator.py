@@ -0,0 +1,65 @@
+"""
+Ước lượng Retransmission Timeout (RTO) theo Jacobson/Karels (RFC 6298).
+
+    RTTVAR = (1 - beta) * RTTVAR + beta * |SRTT - R|
+    SRTT   = (1 - alpha) * SRTT + alpha * R
+    RTO    = SRTT + max(G, K * RTTVAR)
+
+Theo thuật toán Karn, chỉ lấy mẫu RTT từ message chưa bị gửi lại (không
+biết ACK trả lời cho lần gửi nào). Khi hết hạn, RTO được nhân đôi theo số
+lần gửi lại của chính message đó (exponential backoff, timeout_for) và luôn
+bị kẹp trong [min_rto, max_rto]. Backoff chỉ áp một lần: RTO chung không bị
+nhân đôi khi timeout (nếu không timeout của message tăng theo 4^k thay vì 2^k).
+Mẫu RTT phải đo bằng đồng hồ đơn điệu (time.monotonic) để bước nhảy của giờ
+hệ thống không làm hỏng SRTT.
+"""
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+
+INITIAL_RTO = 1.0
+# Sàn RTO: trên loopback có tải, độ trễ hàng đợi tăng lên hàng chục ms chỉ trong vài
+# RTT, nhanh hơn SRTT/RTTVAR bắt kịp; sàn 10 ms gây gửi lại giả ngay cả khi không mất gói
+MIN_RTO = 0.1
+MAX_RTO = 60.0
+CLOCK_GRANULARITY = 0.001
+
+class RtoEstimator:
+    def __init__(self, initial_rto: float = INITIAL_RTO, min_rto: float = MIN_RTO,
+                 max_rto: float = MAX_RTO, granularity: float = CLOCK_GRANULARITY):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self.clamp(initial_rto)
+        self.samples = 0
+
+    def clamp(self, rto: float) -> float:
+        return min(self.max_rto, max(self.min_rto, rto))
+
+    def on_sample(self, rtt: float) -> float:
+        """Cập nhật SRTT/RTTVAR từ một mẫu RTT hợp lệ (theo Karn), trả về RTO mới"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+
+        self.rto = self.clamp(self.srtt + max(self.granularity, K * self.rttvar))
+        self.samples += 1
+        return self.rto
+
+    def timeout_for(self, retries: int) -> float:
+        """RTO sau `retries` lần gửi lại (exponential backoff)"""
+        return self.clamp(self.rto * (2 ** retries))
+
+    def snapshot(self) -> dict:
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'rto': self.rto,
+            'samples': self.samples,
+        }
@@ -0,0 +1,144 @@
+"""
+Kích thước buffer socket theo bandwidth-delay product và bộ đếm drop của kernel.
+
+Buffer mặc định của socket UDP (~208 KB trên Linux) chỉ chứa được vài trăm
+datagram: khi một burst đến lúc event loop đang bận, kernel lặng lẽ bỏ phần
+tràn và giao thức đếm nó thành mất gói, như thể mạng nghẽn. Mỗi endpoint vì
+vậy đặt buffer cho chiều mang dữ liệu theo BDP của đường truyền:
+
+  - BDP      : bandwidth (bit/s) / 8 * RTT = số byte đang bay trong một RTT
+  - buffer   : BDP_HEADROOM * BDP, kẹp trong [MIN_BUFFER, MAX_BUFFER], để chứa
+               cả một cửa sổ cộng burst trong lúc bên nhận chưa kịp đọc
+  - chiều ACK: ACK nhỏ và thưa (một ACK mỗi bundle) nên chỉ cần MIN_BUFFER
+
+Server đặt SO_RCVBUF (dữ liệu vào) và client đặt SO_SNDBUF (dữ liệu ra).
+Kernel có thể cắt giá trị yêu cầu theo net.core.rmem_max / wmem_max: khi đó
+thử SO_RCVBUFFORCE / SO_SNDBUFFORCE (cần CAP_NET_ADMIN), không được thì báo
+kích thước thật để người vận hành tăng sysctl. Linux nhân đôi giá trị đặt
+(phần dư cho overhead của kernel) nên getsockopt trả gấp đôi; kích thước báo
+cáo là giá trị kernel đã chấp nhận, so được với giá trị yêu cầu.
+
+Trên Linux, KernelDropCounter đọc cột drops của socket trong /proc/net/udp
+(khớp theo inode của socket), tức số datagram kernel bỏ vì buffer nhận đầy,
+tách biệt với packets_lost do bộ mô phỏng đếm: drops tăng nghĩa là buffer quá
+nhỏ hoặc bên nhận quá chậm, không phải mạng nghẽn. Cách này không tốn gì trên
+đường nhận (SO_RXQ_OVFL buộc phải đọc ancillary data ở mỗi lần recvmsg) và
+chỉ đọc khi in thống kê.
+"""
+
+import argparse
+import os
+import socket
+import sys
+from typing import Dict, Optional, Tuple
+
+# Giả định mặc định khi không biết đường truyền: 1 Gbit/s, RTT 10 ms
+DEFAULT_BANDWIDTH_BPS = 1_000_000_000
+DEFAULT_RTT = 0.01
+# Buffer = BDP_HEADROOM * BDP để chứa một cửa sổ cộng burst
+BDP_HEADROOM = 2
+MIN_BUFFER = 256 * 1024
+MAX_BUFFER = 64 * 1024 * 1024
+
+PROC_UDP_TABLES = ('/proc/net/udp', '/proc/net/udp6')
+# Linux nhân đôi giá trị SO_RCVBUF/SO_SNDBUF được đặt
+KERNEL_DOUBLES = sys.platform.startswith('linux')
+
+# Bỏ qua rmem_max/wmem_max (Linux, cần CAP_NET_ADMIN)
+FORCE_OPTIONS = {
+    socket.SO_RCVBUF: getattr(socket, 'SO_RCVBUFFORCE', None),
+    socket.SO_SNDBUF: getattr(socket, 'SO_SNDBUFFORCE', None),
+}
+# sysctl giới hạn từng loại buffer, để gợi ý khi giá trị yêu cầu bị cắt
+SYSCTL_LIMITS = {'rcvbuf': 'net.core.rmem_max', 'sndbuf': 'net.core.wmem_max'}
+
+def bdp_bytes(bandwidth_bps: float, rtt: float) -> int:
+    """Bandwidth-delay product (bytes)"""
+    return int(bandwidth_bps / 8 * rtt)
+
+def buffer_size(bandwidth_bps: float, rtt: float) -> int:
+    """Kích thước buffer cho chiều mang dữ liệu của một đường truyền"""
+    return min(MAX_BUFFER, max(MIN_BUFFER, BDP_HEADROOM * bdp_bytes(bandwidth_bps, rtt)))
+
+def accepted_size(sock: socket.socket, option: int) -> int:
+    """Giá trị kernel đã chấp nhận sau setsockopt (bỏ phần Linux nhân đôi)"""
+    value = sock.getsockopt(socket.SOL_SOCKET, option)
+    return value // 2 if KERNEL_DOUBLES else value
+
+def set_buffer(sock: socket.socket, option: int, size: int) -> int:
+    """Đặt SO_RCVBUF/SO_SNDBUF, thử bản FORCE nếu bị sysctl cắt; trả về kích thước thật"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, option, size)
+    except OSError:
+        pass
+    actual = accepted_size(sock, option)
+    force = FORCE_OPTIONS.get(option)
+    if actual < size and force is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, force, size)
+            actual = accepted_size(sock, option)
+        except OSError:
+            pass
+    return actual
+
+def tune_buffers(sock: socket.socket, rcvbuf: int = 0, sndbuf: int = 0) -> Dict[str, Tuple[int, int]]:
+    """Đặt buffer nhận / gửi (0 = giữ mặc định), trả về {tên: (yêu cầu, thật)}"""
+    result = {}
+    for name, option, size in (('rcvbuf', socket.SO_RCVBUF, rcvbuf), ('sndbuf', socket.SO_SNDBUF, sndbuf)):
+        if size:
+            result[name] = (size, set_buffer(sock, option, size))
+        else:
+            # Chưa từng đặt: giá trị mặc định của OS (rmem_default / wmem_default), không bị nhân đôi
+            result[name] = (0, sock.getsockopt(socket.SOL_SOCKET, option))
+    return result
+
+def format_buffers(buffers: Dict[str, Tuple[int, int]]) -> str:
+    parts = []
+    for name, (requested, actual) in buffers.items():
+        text = f"{name} {actual // 1024} KB"
+        if requested and actual < requested:
+            text += f" (yêu cầu {requested // 1024} KB, bị cắt bởi {SYSCTL_LIMITS[name]})"
+        parts.append(text)
+    return ", ".join(parts)
+
+class KernelDropCounter:
+    """Số datagram kernel đã bỏ của một socket UDP (cột drops trong /proc/net/udp)"""
+
+    def __init__(self, sock: socket.socket):
+        self.inode: Optional[str] = None
+        if os.path.exists(PROC_UDP_TABLES[0]):
+            try:
+                self.inode = str(os.fstat(sock.fileno()).st_ino)
+            except OSError:
+                pass
+        # Giá trị đọc được gần nhất, giữ lại sau khi socket đã đóng
+        self.last = 0
+
+    @property
+    def available(self) -> bool:
+        return self.inode is not None
+
+    def read(self) -> int:
+        """Đọc lại bộ đếm drops (0 nếu không hỗ trợ, giá trị cũ nếu socket đã đóng)"""
+        if self.inode is None:
+            return self.last
+        for path in PROC_UDP_TABLES:
+            try:
+                with open(path, encoding='ascii') as f:
+                    next(f)
+                    for line in f:
+                        fields = line.split()
+                        # ... uid timeout inode ref pointer drops
+                        if len(fields) >= 13 and fields[9] == self.inode:
+                            self.last = int(fields[12])
+                            return self.last
+            except OSError:
+                continue
+        return self.last
+
+def add_buffer_arguments(parser: argparse.ArgumentParser):
+    """Thêm các tham số dòng lệnh để tính buffer socket theo BDP"""
+    group = parser.add_argument_group("socket buffers")
+    group.add_argument('--bandwidth-mbps', type=float, default=DEFAULT_BANDWIDTH_BPS / 1e6,
+                       help="Băng thông đường truyền để tính BDP (0 = giữ buffer mặc định của OS)")
+    group.add_argument('--rtt-ms', type=float, default=DEFAULT_RTT * 1000, help="RTT ước lượng để tính BDP")
@@ -0,0 +1,91 @@
+"""
+Hashed timer wheel: một thread duy nhất phục vụ mọi timer gửi lại.
+
+Mỗi timer được băm vào một slot theo thời điểm hết hạn; thread của wheel
+quay qua từng slot sau mỗi tick và chạy các timer đến hạn. Đặt (schedule)
+và hủy (cancel) timer đều là O(1), và số thread không đổi dù có bao nhiêu
+message đang chờ ACK.
+"""
+
+import math
+import threading
+import time
+from typing import Callable, List, Set
+
+class TimerHandle:
+    __slots__ = ('wheel', 'slot', 'rounds', 'callback', 'args', 'cancelled')
+
+    def __init__(self, wheel: 'TimerWheel', slot: int, rounds: int, callback: Callable, args: tuple):
+        self.wheel = wheel
+        self.slot = slot
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+class TimerWheel:
+    def __init__(self, tick: float = 0.01, slots: int = 512):
+        self.tick = tick
+        self.wheel: List[Set[TimerHandle]] = [set() for _ in range(slots)]
+        self.current = 0
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='timer-wheel', daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay: float, callback: Callable, *args) -> TimerHandle:
+        """Gọi callback(*args) sau `delay` giây (làm tròn lên theo tick)"""
+        ticks = max(1, math.ceil(delay / self.tick))
+        with self.lock:
+            slot = (self.current + ticks) % len(self.wheel)
+            handle = TimerHandle(self, slot, (ticks - 1) // len(self.wheel), callback, args)
+            self.wheel[slot].add(handle)
+            self.pending += 1
+        return handle
+
+    def cancel(self, handle: TimerHandle):
+        with self.lock:
+            if not handle.cancelled and handle in self.wheel[handle.slot]:
+                self.wheel[handle.slot].discard(handle)
+                self.pending -= 1
+            handle.cancelled = True
+
+    def _advance(self) -> List[TimerHandle]:
+        """Sang slot kế tiếp, lấy ra các timer đã đến hạn"""
+        with self.lock:
+            self.current = (self.current + 1) % len(self.wheel)
+            bucket = self.wheel[self.current]
+            due = []
+            for handle in bucket:
+                if handle.rounds == 0:
+                    due.append(handle)
+                else:
+                    handle.rounds -= 1
+            for handle in due:
+                bucket.discard(handle)
+                handle.cancelled = True
+            self.pending -= len(due)
+        return due
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while self.running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick += self.tick
+
+            for handle in self._advance():
+                try:
+                    handle.callback(*handle.args)
+                except Exception as e:
+                    print(f"Lỗi timer callback: {e}")
+
+    def stop(self):
+        self.running = False
+        if threading.current_thread() is not self.thread:
+            self.thread.join(timeout=1.0)
@@ -0,0 +1,131 @@
+"""
+Bundler theo ngân sách byte (MTU-aware) cho client UDP.
+
+Thay cho bundling cố định theo số lượng, các message được xếp vào bundle
+hiện tại cho đến khi kích thước đã encode chạm trần datagram (mặc định
+1200 byte, dưới MTU đường truyền phổ biến nên không bị phân mảnh IP).
+Bundle được đẩy đi (flush) khi:
+
+  - size     : message kế tiếp không còn vừa ngân sách byte
+  - count    : đủ số message tối đa mỗi bundle
+  - deadline : message đầu tiên đã chờ quá max_delay (giống Nagle); add() chỉ
+               kiểm tra khi có message mới, nên người gửi hẹn thêm một timer
+               theo time_until_due() để bundle không bị giữ khi luồng gửi dừng
+  - final    : người gửi chủ động flush phần còn lại
+
+Message thuộc stream khác mặc định mang thêm trường stream; bundle nhị phân
+ghi trường này cho mọi message hoặc không message nào, nên khi message đầu
+tiên có stream vào bundle thì các message đã xếp trước đó cũng được tính thêm.
+
+Tỉ lệ lấp đầy (fill ratio = byte đã dùng / trần datagram) được thống kê
+để biết mỗi datagram chở được bao nhiêu dữ liệu.
+"""
+
+import time
+from typing import List
+
+from udp_codec import FORMAT_BINARY, STREAM_FIELDS, bundle_overhead, message_wire_size
+
+# Trần datagram an toàn (giống QUIC): IPv6 MTU tối thiểu 1280 trừ header IP/UDP
+DEFAULT_MAX_DATAGRAM = 1200
+DEFAULT_MAX_COUNT = 64
+DEFAULT_MAX_DELAY = 0.005
+
+FLUSH_REASONS = ('size', 'count', 'deadline', 'final')
+
+class Bundler:
+    def __init__(self, max_datagram: int = DEFAULT_MAX_DATAGRAM, max_count: int = DEFAULT_MAX_COUNT,
+                 max_delay: float = DEFAULT_MAX_DELAY, wire_format: str = FORMAT_BINARY):
+        self.max_datagram = max_datagram
+        self.max_count = max_count
+        self.max_delay = max_delay
+        self.wire_format = wire_format
+        self.overhead = bundle_overhead(wire_format)
+
+        self.pending: List = []
+        self.pending_bytes = self.overhead
+        self.first_queued_at = 0.0
+        # Bundle đang mở đã có message mang trường stream
+        self.pending_streams = False
+
+        self.stats = {
+            'bundles': 0,
+            'messages': 0,
+            'bytes': 0,
+            'oversized': 0,
+            'flushes': dict.fromkeys(FLUSH_REASONS, 0),
+        }
+
+    def add(self, message) -> List[List]:
+        """Thêm một message (có .seq, .content, .stream_fields), trả về các bundle đã đủ điều kiện gửi"""
+        stream = message.stream_fields
+        size = message_wire_size(message.seq, message.content, self.wire_format, stream)
+        widen = 0
+        if self.wire_format == FORMAT_BINARY:
+            if stream is not None and not self.pending_streams:
+                # Bundle chuyển sang có trường stream: các message đã xếp cũng dài thêm
+                widen = STREAM_FIELDS.size * len(self.pending)
+            elif stream is None and self.pending_streams:
+                size += STREAM_FIELDS.size
+        ready = []
+
+        if self.pending and self.pending_bytes + widen + size > self.max_datagram:
+            ready.append(self.flush('size'))
+            widen = 0
+
+        if not self.pending:
+            self.first_queued_at = time.monotonic()
+        self.pending.append(message)
+        self.pending_bytes += size + widen
+        self.pending_streams = self.pending_streams or stream is not None
+
+        if self.pending_bytes > self.max_datagram:
+            # Một message đơn lẻ đã vượt trần: gửi riêng, chấp nhận phân mảnh IP
+            self.stats['oversized'] += 1
+            ready.append(self.flush('size'))
+        elif len(self.pending) >= self.max_count:
+            ready.append(self.flush('count'))
+        elif self.due():
+            ready.append(self.flush('deadline'))
+        return ready
+
+    def due(self) -> bool:
+        """Message đầu tiên trong bundle đang mở đã chờ quá max_delay chưa"""
+        return bool(self.pending) and time.monotonic() - self.first_queued_at >= self.max_delay
+
+    def time_until_due(self) -> float:
+        """Số giây còn lại đến hạn flush của bundle đang mở (0 nếu đã quá hạn)"""
+        return max(0.0, self.first_queued_at + self.max_delay - time.monotonic())
+
+    def flush(self, reason: str = 'final') -> List:
+        """Đóng bundle hiện tại và trả về danh sách message của nó (rỗng nếu không có gì)"""
+        bundle = self.pending
+        if not bundle:
+            return bundle
+
+        self.stats['bundles'] += 1
+        self.stats['messages'] += len(bundle)
+        self.stats['bytes'] += self.pending_bytes
+        self.stats['flushes'][reason] += 1
+
+        self.pending = []
+        self.pending_bytes = self.overhead
+        self.pending_streams = False
+        return bundle
+
+    def fill_ratio(self) -> float:
+        """Tỉ lệ lấp đầy trung bình của các datagram đã gửi"""
+        if not self.stats['bundles']:
+            return 0.0
+        return self.stats['bytes'] / (self.stats['bundles'] * self.max_datagram)
+
+    def snapshot(self) -> dict:
+        bundles = self.stats['bundles']
+        return {
+            'bundles': bundles,
+            'messages_per_bundle': self.stats['messages'] / bundles if bundles else 0.0,
+            'bytes_per_bundle': self.stats['bytes'] / bundles if bundles else 0.0,
+            'fill_ratio': self.fill_ratio(),
+            'oversized': self.stats['oversized'],
+            'flushes': dict(self.stats['flushes']),
+        }
@@ -0,0 +1,563 @@
+"""
+Mã hóa / giải mã gói tin cho giao thức UDP tối ưu hóa.
+
+Hỗ trợ hai định dạng trên dây:
+  - JSON   : định dạng gốc, dễ đọc nhưng tốn CPU và byte
+  - BINARY : định dạng nhị phân gọn dùng struct
+
+Gói nhị phân bắt đầu bằng byte version (khác '{' của JSON), nên bên nhận
+tự nhận ra định dạng từ byte đầu tiên mà không cần thương lượng trước:
+
+    +---------+------+-----------+----------------+--------------------------+
+    | version | type | count u16 | count x seq u32| count x (len u16 + data) |
+    +---------+------+-----------+----------------+--------------------------+
+
+Gói ACK mang ACK tích lũy (seq liên tục cao nhất đã nhận, -1 nếu chưa có;
+trên dây là u32 như mọi seq, NO_CUMULATIVE = 0xFFFFFFFF thay cho -1),
+cửa sổ nhận còn trống của server (rwnd, tính theo message) cùng các SACK
+block [lo, hi] cho những seq nhận vượt thứ tự. Với gói ACK nhị phân, trường
+count là số SACK block:
+
+    +---------+------+-----------+-------------+----------+--------------------------+
+    | version | type | count u16 | cum_ack u32 | rwnd u16 | count x (lo u32, hi u32) |
+    +---------+------+-----------+-------------+----------+--------------------------+
+
+Kết nối có connection ID (chỉ định dạng nhị phân): client gửi HELLO (nonce
+ngẫu nhiên + seq bắt đầu), server cấp một connection ID u32 ngẫu nhiên trong
+WELCOME. Các gói sau đó bật bit FLAG_CONNECTION_ID của byte type và mang ID
+ngay sau header, nên server tra phiên bằng số nguyên thay vì địa chỉ và phiên
+vẫn sống khi địa chỉ/port nguồn của client đổi (NAT rebinding). Gói mang ID
+mà server không biết được trả lời bằng RESET để client bắt tay lại. Gói
+mang ID đến từ địa chỉ mới chưa đổi địa chỉ của phiên ngay: server gửi
+CHALLENGE (token u64 ngẫu nhiên) tới địa chỉ mới và chỉ chuyển phiên sang đó
+khi nhận RESPONSE mang đúng token từ chính địa chỉ ấy, nên kẻ biết connection
+ID nhưng không nhận được gói gửi tới địa chỉ thật không cướp được ACK:
+
+    +---------+-------------+-----------+----------------------+---------+
+    | version | type | 0x80 | count u16 | connection_id u32    | ...     |
+    +---------+-------------+-----------+----------------------+---------+
+
+    HELLO   : nonce u32, seq bắt đầu u32, count x (stream u16, stream_seq bắt đầu u32)
+    WELCOME : (ID trong header) nonce u32
+    RESET   : (ID trong header)
+    CHALLENGE / RESPONSE : (ID trong header) token u64
+
+Stream: mỗi message thuộc một stream (mặc định stream 0) và mang stream_seq
+riêng của stream đó. seq chung vẫn dùng cho ACK / SACK / gửi lại, còn thứ
+tự giao cho ứng dụng tính theo stream_seq trong từng stream, nên một message
+mất chỉ chặn stream của nó. Bit STREAM_UNORDERED của stream ID đánh dấu
+stream giao ngay không cần thứ tự. Message ở stream 0 với stream_seq = seq
+(client không mở stream nào) không cần ghi gì thêm; bundle có message khác
+mặc định bật bit FLAG_STREAMS của byte type và mọi message trong bundle mang
+thêm hai trường trước độ dài payload:
+
+    +---------+-------------+-----------+-----------------+-------------------------------------------------+
+    | version | type | 0x40 | count u16 | count x seq u32 | count x (stream u16, stream_seq u32, len u16 + data) |
+    +---------+-------------+-----------+-----------------+-------------------------------------------------+
+
+Gói JSON thêm khóa 'stream' và 'sseq' vào từng message khác mặc định.
+
+Phân mảnh (chỉ định dạng nhị phân): message lớn hơn một datagram được cắt
+thành `count` mảnh, mỗi mảnh là một message riêng (seq và stream_seq liên
+tiếp) nên được ACK / gửi lại độc lập. Bundle mang mảnh bật bit FLAG_FRAGMENTS
+và mọi message của nó có thêm (index u16, count u16, total u32) ngay trước độ
+dài payload (sau trường stream nếu có); message nguyên vẹn ghi (0, 1, len).
+Mọi mảnh trừ mảnh cuối dài đúng fragment_chunk(total, count) bytes, nên vị
+trí của mảnh trong message là index * fragment_chunk(total, count).
+
+Chế độ FEC (chỉ định dạng nhị phân): bundle được gửi với type FEC_BUNDLE
+để bên nhận giữ lại bản sao, sau mỗi nhóm k bundle là một gói PARITY mang
+XOR của cả nhóm (đệm 0 đến độ dài lớn nhất) và danh sách thành viên, mỗi
+thành viên nhận diện bằng seq đầu tiên và độ dài datagram:
+
+    +---------+------+-----------+-----------------------------------+--------+
+    | version | type | count u16 | count x (first_seq u32, len u16)  | parity |
+    +---------+------+-----------+-----------------------------------+--------+
+
+Mọi gói sau khi decode đều được trả về dưới dạng dict giống hệt JSON; nội
+dung không phải UTF-8 (message bytes) được giữ nguyên dạng bytes. Gói JSON
+được kiểm tra kiểu từng trường (seq / stream / cum là số nguyên trong miền
+của trường nhị phân tương ứng, content là chuỗi...) ngay khi decode: gói sai
+kiểu là CodecError như mọi gói hỏng khác, không lọt xuống vòng nhận.
+parse_datagram là đường nhận zero-copy: đọc header ngay trên memoryview và
+trả payload dưới dạng memoryview trỏ vào buffer gốc, không tạo bytes/str/dict
+cho từng message; payload_text chỉ decode khi bên dùng thật sự cần chuỗi.
+
+bundle_overhead / message_wire_size cho biết số byte một bundle sẽ chiếm
+trên dây mà không cần encode thử, dùng để đóng gói theo ngân sách MTU.
+"""
+
+import json
+import struct
+from typing import List, Optional, Tuple, Union
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+WIRE_VERSION = 1
+JSON_MARKER = ord('{')
+
+TYPE_BUNDLE = 1
+TYPE_SINGLE = 2
+TYPE_ACK = 3
+TYPE_FEC_BUNDLE = 4
+TYPE_PARITY = 5
+TYPE_HELLO = 6
+TYPE_WELCOME = 7
+TYPE_RESET = 8
+TYPE_CHALLENGE = 9
+TYPE_RESPONSE = 10
+
+# Bit cao của byte type: header có thêm connection ID u32
+FLAG_CONNECTION_ID = 0x80
+# Mỗi message của bundle có thêm (stream u16, stream_seq u32)
+FLAG_STREAMS = 0x40
+# Mỗi message của bundle có thêm (index u16, count u16, total u32) của mảnh
+FLAG_FRAGMENTS = 0x20
+TYPE_MASK = 0x1F
+
+DEFAULT_STREAM = 0
+# Bit cao của stream ID trên dây: stream giao không theo thứ tự
+STREAM_UNORDERED = 0x8000
+MAX_STREAM_ID = 0x7FFF
+
+TYPE_CODES = {'bundle': TYPE_BUNDLE, 'single': TYPE_SINGLE, 'ack': TYPE_ACK,
+              'fec_bundle': TYPE_FEC_BUNDLE, 'parity': TYPE_PARITY,
+              'hello': TYPE_HELLO, 'welcome': TYPE_WELCOME, 'reset': TYPE_RESET,
+              'challenge': TYPE_CHALLENGE, 'response': TYPE_RESPONSE}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+HEADER = struct.Struct('!BBH')
+LENGTH = struct.Struct('!H')
+ACK_FIELDS = struct.Struct('!IH')
+PARITY_MEMBER = struct.Struct('!IH')
+CONNECTION_ID = struct.Struct('!I')
+HANDSHAKE = struct.Struct('!II')
+PATH_TOKEN = struct.Struct('!Q')
+STREAM_FIELDS = struct.Struct('!HI')
+FRAGMENT_FIELDS = struct.Struct('!HHI')
+MAX_WINDOW = 0xFFFF
+MAX_PAYLOAD = 0xFFFF
+MAX_FRAGMENTS = 0xFFFF
+# cum_ack trên dây khi chưa nhận được seq nào (-1)
+NO_CUMULATIVE = 0xFFFFFFFF
+
+# '{"type": "bundle", "messages": []}' không kể các message bên trong
+JSON_BUNDLE_OVERHEAD = len(json.dumps({'type': 'bundle', 'messages': []}))
+# Dấu ', ' ngăn cách các phần tử trong danh sách JSON
+JSON_SEPARATOR = 2
+
+class CodecError(ValueError):
+    """Gói tin không hợp lệ hoặc không giải mã được"""
+
+def _pack_header(packet_type: int, count: int, connection_id: int = 0) -> bytes:
+    if connection_id:
+        return (HEADER.pack(WIRE_VERSION, packet_type | FLAG_CONNECTION_ID, count)
+                + CONNECTION_ID.pack(connection_id))
+    return HEADER.pack(WIRE_VERSION, packet_type, count)
+
+def _unpack_header(data) -> Tuple[int, int, int, int, int]:
+    """(loại gói, count, connection ID hoặc 0, offset phần thân, các bit FLAG_STREAMS / FLAG_FRAGMENTS)"""
+    _, type_byte, count = HEADER.unpack_from(data, 0)
+    flags = type_byte & (FLAG_STREAMS | FLAG_FRAGMENTS)
+    if type_byte & FLAG_CONNECTION_ID:
+        (connection_id,) = CONNECTION_ID.unpack_from(data, HEADER.size)
+        return type_byte & TYPE_MASK, count, connection_id, HEADER.size + CONNECTION_ID.size, flags
+    return type_byte & TYPE_MASK, count, 0, HEADER.size, flags
+
+def _payload_bytes(content: Union[str, bytes, memoryview]):
+    """Payload trên dây của một message: chuỗi được encode UTF-8, bytes / memoryview giữ nguyên"""
+    return content.encode() if isinstance(content, str) else content
+
+def _pack_messages(packet_type: int, messages: List[Tuple[int, str]], connection_id: int = 0,
+                   streams: Optional[List[Tuple[int, int]]] = None,
+                   fragments: Optional[List[Optional[Tuple[int, int, int]]]] = None) -> bytes:
+    count = len(messages)
+    if streams is not None:
+        packet_type |= FLAG_STREAMS
+    if fragments is not None:
+        packet_type |= FLAG_FRAGMENTS
+    parts = [_pack_header(packet_type, count, connection_id),
+             struct.pack(f'!{count}I', *(seq for seq, _ in messages))]
+    for i, (_, content) in enumerate(messages):
+        payload = _payload_bytes(content)
+        if len(payload) > MAX_PAYLOAD:
+            raise CodecError(f"Payload {len(payload)} bytes vượt quá {MAX_PAYLOAD}")
+        if streams is not None:
+            parts.append(STREAM_FIELDS.pack(*streams[i]))
+        if fragments is not None:
+            parts.append(FRAGMENT_FIELDS.pack(*(fragments[i] or (0, 1, len(payload)))))
+        parts.append(LENGTH.pack(len(payload)))
+        parts.append(payload)
+    return b''.join(parts)
+
+def _json_message(seq: int, content: str, stream: Optional[Tuple[int, int]]) -> dict:
+    if stream is None:
+        return {'seq': seq, 'content': content}
+    return {'seq': seq, 'content': content, 'stream': stream[0], 'sseq': stream[1]}
+
+def bundle_overhead(fmt: str = FORMAT_BINARY) -> int:
+    """Số byte cố định của một bundle rỗng (nhị phân: tính cả connection ID)"""
+    if fmt == FORMAT_BINARY:
+        return HEADER.size + CONNECTION_ID.size
+    return JSON_BUNDLE_OVERHEAD
+
+def message_wire_size(seq: int, content: str, fmt: str = FORMAT_BINARY,
+                      stream: Optional[Tuple[int, int]] = None) -> int:
+    """Số byte một message thêm vào bundle (JSON: tính dư dấu phân cách, không bao giờ thiếu)
+
+    stream là (stream, stream_seq) khi message cần ghi trường stream, None nếu là mặc định.
+    """
+    if fmt == FORMAT_BINARY:
+        size = 4 + LENGTH.size + len(_payload_bytes(content))
+        return size + STREAM_FIELDS.size if stream is not None else size
+    return len(json.dumps(_json_message(seq, content, stream)).encode()) + JSON_SEPARATOR
+
+def fragment_payload_size(max_datagram: int) -> int:
+    """Số byte payload lớn nhất của một mảnh đi riêng một datagram nhị phân `max_datagram` bytes"""
+    return (max_datagram - bundle_overhead(FORMAT_BINARY) - 4 - LENGTH.size
+            - STREAM_FIELDS.size - FRAGMENT_FIELDS.size)
+
+def fragment_chunk(total: int, count: int) -> int:
+    """Độ dài của mọi mảnh trừ mảnh cuối khi chia `total` bytes thành `count` mảnh"""
+    return -(-total // count)
+
+def stream_fields(seq: int, stream: int, stream_seq: int) -> Optional[Tuple[int, int]]:
+    """(stream, stream_seq) cần ghi lên dây, None khi trùng mặc định (stream 0, stream_seq = seq)"""
+    if stream == DEFAULT_STREAM and stream_seq == seq:
+        return None
+    return stream, stream_seq
+
+def encode_bundle(messages: List[Tuple[int, str]], fmt: str = FORMAT_BINARY, fec: bool = False,
+                  connection_id: int = 0, streams: Optional[List[Optional[Tuple[int, int]]]] = None,
+                  fragments: Optional[List[Optional[Tuple[int, int, int]]]] = None) -> bytes:
+    """Mã hóa một bundle gồm các cặp (seq, content); fec=True đánh dấu bundle thuộc một nhóm FEC
+
+    streams (tùy chọn) song song với messages: (stream, stream_seq) hoặc None cho message mặc định.
+    fragments (tùy chọn, chỉ nhị phân) song song với messages: (index, count, total) hoặc None.
+    """
+    if fragments is not None and not any(fragments):
+        fragments = None
+    if streams is not None:
+        if not any(streams):
+            streams = None
+        elif fmt == FORMAT_BINARY:
+            # Bundle nhị phân ghi trường stream cho mọi message hoặc không message nào
+            streams = [fields or (DEFAULT_STREAM, seq) for (seq, _), fields in zip(messages, streams)]
+    if fmt == FORMAT_BINARY:
+        return _pack_messages(TYPE_FEC_BUNDLE if fec else TYPE_BUNDLE, messages, connection_id, streams,
+                              fragments)
+    if fec:
+        raise CodecError("FEC chỉ hỗ trợ định dạng nhị phân")
+    if fragments is not None:
+        raise CodecError("Phân mảnh chỉ hỗ trợ định dạng nhị phân")
+    return json.dumps({
+        'type': 'bundle',
+        'messages': [_json_message(seq, content, streams and streams[i])
+                     for i, (seq, content) in enumerate(messages)]
+    }).encode()
+
+def encode_single(seq: int, content: str, fmt: str = FORMAT_BINARY, connection_id: int = 0,
+                  stream: Optional[Tuple[int, int]] = None,
+                  fragment: Optional[Tuple[int, int, int]] = None) -> bytes:
+    """Mã hóa một message gửi lại (retransmission)"""
+    if fmt == FORMAT_BINARY:
+        return _pack_messages(TYPE_SINGLE, [(seq, content)], connection_id,
+                              None if stream is None else [stream],
+                              None if fragment is None else [fragment])
+    if fragment is not None:
+        raise CodecError("Phân mảnh chỉ hỗ trợ định dạng nhị phân")
+    return json.dumps({
+        'type': 'single',
+        'message': _json_message(seq, content, stream)
+    }).encode()
+
+def encode_ack(cumulative: int, sack_blocks: List[Tuple[int, int]] = (), window: int = MAX_WINDOW,
+               fmt: str = FORMAT_BINARY) -> bytes:
+    """Mã hóa ACK tích lũy kèm cửa sổ nhận và danh sách SACK block (lo, hi)"""
+    window = max(0, min(window, MAX_WINDOW))
+    if fmt == FORMAT_BINARY:
+        count = len(sack_blocks)
+        flat = [edge for block in sack_blocks for edge in block]
+        return (HEADER.pack(WIRE_VERSION, TYPE_ACK, count) + ACK_FIELDS.pack(cumulative & NO_CUMULATIVE, window)
+                + struct.pack(f'!{2 * count}I', *flat))
+    return json.dumps({
+        'type': 'ack',
+        'cum': cumulative,
+        'wnd': window,
+        'sack': [list(block) for block in sack_blocks]
+    }).encode()
+
+def encode_parity(members: List[Tuple[int, int]], parity: bytes, connection_id: int = 0) -> bytes:
+    """Mã hóa gói parity của một nhóm FEC: các (first_seq, độ dài datagram) và XOR của nhóm"""
+    flat = [field for member in members for field in member]
+    return (_pack_header(TYPE_PARITY, len(members), connection_id)
+            + struct.pack('!' + 'IH' * len(members), *flat) + parity)
+
+def decode_parity(data) -> Tuple[List[Tuple[int, int]], memoryview]:
+    """Giải mã gói parity, trả về ([(first_seq, độ dài)], parity memoryview)"""
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    try:
+        packet_type, count, _, offset, _ = _unpack_header(view)
+        if packet_type != TYPE_PARITY:
+            raise CodecError(f"Không phải gói parity: {packet_type}")
+        members = [PARITY_MEMBER.unpack_from(view, offset + i * PARITY_MEMBER.size)
+                   for i in range(count)]
+    except struct.error as e:
+        raise CodecError(f"Gói parity lỗi: {e}") from e
+    return members, view[offset + count * PARITY_MEMBER.size:]
+
+def encode_hello(nonce: int, initial_seq: int = 0, stream_bases: List[Tuple[int, int]] = ()) -> bytes:
+    """Client xin connection ID; nonce ghép HELLO với WELCOME, initial_seq là seq chưa ACK nhỏ nhất
+
+    stream_bases là các (stream, stream_seq chưa ACK nhỏ nhất) để server mở lại cửa sổ
+    của từng stream đúng chỗ khi bắt tay lại giữa chừng.
+    """
+    flat = [field for base in stream_bases for field in base]
+    return (_pack_header(TYPE_HELLO, len(stream_bases)) + HANDSHAKE.pack(nonce, initial_seq)
+            + struct.pack('!' + 'HI' * len(stream_bases), *flat))
+
+def encode_welcome(connection_id: int, nonce: int) -> bytes:
+    """Server cấp connection ID cho HELLO mang `nonce`"""
+    return _pack_header(TYPE_WELCOME, 0, connection_id) + CONNECTION_ID.pack(nonce)
+
+def encode_reset(connection_id: int) -> bytes:
+    """Server không biết connection ID này (đã bị xóa hoặc worker khác), client phải bắt tay lại"""
+    return _pack_header(TYPE_RESET, 0, connection_id)
+
+def encode_challenge(connection_id: int, token: int) -> bytes:
+    """Server kiểm tra địa chỉ mới của phiên: client phải gửi lại `token` từ đúng địa chỉ đó"""
+    return _pack_header(TYPE_CHALLENGE, 0, connection_id) + PATH_TOKEN.pack(token)
+
+def encode_response(connection_id: int, token: int) -> bytes:
+    """Client trả lời CHALLENGE, chép lại token"""
+    return _pack_header(TYPE_RESPONSE, 0, connection_id) + PATH_TOKEN.pack(token)
+
+def detect_format(data: bytes) -> str:
+    if not data:
+        raise CodecError("Gói tin rỗng")
+    if data[0] == JSON_MARKER:
+        return FORMAT_JSON
+    if data[0] == WIRE_VERSION:
+        return FORMAT_BINARY
+    raise CodecError(f"Không hỗ trợ version {data[0]}")
+
+def _decode_content(payload) -> Union[str, bytes]:
+    """Nội dung message cho dict đã decode: chuỗi nếu là UTF-8, không thì giữ bytes"""
+    try:
+        return str(payload, 'utf-8')
+    except UnicodeDecodeError:
+        return bytes(payload)
+
+def _decode_binary(data: bytes) -> dict:
+    try:
+        packet_type, count, connection_id, offset, flags = _unpack_header(data)
+
+        if packet_type == TYPE_ACK:
+            cumulative, window = ACK_FIELDS.unpack_from(data, offset)
+            flat = struct.unpack_from(f'!{2 * count}I', data, offset + ACK_FIELDS.size)
+            return {'type': 'ack', 'cum': -1 if cumulative == NO_CUMULATIVE else cumulative, 'wnd': window,
+                    'sack': list(zip(flat[::2], flat[1::2]))}
+        if packet_type == TYPE_PARITY:
+            members, parity = decode_parity(data)
+            return {'type': 'parity', 'cid': connection_id, 'members': members, 'parity': bytes(parity)}
+        if packet_type == TYPE_HELLO:
+            nonce, initial_seq = HANDSHAKE.unpack_from(data, offset)
+            flat = struct.unpack_from('!' + 'HI' * count, data, offset + HANDSHAKE.size)
+            return {'type': 'hello', 'nonce': nonce, 'seq': initial_seq,
+                    'streams': list(zip(flat[::2], flat[1::2]))}
+        if packet_type == TYPE_WELCOME:
+            (nonce,) = CONNECTION_ID.unpack_from(data, offset)
+            return {'type': 'welcome', 'cid': connection_id, 'nonce': nonce}
+        if packet_type == TYPE_RESET:
+            return {'type': 'reset', 'cid': connection_id}
+        if packet_type in (TYPE_CHALLENGE, TYPE_RESPONSE):
+            (token,) = PATH_TOKEN.unpack_from(data, offset)
+            return {'type': TYPE_NAMES[packet_type], 'cid': connection_id, 'token': token}
+
+        seqs = struct.unpack_from(f'!{count}I', data, offset)
+        offset += 4 * count
+
+        messages = []
+        for seq in seqs:
+            stream = fragment = None
+            if flags & FLAG_STREAMS:
+                stream = STREAM_FIELDS.unpack_from(data, offset)
+                offset += STREAM_FIELDS.size
+            if flags & FLAG_FRAGMENTS:
+                fragment = FRAGMENT_FIELDS.unpack_from(data, offset)
+                offset += FRAGMENT_FIELDS.size
+            (length,) = LENGTH.unpack_from(data, offset)
+            offset += LENGTH.size
+            if offset + length > len(data):
+                raise CodecError("Payload bị cắt cụt")
+            message = _json_message(seq, _decode_content(data[offset:offset + length]), stream)
+            if fragment is not None and fragment[1] > 1:
+                message['frag'] = list(fragment)
+            messages.append(message)
+            offset += length
+    except (struct.error, IndexError) as e:
+        raise CodecError(f"Gói nhị phân lỗi: {e}") from e
+
+    if packet_type in (TYPE_BUNDLE, TYPE_FEC_BUNDLE):
+        return {'type': 'bundle', 'cid': connection_id, 'messages': messages}
+    if packet_type == TYPE_SINGLE:
+        if len(messages) != 1:
+            raise CodecError("Gói single phải có đúng một message")
+        return {'type': 'single', 'cid': connection_id, 'message': messages[0]}
+    raise CodecError(f"Loại gói không hợp lệ: {packet_type}")
+
+def payload_text(payload: Union[memoryview, bytes, str]) -> str:
+    """Decode payload UTF-8 khi cần chuỗi (payload từ parse_datagram là memoryview)"""
+    if isinstance(payload, str):
+        return payload
+    return str(payload, 'utf-8')
+
+def _check_fragment(fragment: Tuple[int, int, int], length: int):
+    """Mảnh phải nằm gọn trong message: đúng độ dài fragment_chunk, mảnh cuối lấy phần còn lại"""
+    index, count, total = fragment
+    chunk = fragment_chunk(total, count) if count else 0
+    expected = chunk if index < count - 1 else total - chunk * index
+    if index >= count or length != expected:
+        raise CodecError(f"Mảnh {index}/{count} dài {length} bytes không khớp message {total} bytes")
+
+def _parse_binary(view: memoryview) -> Tuple[int, int, List[Tuple[int, memoryview]],
+                                             Optional[List[Tuple[int, int]]],
+                                             Optional[List[Optional[Tuple[int, int, int]]]]]:
+    try:
+        packet_type, count, connection_id, offset, flags = _unpack_header(view)
+        if packet_type in (TYPE_ACK, TYPE_PARITY, TYPE_HELLO, TYPE_WELCOME, TYPE_RESET, TYPE_CHALLENGE,
+                           TYPE_RESPONSE):
+            # Không mang message; parity / handshake được đọc riêng (decode_parity, decode_packet)
+            return packet_type, connection_id, [], None, None
+        if packet_type not in (TYPE_BUNDLE, TYPE_SINGLE, TYPE_FEC_BUNDLE):
+            raise CodecError(f"Loại gói không hợp lệ: {packet_type}")
+
+        seqs = struct.unpack_from(f'!{count}I', view, offset)
+        offset += 4 * count
+        end = len(view)
+
+        messages = []
+        streams = [] if flags & FLAG_STREAMS else None
+        fragments = [] if flags & FLAG_FRAGMENTS else None
+        for seq in seqs:
+            if streams is not None:
+                streams.append(STREAM_FIELDS.unpack_from(view, offset))
+                offset += STREAM_FIELDS.size
+            if fragments is not None:
+                fragment = FRAGMENT_FIELDS.unpack_from(view, offset)
+                offset += FRAGMENT_FIELDS.size
+            # Đọc trực tiếp u16 big-endian, rẻ hơn gọi struct cho mỗi message
+            length = (view[offset] << 8) | view[offset + 1]
+            offset += LENGTH.size
+            if offset + length > end:
+                raise CodecError("Payload bị cắt cụt")
+            if fragments is not None:
+                _check_fragment(fragment, length)
+                # Message nguyên vẹn (count = 1) trong bundle có mảnh không cần ghép
+                fragments.append(fragment if fragment[1] > 1 else None)
+            messages.append((seq, view[offset:offset + length]))
+            offset += length
+    except (struct.error, IndexError) as e:
+        raise CodecError(f"Gói nhị phân lỗi: {e}") from e
+
+    if packet_type == TYPE_SINGLE and len(messages) != 1:
+        raise CodecError("Gói single phải có đúng một message")
+    return packet_type, connection_id, messages, streams, fragments
+
+def parse_datagram(data) -> Tuple[int, int, List[Tuple[int, memoryview]], Optional[List[Tuple[int, int]]],
+                                  Optional[List[Optional[Tuple[int, int, int]]]], str]:
+    """Phân tích datagram tại chỗ, trả về (loại gói, connection ID, [(seq, payload memoryview)], streams, fragments, định dạng)
+
+    Connection ID bằng 0 khi gói không mang ID (gói JSON, client chưa bắt tay).
+    streams song song với messages: (stream kèm bit STREAM_UNORDERED, stream_seq),
+    hoặc None khi mọi message thuộc stream mặc định với stream_seq = seq.
+    fragments song song với messages: (index, count, total) của mảnh hoặc None
+    cho message nguyên vẹn; cả danh sách là None khi bundle không mang mảnh.
+    Payload nhị phân trỏ thẳng vào `data`: chỉ hợp lệ khi buffer gốc chưa bị
+    ghi đè, bên dùng phải tự copy (bytes(payload)) nếu muốn giữ lại. Gói JSON
+    vẫn phải decode toàn bộ nên payload được encode lại thành memoryview riêng.
+    """
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    if view and view[0] == WIRE_VERSION:
+        packet_type, connection_id, messages, streams, fragments = _parse_binary(view)
+        return packet_type, connection_id, messages, streams, fragments, FORMAT_BINARY
+
+    try:
+        # decode_packet đã kiểm tra kiểu từng trường (_check_json)
+        packet, fmt = decode_packet(bytes(view))
+        packet_type = TYPE_CODES[packet['type']]
+        if packet_type == TYPE_BUNDLE:
+            items = packet['messages']
+        elif packet_type == TYPE_SINGLE:
+            items = [packet['message']]
+        else:
+            items = []
+        messages = [(item['seq'], memoryview(item['content'].encode())) for item in items]
+        streams = None
+        if any('stream' in item or 'sseq' in item for item in items):
+            streams = [(item.get('stream', DEFAULT_STREAM), item.get('sseq', item['seq'])) for item in items]
+        return packet_type, 0, messages, streams, None, fmt
+    except CodecError:
+        raise
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        # ValueError: content chứa surrogate lẻ không encode được UTF-8
+        raise CodecError(f"Gói JSON không hợp lệ: {e}") from e
+
+def _check_int(value, name: str, low: int, high: int) -> int:
+    # bool là lớp con của int nhưng không phải số hợp lệ trên dây
+    if type(value) is not int or not low <= value <= high:
+        raise CodecError(f"Trường {name} không hợp lệ: {value!r}")
+    return value
+
+def _check_json_message(item) -> dict:
+    if not isinstance(item, dict):
+        raise CodecError(f"Message JSON phải là object: {item!r}")
+    _check_int(item.get('seq'), 'seq', 0, NO_CUMULATIVE)
+    if not isinstance(item.get('content'), str):
+        raise CodecError(f"Trường content không hợp lệ: {item.get('content')!r}")
+    if 'stream' in item or 'sseq' in item:
+        _check_int(item.get('stream', DEFAULT_STREAM), 'stream', 0, MAX_STREAM_ID | STREAM_UNORDERED)
+        _check_int(item.get('sseq', item['seq']), 'sseq', 0, NO_CUMULATIVE)
+    return item
+
+def _check_json(packet) -> dict:
+    """Kiểm tra kiểu mọi trường của gói JSON (bundle / single / ack)"""
+    if not isinstance(packet, dict):
+        raise CodecError("Gói JSON phải là object")
+    packet_type = packet.get('type')
+    if packet_type == 'bundle':
+        messages = packet.get('messages')
+        if not isinstance(messages, list):
+            raise CodecError("Trường messages phải là danh sách")
+        for item in messages:
+            _check_json_message(item)
+    elif packet_type == 'single':
+        _check_json_message(packet.get('message'))
+    elif packet_type == 'ack':
+        _check_int(packet.get('cum'), 'cum', -1, NO_CUMULATIVE - 1)
+        _check_int(packet.get('wnd', MAX_WINDOW), 'wnd', 0, MAX_WINDOW)
+        sack = packet.get('sack', [])
+        if not isinstance(sack, list):
+            raise CodecError("Trường sack phải là danh sách")
+        for block in sack:
+            if not isinstance(block, list) or len(block) != 2:
+                raise CodecError(f"SACK block không hợp lệ: {block!r}")
+            lo, hi = (_check_int(edge, 'sack', 0, NO_CUMULATIVE) for edge in block)
+            if lo > hi:
+                raise CodecError(f"SACK block không hợp lệ: {block!r}")
+    else:
+        raise CodecError(f"Loại gói không hợp lệ: {packet_type!r}")
+    return packet
+
+def decode_packet(data: bytes) -> Tuple[dict, str]:
+    """Giải mã một datagram, trả về (packet dict, định dạng đã dùng)"""
+    fmt = detect_format(data)
+    if fmt == FORMAT_BINARY:
+        return _decode_binary(data), fmt
+    try:
+        packet = json.loads(data.decode())
+    except (UnicodeDecodeError, json.JSONDecodeError, RecursionError) as e:
+        raise CodecError(f"Lỗi decode JSON: {e}") from e
+    return _check_json(packet), fmt
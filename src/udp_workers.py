@@ -0,0 +1,184 @@
+"""
+Chạy OptimizedUDPServer trên nhiều process với SO_REUSEPORT.
+
+N worker cùng bind một port; kernel băm 4-tuple của mỗi datagram để chọn
+socket, nên mọi gói của một client luôn về cùng một worker và mỗi worker
+tự giữ trạng thái nhận của các client thuộc về nó, không cần chia sẻ hay
+khóa giữa các process. Khi NAT đổi port của client, 4-tuple mới có thể
+rơi vào worker khác không biết connection ID đó: worker trả RESET và client
+bắt tay lại từ seq chưa ACK nhỏ nhất. Supervisor khởi động worker, định kỳ nhận bản sao
+stats qua multiprocessing.Queue và cộng dồn thành thống kê toàn server.
+
+Chỉ chạy được trên nền tảng có SO_REUSEPORT (Linux, BSD, macOS).
+
+Chạy: python src/udp_workers.py --workers 4 --port 8888
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import select
+import time
+from typing import Dict, Optional
+
+from batched_io import BatchReceiver
+from optimized_udp_server import OptimizedUDPServer
+from socket_buffers import add_buffer_arguments
+
+# Chu kỳ worker kiểm tra tín hiệu dừng khi không có gói đến
+POLL_INTERVAL = 0.2
+STATS_INTERVAL = 1.0
+
+def run_worker(worker_id: int, host: str, port: int, loss_rate: float, server_options: dict,
+               stop_event, stats_queue, stats_interval: float):
+    """Vòng lặp của một worker: nhận theo lô trên socket SO_REUSEPORT riêng"""
+    try:
+        server = OptimizedUDPServer(host, port, loss_rate=loss_rate, verbose=False,
+                                    reuse_port=True, **server_options)
+    except OSError as e:
+        stats_queue.put((worker_id, 'error', str(e)))
+        return
+
+    server.socket.setblocking(False)
+    server.receiver = BatchReceiver(server.socket, server.batch_size)
+    stats_queue.put((worker_id, 'ready', server.stats_snapshot()))
+
+    next_report = time.monotonic() + stats_interval
+    try:
+        while not stop_event.is_set():
+            if select.select([server.socket], [], [], POLL_INTERVAL)[0]:
+                server.process_batch()
+            if time.monotonic() >= next_report:
+                stats_queue.put((worker_id, 'stats', server.stats_snapshot()))
+                next_report = time.monotonic() + stats_interval
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats_queue.put((worker_id, 'final', server.stats_snapshot()))
+        server.socket.close()
+
+class UDPServerCluster:
+    def __init__(self, host='localhost', port=8888, workers: Optional[int] = None, loss_rate=0.0,
+                 stats_interval: float = STATS_INTERVAL, **server_options):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.loss_rate = loss_rate
+        self.stats_interval = stats_interval
+        self.server_options = server_options
+
+        self.stop_event = multiprocessing.Event()
+        self.stats_queue = multiprocessing.Queue()
+        self.processes = []
+        # Bản stats mới nhất của từng worker
+        self.worker_stats: Dict[int, dict] = {}
+
+    def start(self, timeout: float = 10.0):
+        """Khởi động các worker và chờ đến khi tất cả đã bind xong"""
+        for worker_id in range(self.workers):
+            process = multiprocessing.Process(
+                target=run_worker, name=f'udp-worker-{worker_id}', daemon=True,
+                args=(worker_id, self.host, self.port, self.loss_rate, self.server_options,
+                      self.stop_event, self.stats_queue, self.stats_interval))
+            process.start()
+            self.processes.append(process)
+
+        deadline = time.monotonic() + timeout
+        while len(self.worker_stats) < self.workers:
+            try:
+                worker_id, kind, payload = self.stats_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self.stop()
+                raise RuntimeError("Worker không khởi động kịp") from None
+            if kind == 'error':
+                self.stop()
+                raise OSError(f"Worker {worker_id}: {payload}")
+            self.worker_stats[worker_id] = payload
+
+        print(f"{self.workers} worker đang lắng nghe {self.host}:{self.port} (SO_REUSEPORT)")
+
+    def collect(self, timeout: float = 0.0):
+        """Lấy các bản stats worker đã gửi về; chờ tối đa `timeout` giây cho bản đầu tiên"""
+        try:
+            while True:
+                worker_id, _, payload = self.stats_queue.get(timeout=timeout)
+                self.worker_stats[worker_id] = payload
+                timeout = 0.0
+        except queue.Empty:
+            pass
+
+    def stop(self):
+        """Dừng mọi worker, nhận bản stats cuối cùng của từng worker"""
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=POLL_INTERVAL * 10)
+            if process.is_alive():
+                process.terminate()
+        self.collect()
+
+    def aggregate_stats(self) -> dict:
+        """Cộng dồn stats của mọi worker"""
+        total: Dict[str, int] = {}
+        for snapshot in self.worker_stats.values():
+            for key, value in snapshot.items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def print_stats(self):
+        stats = self.aggregate_stats()
+        print("\n" + "="*50)
+        print(f"SERVER STATISTICS ({self.workers} workers)")
+        print("="*50)
+        print(f"Total Packets: {stats.get('total_packets', 0)}")
+        print(f"Bundles Received: {stats.get('bundles_received', 0)}")
+        print(f"Messages Processed: {stats.get('messages_processed', 0)}")
+        print(f"ACKs Sent: {stats.get('acks_sent', 0)} (gom {stats.get('acks_coalesced', 0)} ACK trùng client)")
+        print(f"Packets Lost: {stats.get('packets_lost', 0)}")
+        print(f"Kernel Drops: {stats.get('kernel_drops', 0)} (buffer nhận đầy, cộng mọi worker)")
+        if stats.get('parity_received'):
+            print(f"FEC: {stats['fec_recovered']} datagram dựng lại từ {stats['parity_received']} gói parity")
+        print(f"Duplicates Dropped: {stats.get('duplicates_dropped', 0)}")
+        print(f"Out-of-window Drops: {stats.get('window_drops', 0)}")
+        if stats.get('fragments_received'):
+            print(f"Fragments: {stats['fragments_received']} mảnh, ghép xong {stats['reassembled']} message, "
+                  f"bỏ vì đầy {stats['reassembly_drops']}")
+        print(f"Active Clients: {stats.get('active_clients', 0)} (bắt tay {stats.get('handshakes', 0)}, "
+              f"đổi địa chỉ {stats.get('rebinds', 0)} (challenge {stats.get('path_challenges', 0)}, "
+              f"trả lời sai {stats.get('path_failures', 0)}), RESET {stats.get('resets_sent', 0)})")
+        print(f"Evicted Idle Clients: {stats.get('clients_evicted', 0)}")
+        if stats.get('wakeups'):
+            print(f"I/O: {stats['datagrams'] / stats['wakeups']:.1f} datagrams mỗi lần thức dậy")
+
+        print("Phân bố theo worker (packets / clients):")
+        for worker_id in sorted(self.worker_stats):
+            snapshot = self.worker_stats[worker_id]
+            print(f"  worker {worker_id}: {snapshot['total_packets']} / {snapshot['active_clients']}")
+
+    def run(self, stop_event=None):
+        """Chạy đến khi Ctrl+C (hoặc stop_event được set), in stats gộp theo chu kỳ"""
+        self.start()
+        next_print = time.monotonic() + 10.0
+        try:
+            while stop_event is None or not stop_event.is_set():
+                self.collect(timeout=self.stats_interval)
+                if stop_event is None and time.monotonic() >= next_print:
+                    self.print_stats()
+                    next_print = time.monotonic() + 10.0
+        except KeyboardInterrupt:
+            print("\nĐang dừng các worker...")
+        finally:
+            self.stop()
+            self.print_stats()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-process UDP server (SO_REUSEPORT)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--workers', type=int, default=None, help="Số worker (mặc định: số core)")
+    parser.add_argument('--loss', type=float, default=0.0, help="Tỉ lệ mất gói mô phỏng (0 = không mô phỏng)")
+    add_buffer_arguments(parser)
+    args = parser.parse_args()
+
+    UDPServerCluster(args.host, args.port, args.workers, args.loss,
+                     bandwidth_bps=args.bandwidth_mbps * 1_000_000, rtt=args.rtt_ms / 1000).run()
@@ -0,0 +1,7 @@
+"""Các module UDP trong src/ và TCP trong python/ là module phẳng (import trực tiếp theo tên), như khi chạy python src/..."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'python')]
@@ -0,0 +1,76 @@
+import ctypes
+import socket
+
+import pytest
+
+import batched_io
+from batched_io import EAGAIN, EINTR, HAVE_MMSG, BatchReceiver, BatchSender, decode_sockaddr, encode_sockaddr
+
+@pytest.fixture
+def pair():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield sender, receiver
+    sender.close()
+    receiver.close()
+
+class FlakyLibc:
+    """Bọc libc thật: mỗi lần sendmmsg gửi tối đa `limit` datagram, lần gọi thứ n trả lỗi `errors[n]`"""
+
+    def __init__(self, real, limit, errors):
+        self.real = real
+        self.limit = limit
+        self.errors = errors
+        self.calls = 0
+
+    def sendmmsg(self, fd, headers, count, flags):
+        self.calls += 1
+        errno = self.errors.get(self.calls)
+        if errno:
+            ctypes.set_errno(errno)
+            return -1
+        return self.real.sendmmsg(fd, headers, min(count, self.limit), flags)
+
+def receive_all(receiver, count):
+    receiver.settimeout(1.0)
+    return [receiver.recv(64) for _ in range(count)]
+
+@pytest.mark.parametrize('address', [('127.0.0.1', 9000), ('::1', 9000, 0, 0), ('fe80::1', 53, 7, 2)])
+def test_sockaddr_round_trip(address):
+    assert decode_sockaddr(encode_sockaddr(address)) == address
+
+@pytest.mark.skipif(not HAVE_MMSG, reason="cần recvmmsg/sendmmsg (Linux)")
+def test_partial_sendmmsg_resends_tail(pair, monkeypatch):
+    sender, receiver = pair
+    flaky = FlakyLibc(batched_io.LIBC, limit=3, errors={2: EINTR})
+    monkeypatch.setattr(batched_io, 'LIBC', flaky)
+    batch = BatchSender(sender, batch_size=8)
+    datagrams = [(b'm%d' % i, receiver.getsockname()) for i in range(20)]
+    assert batch.send(datagrams) == 20
+    assert receive_all(receiver, 20) == [data for data, _ in datagrams]
+    assert batch.stats['partial_sends'] > 0 and batch.stats['blocked'] == 0
+
+@pytest.mark.skipif(not HAVE_MMSG, reason="cần recvmmsg/sendmmsg (Linux)")
+def test_sendmmsg_eagain_drops_one_datagram(pair, monkeypatch):
+    sender, receiver = pair
+    monkeypatch.setattr(batched_io, 'LIBC', FlakyLibc(batched_io.LIBC, limit=2, errors={2: EAGAIN}))
+    batch = BatchSender(sender, batch_size=8)
+    datagrams = [(b'm%d' % i, receiver.getsockname()) for i in range(5)]
+    assert batch.send(datagrams) == 4
+    assert receive_all(receiver, 4) == [b'm0', b'm1', b'm3', b'm4']
+    assert batch.stats['blocked'] == 1
+
+@pytest.mark.parametrize('use_mmsg', [False, True])
+def test_receiver_drains_batch(pair, use_mmsg):
+    if use_mmsg and not HAVE_MMSG:
+        pytest.skip("cần recvmmsg/sendmmsg (Linux)")
+    sender, receiver = pair
+    batch = BatchSender(sender, use_mmsg=use_mmsg)
+    batch.send([(b'd%d' % i, receiver.getsockname()) for i in range(5)])
+    receive = BatchReceiver(receiver, batch_size=8, buffer_size=64, use_mmsg=use_mmsg)
+    got = []
+    while len(got) < 5:
+        got += [(bytes(view), address) for view, address in receive.receive()]
+    assert [data for data, _ in got] == [b'd%d' % i for i in range(5)]
+    assert {address for _, address in got} == {('127.0.0.1', sender.getsockname()[1])}
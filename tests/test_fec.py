@@ -0,0 +1,53 @@
+import pytest
+
+from fec import FecDecoder, FecEncoder
+from udp_codec import decode_parity, encode_bundle
+
+def datagrams(count: int):
+    return [(i * 10, encode_bundle([(i * 10 + j, f"message {i}-{j}" * (i + 1)) for j in range(3)], fec=True))
+            for i in range(count)]
+
+@pytest.mark.parametrize('lost', [0, 1, 3])
+def test_recovers_any_single_loss(lost):
+    group = datagrams(4)
+    encoder = FecEncoder(4)
+    parity = [encoder.add(seq, data) for seq, data in group]
+    assert parity[:3] == [None, None, None] and parity[3] is not None
+
+    decoder = FecDecoder()
+    for index, (seq, data) in enumerate(group):
+        if index != lost:
+            decoder.store(seq, memoryview(data))
+    members, parity_bytes = decode_parity(parity[3])
+    assert decoder.recover(members, parity_bytes) == group[lost][1]
+    # Parity chỉ dùng được một lần
+    assert not decoder.received
+
+def test_two_losses_cannot_be_recovered():
+    group = datagrams(3)
+    encoder = FecEncoder(3)
+    parity = [encoder.add(seq, data) for seq, data in group][-1]
+    decoder = FecDecoder()
+    decoder.store(*group[0])
+    assert decoder.recover(*decode_parity(parity)) is None
+
+def test_flush_partial_group():
+    group = datagrams(2)
+    encoder = FecEncoder(8)
+    for seq, data in group:
+        assert encoder.add(seq, data) is None
+    parity = encoder.flush()
+    assert encoder.flush() is None
+    decoder = FecDecoder()
+    decoder.store(*group[1])
+    assert decoder.recover(*decode_parity(parity)) == group[0][1]
+
+def test_decoder_history_is_bounded():
+    decoder = FecDecoder(history=2)
+    for seq in range(5):
+        decoder.store(seq, b'x')
+    assert list(decoder.received) == [3, 4]
+
+def test_group_size_must_be_positive():
+    with pytest.raises(ValueError):
+        FecEncoder(0)
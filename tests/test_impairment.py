@@ -0,0 +1,47 @@
+import argparse
+
+import pytest
+
+from impairment import ImpairedLink, ImpairmentConfig, NetworkImpairment, add_impairment_arguments, impairment_from_args
+
+CONFIG = dict(loss=0.1, burst_p=0.05, burst_r=0.3, jitter=0.01, reorder=0.1, duplicate=0.05)
+
+def plans(config, count=2000):
+    impairment = NetworkImpairment(config)
+    return [impairment.plan(100, now=0.0) for _ in range(count)], impairment.stats
+
+def test_same_seed_same_decisions():
+    first, first_stats = plans(ImpairmentConfig(seed=7, **CONFIG))
+    second, second_stats = plans(ImpairmentConfig(seed=7, **CONFIG))
+    assert first == second and first_stats == second_stats
+    other, _ = plans(ImpairmentConfig(seed=8, **CONFIG))
+    assert other != first
+    assert first_stats['lost'] and first_stats['burst_lost'] and first_stats['duplicated']
+
+@pytest.mark.parametrize('loss', [0.0, 0.2])
+def test_bernoulli_loss_rate(loss):
+    _, stats = plans(ImpairmentConfig(seed=1, loss=loss), count=10_000)
+    assert abs(stats['lost'] / stats['datagrams'] - loss) < 0.02
+
+def test_rate_limit_queues_then_tail_drops():
+    impairment = NetworkImpairment(ImpairmentConfig(rate_bps=8000, max_queue_delay=0.5))
+    # 100 byte ở 8 kbit/s mất 0.1 s: gói sau xếp hàng sau gói trước
+    assert [impairment.plan(100, now=0.0) for _ in range(3)] == [[0.1], [pytest.approx(0.2)], [pytest.approx(0.3)]]
+    for _ in range(3):
+        impairment.plan(100, now=0.0)
+    assert impairment.plan(100, now=0.0) == [] and impairment.stats['queue_drops'] == 1
+
+def test_link_schedules_delayed_copies():
+    sent, scheduled = [], []
+    link = ImpairedLink(ImpairmentConfig(seed=3, delay=0.01, duplicate=1.0), sent.append,
+                        schedule=lambda delay, fn, *args: scheduled.append((delay, args)))
+    link.send(b'x')
+    assert sent == [] and scheduled == [(0.01, (b'x',)), (0.01, (b'x',))]
+
+def test_from_args_uses_separate_ack_seed():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loss', type=float, default=0.0)
+    add_impairment_arguments(parser)
+    data, ack = impairment_from_args(parser.parse_args(['--seed', '5', '--ack-loss', '0.1']))
+    assert data is None
+    assert ack.loss == 0.1 and ack.seed not in (None, 5)
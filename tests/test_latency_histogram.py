@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from latency_histogram import SUB_BUCKET_COUNT, LatencyHistogram, bucket_bounds, bucket_index
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 129, 1000, 65_535, 10 ** 9])
+def test_bucket_bounds_contain_value(value):
+    low, high = bucket_bounds(bucket_index(value))
+    assert low <= value <= high
+    # Dưới SUB_BUCKET_COUNT lưu chính xác, trên đó sai số tương đối tối đa 1/64
+    assert low == high if value < SUB_BUCKET_COUNT else (high - low + 1) * 64 <= low
+
+def test_percentiles_and_clamping():
+    histogram = LatencyHistogram(highest_value=10_000)
+    for value in range(1, 101):
+        histogram.record(value)
+    histogram.record(50_000)
+    assert len(histogram) == 101
+    assert histogram.percentile(50) == 51
+    assert histogram.percentile(100) == 10_000
+    assert histogram.summary()['min'] == 1
+
+def test_merge_and_json_round_trip():
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for value in (10, 20, 3000):
+        first.record(value)
+    second.record(5, count=3)
+    first.merge(second)
+    assert (len(first), first.min_value, first.max_value) == (6, 5, 3000)
+    restored = LatencyHistogram.from_dict(json.loads(first.to_json()))
+    assert restored.summary() == first.summary()
+    assert list(restored.counts) == list(first.counts)
+    with pytest.raises(ValueError):
+        first.merge(LatencyHistogram(unit='ms'))
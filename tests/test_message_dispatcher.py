@@ -0,0 +1,64 @@
+import threading
+
+from message_dispatcher import MessageDispatcher
+
+def test_messages_of_a_stream_stay_in_order():
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(client_key, stream_id, seq, payload):
+        with lock:
+            seen.setdefault((client_key, stream_id), []).append(seq)
+
+    dispatcher = MessageDispatcher(handler, workers=4)
+    for seq in range(200):
+        dispatcher.submit(seq % 3, seq % 5, seq, b'')
+    dispatcher.close()
+    assert sum(len(seqs) for seqs in seen.values()) == 200
+    assert all(seqs == sorted(seqs) for seqs in seen.values())
+    assert dispatcher.stats['completed'] == 200 and dispatcher.pending == 0
+
+def test_backlog_shrinks_free_slots_until_handler_catches_up():
+    release = threading.Event()
+    progress = []
+    dispatcher = MessageDispatcher(lambda *message: release.wait(5), workers=1, capacity=4)
+    dispatcher.on_progress = progress.append
+    for seq in range(6):
+        dispatcher.submit('a' if seq < 5 else 'b', 0, seq, b'')
+    # Submit không bao giờ chặn: vượt capacity chỉ làm free_slots về 0
+    assert dispatcher.free_slots() == 0
+    assert (dispatcher.backlog('a'), dispatcher.backlog('b')) == (5, 1)
+    assert dispatcher.stats['peak_backlog'] == 6
+    release.set()
+    dispatcher.close()
+    assert dispatcher.free_slots() == 4 and dispatcher.backlog('a') == 0
+    assert progress == ['a'] * 5 + ['b']
+
+def test_handler_errors_are_counted():
+    def handler(client_key, stream_id, seq, payload):
+        raise RuntimeError(seq)
+
+    dispatcher = MessageDispatcher(handler, workers=1)
+    dispatcher.submit('a', 0, 1, b'')
+    dispatcher.close()
+    assert dispatcher.stats['handler_errors'] == 1 and dispatcher.backlog('a') == 0
+
+def test_server_window_follows_handler_backlog():
+    from optimized_udp_server import OptimizedUDPServer
+
+    release = threading.Event()
+    server = OptimizedUDPServer(port=0, verbose=False, receive_window=8)
+    try:
+        server.register_handler(lambda *message: release.wait(5), workers=1, capacity=10)
+        assert server.handler_window('a') == 8
+        for seq in range(3):
+            server.dispatcher.submit('a', 0, seq, b'')
+        # Cửa sổ của client trừ backlog của nó; client khác bị giới hạn bởi chỗ trống của hàng đợi chung
+        assert (server.handler_window('a'), server.handler_window('b')) == (5, 7)
+        for seq in range(3, 10):
+            server.dispatcher.submit('c', 0, seq, b'')
+        assert (server.handler_window('a'), server.handler_window('b')) == (0, 0)
+    finally:
+        release.set()
+        server.dispatcher.close()
+        server.socket.close()
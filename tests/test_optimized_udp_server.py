@@ -0,0 +1,67 @@
+import pytest
+
+from optimized_udp_server import OptimizedUDPServer
+from udp_codec import (decode_packet, encode_ack, encode_bundle, encode_hello, encode_parity, encode_reset,
+                       encode_response, encode_welcome)
+
+OLD = ('127.0.0.1', 40000)
+NEW = ('127.0.0.1', 40001)
+SPOOFED = ('10.0.0.9', 40002)
+
+@pytest.fixture
+def server():
+    server = OptimizedUDPServer(port=0, verbose=False)
+    server.sent = []
+    server.transmit = lambda data, address: server.sent.append((decode_packet(data)[0], address))
+    server.send_datagrams = lambda datagrams: [server.transmit(*datagram) for datagram in datagrams]
+    yield server
+    server.socket.close()
+
+def connect(server, address=OLD) -> int:
+    server.handle_datagram(encode_hello(1234), address)
+    welcome, _ = server.sent.pop()
+    server.handle_datagram(encode_bundle([(0, 'a')], connection_id=welcome['cid']), address)
+    server.flush_acks()
+    server.sent.clear()
+    return welcome['cid']
+
+def test_new_address_is_challenged_before_rebinding(server):
+    cid = connect(server)
+    server.handle_datagram(encode_bundle([(1, 'b')], connection_id=cid), NEW)
+    server.flush_acks()
+    (challenge, address), (ack, ack_address) = server.sent
+    assert challenge['type'] == 'challenge' and address == NEW
+    # Chưa xác thực: ACK vẫn về địa chỉ cũ
+    assert ack['type'] == 'ack' and ack_address == OLD
+    assert server.sessions[cid].address == OLD and server.stats['rebinds'] == 0
+
+    # Sai token, hoặc đúng token nhưng từ địa chỉ khác: không đổi địa chỉ
+    server.handle_datagram(encode_response(cid, challenge['token'] ^ 1), NEW)
+    server.handle_datagram(encode_response(cid, challenge['token']), SPOOFED)
+    assert server.sessions[cid].address == OLD and server.stats['path_failures'] == 2
+
+    server.sent.clear()
+    server.handle_datagram(encode_response(cid, challenge['token']), NEW)
+    server.flush_acks()
+    assert server.sessions[cid].address == NEW and server.stats['rebinds'] == 1
+    assert [(packet['type'], address) for packet, address in server.sent] == [('ack', NEW)]
+
+def test_challenges_are_rate_limited(server):
+    cid = connect(server)
+    for seq in range(1, 20):
+        server.handle_datagram(encode_bundle([(seq, 'x')], connection_id=cid), SPOOFED)
+    assert server.stats['path_challenges'] == 1
+
+@pytest.mark.parametrize('packet', [
+    encode_ack(3), encode_welcome(0, 5), encode_reset(0), encode_parity([(0, 10)], bytes(10)),
+], ids=['ack', 'welcome', 'reset', 'parity'])
+def test_cidless_control_packets_open_no_session(server, packet):
+    server.handle_datagram(packet, NEW)
+    assert not server.sessions and not server.addresses and not server.half_open
+    assert server.sent == []
+
+def test_packets_for_the_client_are_never_answered(server):
+    cid = connect(server)
+    server.handle_datagram(encode_reset(cid + 1), OLD)
+    server.handle_datagram(encode_welcome(cid, 5), OLD)
+    assert server.sent == [] and server.stats['unexpected_packets'] == 2
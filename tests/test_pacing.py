@@ -0,0 +1,34 @@
+import pytest
+
+from pacing import Pacer
+
+def test_unlimited_without_rate():
+    pacer = Pacer()
+    for _ in range(10):
+        pacer.on_send(1200, now=1.0)
+    assert pacer.delay(now=1.0) == 0.0
+
+def test_max_rate_spaces_sends():
+    pacer = Pacer(max_rate=1_000_000, burst=1000)
+    now = pacer.updated_at
+    pacer.on_send(1000, now=now)
+    assert pacer.delay(now=now) == 0.0
+    pacer.on_send(1000, now=now)
+    assert pacer.delay(now=now) == pytest.approx(0.001)
+    # Bucket được nạp lại theo thời gian
+    assert pacer.delay(now=now + 0.002) == 0.0
+
+def test_window_rate_from_cwnd_and_srtt():
+    pacer = Pacer(max_rate=10_000_000)
+    pacer.on_send(1000, messages=10, now=1.0)
+    pacer.update(window=20, srtt=0.01, slow_start=False)
+    assert pacer.window_rate == pytest.approx(1.25 * 20 * 100 / 0.01)
+    assert pacer.rate == pytest.approx(250_000)
+    pacer.update(window=20, srtt=0.01, slow_start=True)
+    assert pacer.rate == pytest.approx(400_000)
+
+def test_pacing_disabled_keeps_only_max_rate():
+    pacer = Pacer(max_rate=500_000, pacing=False)
+    pacer.on_send(1000, messages=10, now=1.0)
+    pacer.update(window=1, srtt=1.0, slow_start=False)
+    assert pacer.rate == 500_000
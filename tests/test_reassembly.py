@@ -0,0 +1,77 @@
+import pytest
+
+from reassembly import Fragment, Reassembler, split_message
+from udp_codec import MAX_FRAGMENTS
+
+def fragments_of(payload: bytes, max_fragment: int):
+    return [Fragment(*fields, bytes(chunk)) for fields, chunk in split_message(payload, max_fragment)]
+
+@pytest.mark.parametrize('size, max_fragment', [(1, 10), (10, 10), (11, 10), (1000, 7), (4096, 1024)])
+def test_split_covers_payload(size, max_fragment):
+    payload = bytes(i % 251 for i in range(size))
+    parts = list(split_message(payload, max_fragment))
+    assert all(len(chunk) <= max_fragment for _, chunk in parts)
+    assert b''.join(bytes(chunk) for _, chunk in parts) == payload
+    assert [fields[0] for fields, _ in parts] == list(range(len(parts)))
+    assert {fields[1:] for fields, _ in parts} == {(len(parts), size)}
+
+def test_split_rejects_too_many_fragments():
+    with pytest.raises(ValueError):
+        list(split_message(b'x' * (MAX_FRAGMENTS + 1), 1))
+
+def test_reassemble_out_of_order():
+    payload = bytes(range(256)) * 10
+    reassembler = Reassembler()
+    parts = fragments_of(payload, 300)
+    key = ('client', 0, 0)
+    for fragment in reversed(parts[1:]):
+        assert reassembler.add(key, fragment, now=1.0) is None
+    assert reassembler.reserved == len(payload)
+    assert reassembler.add(key, parts[0], now=1.0) == payload
+    assert reassembler.reserved == 0 and not reassembler.partials
+    assert reassembler.stats['completed'] == 1
+
+def test_admits_respects_memory_limits():
+    reassembler = Reassembler(max_bytes=1000, max_message=600)
+    assert not reassembler.admits(('a', 0, 0), 700)
+    assert reassembler.admits(('a', 0, 0), 600)
+    reassembler.add(('a', 0, 0), fragments_of(b'x' * 600, 100)[0])
+    # Message đang ghép luôn được nhận tiếp, message mới phải vừa phần còn trống
+    assert reassembler.admits(('a', 0, 0), 600)
+    assert not reassembler.admits(('b', 0, 0), 500)
+    assert reassembler.admits(('b', 0, 0), 400)
+
+def test_expire_and_discard_release_memory():
+    reassembler = Reassembler(timeout=5.0)
+    reassembler.add(('a', 0, 0), fragments_of(b'x' * 50, 10)[0], now=1.0)
+    reassembler.add(('a', 1, 0), fragments_of(b'y' * 30, 10)[0], now=5.0)
+    reassembler.add(('b', 0, 0), fragments_of(b'z' * 20, 10)[0], now=5.0)
+    assert reassembler.expire(7.0) == [('a', 0, 0)]
+    assert reassembler.reserved == 50
+    assert reassembler.discard('a') == 1
+    assert reassembler.reserved == 20
+    assert list(reassembler.partials) == [('b', 0, 0)]
+
+def test_rejects_fragment_that_disagrees_with_partial():
+    reassembler = Reassembler()
+    key = ('a', 0, 0)
+    parts = fragments_of(b'x' * 100, 10)
+    reassembler.add(key, parts[0], now=1.0)
+    # Cùng key nhưng khai total / count khác: không được ghi đè hay nới buffer
+    assert reassembler.add(key, Fragment(1, 10, 5000, b'y' * 10), now=1.0) is None
+    assert reassembler.add(key, Fragment(1, 20, 100, b'y' * 5), now=1.0) is None
+    assert reassembler.stats['rejected'] == 2
+    assert reassembler.reserved == 100
+    for fragment in parts[1:-1]:
+        assert reassembler.add(key, fragment, now=1.0) is None
+    assert reassembler.add(key, parts[-1], now=1.0) == b'x' * 100
+
+@pytest.mark.parametrize('fragment', [
+    Fragment(9, 10, 100, b'y' * 20),  # tràn cuối buffer
+    Fragment(10, 10, 100, b'y'),      # index >= count
+])
+def test_rejects_fragment_outside_message(fragment):
+    reassembler = Reassembler()
+    assert reassembler.add(('a', 0, 0), fragment, now=1.0) is None
+    assert reassembler.stats['rejected'] == 1
+    assert not reassembler.partials and reassembler.reserved == 0
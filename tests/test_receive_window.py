@@ -0,0 +1,75 @@
+import random
+
+from receive_window import BUFFERED, DELIVERED, DUPLICATE, OUT_OF_WINDOW, ReceiveWindow
+
+def test_in_order_delivery():
+    window = ReceiveWindow(8)
+    for seq in range(3):
+        assert window.offer(seq, f"m{seq}") == (DELIVERED, [(seq, f"m{seq}")])
+    assert window.cumulative == 2
+    assert window.sack_blocks(4) == []
+
+def test_gap_is_buffered_then_released_in_order():
+    window = ReceiveWindow(8)
+    assert window.offer(2, "c") == (BUFFERED, [])
+    assert window.offer(1, "b") == (BUFFERED, [])
+    assert window.offer(0, "a") == (DELIVERED, [(0, "a"), (1, "b"), (2, "c")])
+    assert window.buffer == {} and window.bitmap == 0
+
+def test_duplicates_and_out_of_window():
+    window = ReceiveWindow(4)
+    window.offer(0, "a")
+    window.offer(2, "c")
+    assert window.offer(0, "a") == (DUPLICATE, [])
+    assert window.offer(2, "c") == (DUPLICATE, [])
+    # Cửa sổ neo tại expected = 1: seq 1..4
+    assert window.offer(4, "e") == (BUFFERED, [])
+    assert window.offer(5, "f") == (OUT_OF_WINDOW, [])
+
+def test_sack_blocks_and_limit():
+    window = ReceiveWindow(64)
+    for seq in (2, 3, 5, 9, 10, 11, 20):
+        window.offer(seq, seq)
+    assert window.sack_blocks(16) == [(2, 3), (5, 5), (9, 11), (20, 20)]
+    assert window.sack_blocks(2) == [(2, 3), (5, 5)]
+
+def test_buffered_memoryview_is_copied():
+    window = ReceiveWindow(4)
+    data = bytearray(b'abc')
+    window.offer(1, memoryview(data))
+    data[:] = b'xyz'
+    _, delivered = window.offer(0, b'0')
+    assert delivered == [(0, b'0'), (1, b'abc')]
+
+def test_available_counts_stream_buffers():
+    window = ReceiveWindow(4)
+    window.offer(1, "b")
+    assert window.available() == 3
+    stream = window.stream(5)
+    stream.offer(2, "x")
+    # Buffer của phiên chuyển sang stream mặc định khi bắt đầu dùng stream
+    assert window.streams[0].buffer == {1: "b"}
+    assert window.available() == 2
+
+def test_mark_tracks_seqs_without_content():
+    window = ReceiveWindow(8)
+    assert window.mark(1) == BUFFERED
+    assert window.mark(1) == DUPLICATE
+    assert window.mark(0) == DELIVERED
+    assert window.expected == 2 and window.buffer == {}
+
+def test_advertised_edge_never_shrinks():
+    window = ReceiveWindow(8)
+    window.advertise(8)
+    window.advertise(2)
+    assert window.right_edge == 8
+
+def test_random_order_delivers_everything_once():
+    rng = random.Random(7)
+    seqs = list(range(200)) * 2
+    window = ReceiveWindow(256)
+    rng.shuffle(seqs)
+    delivered = []
+    for seq in seqs:
+        delivered.extend(s for s, _ in window.offer(seq, seq)[1])
+    assert delivered == list(range(200))
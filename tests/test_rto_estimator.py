@@ -0,0 +1,34 @@
+import pytest
+
+from rto_estimator import MIN_RTO, RtoEstimator
+
+def test_first_sample_sets_srtt_and_rttvar():
+    estimator = RtoEstimator()
+    assert estimator.on_sample(0.1) == pytest.approx(0.1 + 4 * 0.05)
+    assert (estimator.srtt, estimator.rttvar) == (0.1, 0.05)
+
+def test_steady_rtt_converges():
+    estimator = RtoEstimator(min_rto=0.001)
+    for _ in range(100):
+        estimator.on_sample(0.05)
+    assert estimator.srtt == pytest.approx(0.05)
+    # RTTVAR tiến về 0: RTO chỉ còn SRTT cộng độ phân giải đồng hồ
+    assert estimator.rto == pytest.approx(0.05 + estimator.granularity, abs=1e-4)
+
+def test_rto_is_clamped():
+    estimator = RtoEstimator(min_rto=0.2, max_rto=2.0)
+    assert estimator.on_sample(0.001) == 0.2
+    assert estimator.on_sample(10.0) == 2.0
+
+def test_default_floor_stays_above_loopback_queueing():
+    estimator = RtoEstimator()
+    for _ in range(20):
+        estimator.on_sample(0.001)
+    assert estimator.rto == MIN_RTO >= 0.1
+
+def test_backoff_is_applied_once_per_retry():
+    estimator = RtoEstimator(initial_rto=0.5)
+    assert [estimator.timeout_for(retries) for retries in range(4)] == [0.5, 1.0, 2.0, 4.0]
+    # Timeout không đổi RTO chung: chỉ số lần gửi lại của message quyết định backoff
+    assert estimator.rto == 0.5
+    assert estimator.timeout_for(20) == estimator.max_rto
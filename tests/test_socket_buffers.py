@@ -0,0 +1,43 @@
+import socket
+
+import pytest
+
+from socket_buffers import (MAX_BUFFER, MIN_BUFFER, KernelDropCounter, bdp_bytes, buffer_size, format_buffers,
+                            tune_buffers)
+
+def test_buffer_size_follows_bdp_within_bounds():
+    assert bdp_bytes(1_000_000_000, 0.01) == 1_250_000
+    assert buffer_size(1_000_000_000, 0.01) == 2_500_000
+    assert buffer_size(1_000_000, 0.001) == MIN_BUFFER
+    assert buffer_size(100e9, 1.0) == MAX_BUFFER
+
+def test_tune_buffers_reports_requested_and_actual():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        buffers = tune_buffers(sock, rcvbuf=MIN_BUFFER)
+    requested, actual = buffers['rcvbuf']
+    assert requested == MIN_BUFFER and actual > 0
+    assert buffers['sndbuf'][0] == 0 and buffers['sndbuf'][1] > 0
+
+def test_format_buffers_names_the_limiting_sysctl():
+    text = format_buffers({'rcvbuf': (4096 * 1024, 208 * 1024), 'sndbuf': (0, 208 * 1024)})
+    assert text == "rcvbuf 208 KB (yêu cầu 4096 KB, bị cắt bởi net.core.rmem_max), sndbuf 208 KB"
+
+def test_kernel_drop_counter_sees_overflow():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        receiver.bind(('127.0.0.1', 0))
+        counter = KernelDropCounter(receiver)
+        if not counter.available:
+            pytest.skip("cần /proc/net/udp (Linux)")
+        assert counter.read() == 0
+        for _ in range(200):
+            sender.sendto(bytes(1000), receiver.getsockname())
+        drops = counter.read()
+        assert drops > 0
+    finally:
+        sender.close()
+        receiver.close()
+    # Socket đã đóng: giữ giá trị đọc được gần nhất
+    assert counter.read() == drops
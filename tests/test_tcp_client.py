@@ -0,0 +1,45 @@
+import socket
+import threading
+
+from tcp_client import TcpClient
+from tcp_framing import FrameDecoder, encode_frame
+
+def connected_client(num_messages, timeout=0.3):
+    client = TcpClient(num_messages=num_messages, framed=True)
+    client.client_socket, peer = socket.socketpair()
+    client.client_socket.settimeout(timeout)
+    return client, peer
+
+def echo(peer, stale_ids=()):
+    """Echo every frame back, first sending a reply for each id in `stale_ids` nobody asked for"""
+    for msg_id in stale_ids:
+        peer.sendall(encode_frame(b'stale', msg_id))
+    decoder = FrameDecoder()
+    while True:
+        data = peer.recv(65536)
+        if not data:
+            return
+        for frame in decoder.feed(data):
+            peer.sendall(encode_frame(frame.payload, frame.msg_id, frame.timestamp))
+
+def test_stop_and_wait_uses_run_msg_ids_and_skips_stale_replies(capsys):
+    client, peer = connected_client(5)
+    client.next_msg_id = 100
+    # Reply to a request of an earlier run, with an id the loop index would also produce
+    thread = threading.Thread(target=echo, args=(peer, [1, 99]), daemon=True)
+    thread.start()
+    client.run_benchmark()
+    assert len(client.histogram) == 5 and client.next_msg_id == 105
+    client.disconnect()
+    thread.join(1)
+    peer.close()
+
+def test_pipelined_timeout_stops_sender_and_closes_connection(capsys):
+    client, peer = connected_client(50)
+    baseline = threading.active_count()
+    # Peer reads nothing and replies to nothing: the window fills and the reader times out
+    result = client.run_pipelined_benchmark(window=4)
+    assert result['messages'] == 0
+    assert threading.active_count() == baseline
+    assert client.client_socket is None
+    peer.close()
@@ -0,0 +1,29 @@
+import pytest
+
+from tcp_framing import HEADER_SIZE, Frame, FrameDecoder, encode_frame
+
+def test_round_trip_byte_by_byte():
+    frames = [encode_frame(b'hello', 1, timestamp=10), encode_frame(b'', 2, timestamp=20),
+              encode_frame(b'x' * 1000, 0x1_0000_0003, timestamp=30)]
+    stream = b''.join(frames)
+    decoder = FrameDecoder()
+    decoded = []
+    for i in range(len(stream)):
+        decoded += decoder.feed(stream[i:i + 1])
+    # msg id bị cắt về u32
+    assert decoded == [Frame(1, 10, b'hello'), Frame(2, 20, b''), Frame(3, 30, b'x' * 1000)]
+    assert decoder.pending() == 0
+
+def test_partial_frame_stays_buffered():
+    frame = encode_frame(b'payload', 7, timestamp=1)
+    decoder = FrameDecoder()
+    assert decoder.feed(frame + frame[:HEADER_SIZE + 2]) == [Frame(7, 1, b'payload')]
+    assert decoder.pending() == HEADER_SIZE + 2
+    assert decoder.feed(frame[HEADER_SIZE + 2:]) == [Frame(7, 1, b'payload')]
+    assert decoder.pending() == 0
+
+def test_rejects_oversized_frames():
+    with pytest.raises(ValueError):
+        FrameDecoder(max_frame_size=4).feed(encode_frame(b'12345', 1))
+    with pytest.raises(ValueError):
+        encode_frame(bytes(16 * 1024 * 1024 + 1), 1)
@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+import tcp_load
+from tcp_load import LoadGenerator
+
+async def echo(reader, writer):
+    while data := await reader.read(65536):
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+async def run_one_connection(generator, rate, duration):
+    server = await asyncio.start_server(echo, '127.0.0.1', 0)
+    generator.port = server.sockets[0].getsockname()[1]
+    stats = generator.new_stats()
+    start = time.perf_counter_ns()
+    try:
+        await asyncio.wait_for(generator.run_connection(rate, start, start + int(duration * 1e9), stats), 5)
+    finally:
+        server.close()
+        await server.wait_closed()
+    return stats
+
+def test_open_loop_receives_every_reply():
+    stats = asyncio.run(run_one_connection(LoadGenerator(host='127.0.0.1'), rate=500, duration=0.2))
+    assert stats['errors'] == 0 and stats['sent'] == stats['received'] > 0
+    assert len(stats['latency']) == stats['received']
+
+def test_open_loop_sender_failure_ends_the_connection(monkeypatch, capsys):
+    encode_frame = tcp_load.encode_frame
+
+    def failing_encode(payload, msg_id, *args):
+        if msg_id == 3:
+            raise RuntimeError("sender broke")
+        return encode_frame(payload, msg_id, *args)
+
+    monkeypatch.setattr(tcp_load, 'encode_frame', failing_encode)
+    stats = asyncio.run(run_one_connection(LoadGenerator(host='127.0.0.1'), rate=1000, duration=60))
+    assert stats['errors'] == 1 and stats['sent'] == 2
+    assert "sender broke" in capsys.readouterr().out
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from timer_wheel import TimerWheel
+
+def test_timers_fire_in_deadline_order():
+    wheel = TimerWheel(tick=0.005, slots=8)
+    fired = []
+    done = threading.Event()
+    try:
+        # 0.1 s vượt một vòng bánh xe (8 slot * 5 ms): timer phải chờ đủ số vòng
+        wheel.schedule(0.1, lambda: (fired.append('late'), done.set()))
+        wheel.schedule(0.01, fired.append, 'early')
+        assert done.wait(2.0)
+    finally:
+        wheel.stop()
+    assert fired == ['early', 'late']
+
+def test_cancelled_timer_does_not_fire():
+    wheel = TimerWheel(tick=0.005)
+    fired = []
+    try:
+        handle = wheel.schedule(0.02, fired.append, 'cancelled')
+        handle.cancel()
+        assert wheel.pending == 0
+        time.sleep(0.06)
+    finally:
+        wheel.stop()
+    assert fired == []
@@ -0,0 +1,44 @@
+from typing import NamedTuple, Optional, Tuple
+
+import pytest
+
+from udp_bundler import Bundler
+from udp_codec import FORMAT_BINARY, FORMAT_JSON, encode_bundle
+
+class Message(NamedTuple):
+    seq: int
+    content: str
+    stream_fields: Optional[Tuple[int, int]] = None
+
+def encoded_size(bundle, fmt):
+    return len(encode_bundle([(m.seq, m.content) for m in bundle], fmt,
+                             streams=[m.stream_fields for m in bundle]))
+
+@pytest.mark.parametrize('fmt', [FORMAT_BINARY, FORMAT_JSON])
+def test_bundles_fit_byte_budget(fmt):
+    bundler = Bundler(max_datagram=300, max_count=1000, max_delay=60, wire_format=fmt)
+    bundles = []
+    for seq in range(200):
+        stream = (1, seq) if seq % 3 == 0 else None
+        bundles += bundler.add(Message(seq, 'x' * (seq % 40), stream))
+    bundles.append(bundler.flush())
+    assert [m.seq for bundle in bundles for m in bundle] == list(range(200))
+    assert all(encoded_size(bundle, fmt) <= 300 for bundle in bundles)
+    assert bundler.stats['flushes']['size'] == len(bundles) - 1
+    assert 0 < bundler.fill_ratio() <= 1
+
+def test_flush_on_count_and_deadline():
+    bundler = Bundler(max_count=3, max_delay=60)
+    assert bundler.add(Message(0, 'a')) == [] and bundler.add(Message(1, 'b')) == []
+    assert [[m.seq for m in bundle] for bundle in bundler.add(Message(2, 'c'))] == [[0, 1, 2]]
+    bundler.max_delay = 0
+    assert len(bundler.add(Message(3, 'd'))) == 1
+    assert bundler.stats['flushes'] == {'size': 0, 'count': 1, 'deadline': 1, 'final': 0}
+    assert bundler.flush() == [] and bundler.time_until_due() == 0.0
+
+def test_oversized_message_goes_alone():
+    bundler = Bundler(max_datagram=100, max_delay=60)
+    bundler.add(Message(0, 'a'))
+    ready = bundler.add(Message(1, 'x' * 500))
+    assert [[m.seq for m in bundle] for bundle in ready] == [[0], [1]]
+    assert bundler.stats['oversized'] == 1 and not bundler.pending
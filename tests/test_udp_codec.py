@@ -0,0 +1,167 @@
+import json
+import struct
+
+import pytest
+
+from udp_codec import (FORMAT_BINARY, FORMAT_JSON, HEADER, TYPE_BUNDLE, TYPE_FEC_BUNDLE, TYPE_RESPONSE,
+                       TYPE_SINGLE, WIRE_VERSION, CodecError, decode_packet, decode_parity, encode_ack,
+                       encode_bundle, encode_challenge, encode_hello, encode_parity, encode_reset, encode_response,
+                       encode_single, encode_welcome, message_wire_size, parse_datagram)
+
+MESSAGES = [(0, "xin chào"), (1, ""), (7, "x" * 300)]
+
+@pytest.mark.parametrize('fmt', [FORMAT_BINARY, FORMAT_JSON])
+def test_bundle_round_trip(fmt):
+    packet, detected = decode_packet(encode_bundle(MESSAGES, fmt))
+    assert detected == fmt
+    assert packet['type'] == 'bundle'
+    assert [(m['seq'], m['content']) for m in packet['messages']] == MESSAGES
+
+@pytest.mark.parametrize('fmt', [FORMAT_BINARY, FORMAT_JSON])
+def test_parse_datagram_matches_decode(fmt):
+    streams = [(3, 10), None, (3 | 0x8000, 11)]
+    packet_type, cid, messages, parsed_streams, fragments, detected = parse_datagram(
+        encode_bundle(MESSAGES, fmt, streams=streams))
+    assert (packet_type, cid, fragments, detected) == (TYPE_BUNDLE, 0, None, fmt)
+    assert [(seq, bytes(payload).decode()) for seq, payload in messages] == MESSAGES
+    # Bundle nhị phân ghi trường stream cho mọi message: message mặc định mang (0, seq)
+    assert parsed_streams == [(3, 10), (0, 1), (3 | 0x8000, 11)]
+
+def test_bundle_with_connection_id_and_fec():
+    data = encode_bundle(MESSAGES, FORMAT_BINARY, fec=True, connection_id=0xDEADBEEF)
+    packet_type, cid, messages, _, _, _ = parse_datagram(data)
+    assert (packet_type, cid, len(messages)) == (TYPE_FEC_BUNDLE, 0xDEADBEEF, 3)
+
+def test_bundle_size_matches_wire_size():
+    data = encode_bundle(MESSAGES, FORMAT_BINARY)
+    assert len(data) == HEADER.size + sum(message_wire_size(seq, content) for seq, content in MESSAGES)
+
+def test_single_round_trip_keeps_bytes_payload():
+    payload = bytes(range(256))
+    packet, _ = decode_packet(encode_single(42, payload, fragment=(1, 3, 600)))
+    assert packet['message']['seq'] == 42
+    assert packet['message']['content'] == payload
+    assert packet['message']['frag'] == [1, 3, 600]
+
+def test_single_parse_returns_fragment_view():
+    _, _, messages, streams, fragments, _ = parse_datagram(encode_single(5, b'abc', stream=(2, 9),
+                                                                         fragment=(2, 3, 9)))
+    assert [(seq, bytes(payload)) for seq, payload in messages] == [(5, b'abc')]
+    assert streams == [(2, 9)] and fragments == [(2, 3, 9)]
+
+@pytest.mark.parametrize('cumulative', [-1, 0, 2**31 + 5, 3_000_000_000])
+def test_ack_round_trip(cumulative):
+    sack = [(cumulative + 2, cumulative + 4), (cumulative + 9, cumulative + 9)] if cumulative >= 0 else []
+    packet, _ = decode_packet(encode_ack(cumulative, sack, window=17))
+    assert packet == {'type': 'ack', 'cum': cumulative, 'wnd': 17, 'sack': sack}
+
+def test_ack_window_is_clamped():
+    packet, _ = decode_packet(encode_ack(3, window=1 << 20))
+    assert packet['wnd'] == 0xFFFF
+
+def test_handshake_round_trip():
+    hello, _ = decode_packet(encode_hello(99, 12, [(0, 12), (4, 1)]))
+    assert hello == {'type': 'hello', 'nonce': 99, 'seq': 12, 'streams': [(0, 12), (4, 1)]}
+    assert decode_packet(encode_welcome(7, 99))[0] == {'type': 'welcome', 'cid': 7, 'nonce': 99}
+    assert decode_packet(encode_reset(7))[0] == {'type': 'reset', 'cid': 7}
+
+def test_path_challenge_round_trip():
+    token = 2 ** 64 - 3
+    assert decode_packet(encode_challenge(7, token))[0] == {'type': 'challenge', 'cid': 7, 'token': token}
+    assert decode_packet(encode_response(7, token))[0] == {'type': 'response', 'cid': 7, 'token': token}
+    assert parse_datagram(encode_response(7, token))[:3] == (TYPE_RESPONSE, 7, [])
+    with pytest.raises(CodecError):
+        decode_packet(encode_response(7, token)[:-1])
+
+def test_parity_round_trip():
+    members, parity = decode_parity(encode_parity([(0, 10), (5, 12)], b'\x01' * 12, connection_id=3))
+    assert members == [(0, 10), (5, 12)]
+    assert bytes(parity) == b'\x01' * 12
+
+def test_oversized_payload_rejected():
+    with pytest.raises(CodecError):
+        encode_bundle([(0, b'x' * 0x10000)])
+
+def test_json_rejects_binary_only_features():
+    with pytest.raises(CodecError):
+        encode_bundle(MESSAGES, FORMAT_JSON, fec=True)
+    with pytest.raises(CodecError):
+        encode_single(0, "x", FORMAT_JSON, fragment=(0, 2, 4))
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\x09abc',
+    b'{not json',
+    HEADER.pack(WIRE_VERSION, TYPE_BUNDLE, 2) + struct.pack('!I', 1),
+    # Độ dài payload khai báo vượt quá phần còn lại của datagram
+    HEADER.pack(WIRE_VERSION, TYPE_BUNDLE, 1) + struct.pack('!IH', 1, 50) + b'short',
+    HEADER.pack(WIRE_VERSION, 0x1F, 0),
+])
+def test_malformed_datagrams_raise_codec_error(data):
+    with pytest.raises(CodecError):
+        decode_packet(data)
+    with pytest.raises(CodecError):
+        parse_datagram(data)
+
+@pytest.mark.parametrize('count', [0, 2])
+def test_single_must_carry_exactly_one_message(count):
+    data = (HEADER.pack(WIRE_VERSION, TYPE_SINGLE, count) + struct.pack(f'!{count}I', *range(count))
+            + (struct.pack('!H', 1) + b'a') * count)
+    with pytest.raises(CodecError):
+        decode_packet(data)
+    with pytest.raises(CodecError):
+        parse_datagram(data)
+
+def test_fragment_length_must_match_total():
+    data = encode_single(0, b'abcd', fragment=(0, 2, 100))
+    with pytest.raises(CodecError):
+        parse_datagram(data)
+
+def test_json_missing_fields():
+    with pytest.raises(CodecError):
+        parse_datagram(json.dumps({'type': 'bundle', 'messages': [{'seq': 1}]}).encode())
+
+@pytest.mark.parametrize('packet', [
+    [1, 2],
+    {'type': ['bundle'], 'messages': []},
+    {'type': 'nope'},
+    {'type': 'bundle', 'messages': {'seq': 1}},
+    {'type': 'bundle', 'messages': [{'seq': 'x', 'content': 'a'}]},
+    {'type': 'bundle', 'messages': [{'seq': 1.5, 'content': 'a'}]},
+    {'type': 'bundle', 'messages': [{'seq': True, 'content': 'a'}]},
+    {'type': 'bundle', 'messages': [{'seq': -1, 'content': 'a'}]},
+    {'type': 'bundle', 'messages': [{'seq': 2**32, 'content': 'a'}]},
+    {'type': 'bundle', 'messages': [{'seq': 1, 'content': 5}]},
+    {'type': 'bundle', 'messages': [{'seq': 1, 'content': 'a', 'stream': '3'}]},
+    {'type': 'bundle', 'messages': [{'seq': 1, 'content': 'a', 'stream': 0x10000}]},
+    {'type': 'bundle', 'messages': [{'seq': 1, 'content': 'a', 'stream': 1, 'sseq': None}]},
+    {'type': 'single', 'message': 'a'},
+    {'type': 'ack', 'cum': '3', 'sack': []},
+    {'type': 'ack', 'cum': 3, 'wnd': -1, 'sack': []},
+    {'type': 'ack', 'cum': 3, 'sack': [[5]]},
+    {'type': 'ack', 'cum': 3, 'sack': [[6, 5]]},
+    {'type': 'ack', 'cum': 3, 'sack': [['5', 6]]},
+])
+def test_wrong_typed_json_fields_raise_codec_error(packet):
+    data = json.dumps(packet).encode()
+    with pytest.raises(CodecError):
+        decode_packet(data)
+    with pytest.raises(CodecError):
+        parse_datagram(data)
+
+def test_json_lone_surrogate_content():
+    data = b'{"type": "single", "message": {"seq": 1, "content": "\\ud800"}}'
+    with pytest.raises(CodecError):
+        parse_datagram(data)
+
+def test_malformed_json_does_not_stop_server():
+    from optimized_udp_server import OptimizedUDPServer
+
+    server = OptimizedUDPServer(port=0, verbose=False)
+    try:
+        for packet in ({'type': ['x']}, {'type': 'single', 'message': {'seq': 'x', 'content': 'a'}}):
+            server.handle_datagram(json.dumps(packet).encode(), ('127.0.0.1', 9))
+        server.handle_datagram(encode_single(0, "ok", FORMAT_JSON), ('127.0.0.1', 9))
+        assert server.stats['messages_processed'] == 1
+    finally:
+        server.socket.close()